@@ -0,0 +1,129 @@
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+# Root directory under which every job gets its own workspace
+WORKSPACE_ROOT = os.environ.get("DOCGEN_WORKSPACE_ROOT", "tmp")
+
+# Place workspaces on tmpfs (/dev/shm) when available
+WORKSPACE_USE_TMPFS = _env_bool("DOCGEN_WORKSPACE_TMPFS", False)
+
+# Seconds to keep a finished workspace around for debugging (0 = delete right away)
+WORKSPACE_RETENTION_SECONDS = _env_int("DOCGEN_WORKSPACE_RETENTION", 0)
+
+# Number of jobs that are built concurrently
+WORKER_POOL_SIZE = _env_int("DOCGEN_WORKER_POOL_SIZE", os.cpu_count() or 1)
+
+# Seconds a finished job and its result are kept before they expire
+JOB_TTL_SECONDS = _env_int("DOCGEN_JOB_TTL", 3600)
+
+# Seconds between checks while a client waits for job progress
+JOB_POLL_INTERVAL = _env_float("DOCGEN_JOB_POLL_INTERVAL", 0.25)
+
+# Disk-backed cache of per-source LaTeX conversions
+CONVERSION_CACHE_ENABLED = _env_bool("DOCGEN_CONVERSION_CACHE", True)
+CONVERSION_CACHE_DIR = os.environ.get("DOCGEN_CONVERSION_CACHE_DIR", os.path.join("cache", "conversions"))
+CONVERSION_CACHE_MAX_BYTES = _env_int("DOCGEN_CONVERSION_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+CONVERSION_CACHE_MAX_ENTRIES = _env_int("DOCGEN_CONVERSION_CACHE_MAX_ENTRIES", 0)
+
+# Disk-backed cache of finished PDFs, keyed on the whole set of inputs
+RESULT_CACHE_ENABLED = _env_bool("DOCGEN_RESULT_CACHE", True)
+RESULT_CACHE_DIR = os.environ.get("DOCGEN_RESULT_CACHE_DIR", os.path.join("cache", "results"))
+RESULT_CACHE_MAX_BYTES = _env_int("DOCGEN_RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+RESULT_CACHE_MAX_ENTRIES = _env_int("DOCGEN_RESULT_CACHE_MAX_ENTRIES", 0)
+
+# Seconds before the index of installed LaTeX packages is rebuilt
+PACKAGE_INDEX_TTL = _env_int("DOCGEN_PACKAGE_INDEX_TTL", 3600)
+
+# Upper bound on XeLaTeX passes while waiting for cross-references to converge
+XELATEX_MAX_PASSES = _env_int("DOCGEN_XELATEX_MAX_PASSES", 3)
+
+# Load the fixed preamble from a precompiled XeLaTeX format (built on first use)
+PRECOMPILED_FORMAT_ENABLED = _env_bool("DOCGEN_PRECOMPILED_FORMAT", True)
+FORMAT_DIR = os.environ.get("DOCGEN_FORMAT_DIR", os.path.join("cache", "formats"))
+
+# Worker processes PowerPoint and notebook conversions are fanned out to (0 = convert inline)
+CONVERSION_POOL_SIZE = _env_int("DOCGEN_CONVERSION_POOL_SIZE", os.cpu_count() or 1)
+
+# Size limits for uploads, per file and per request, and the chunk size they are copied with
+MAX_UPLOAD_FILE_BYTES = _env_int("DOCGEN_MAX_UPLOAD_FILE_BYTES", 200 * 1024 * 1024)
+MAX_UPLOAD_REQUEST_BYTES = _env_int("DOCGEN_MAX_UPLOAD_REQUEST_BYTES", 500 * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = _env_int("DOCGEN_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+
+# Headless browsers kept per conversion process for rendering notebook HTML outputs
+BROWSER_POOL_SIZE = _env_int("DOCGEN_BROWSER_POOL_SIZE", 2)
+HTML_RENDER_WIDTH = _env_int("DOCGEN_HTML_RENDER_WIDTH", 1280)
+HTML_RENDER_HEIGHT = _env_int("DOCGEN_HTML_RENDER_HEIGHT", 720)
+HTML_RENDER_TIMEOUT = _env_int("DOCGEN_HTML_RENDER_TIMEOUT", 30)
+HTML_RENDER_CACHE_DIR = os.environ.get("DOCGEN_HTML_RENDER_CACHE_DIR", os.path.join("cache", "html"))
+HTML_RENDER_CACHE_MAX_BYTES = _env_int("DOCGEN_HTML_RENDER_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+
+# Compile every source as its own document, in parallel, and merge the PDFs (see app.services.split_compile)
+SPLIT_COMPILE_ENABLED = _env_bool("DOCGEN_SPLIT_COMPILE", False)
+COMPILE_POOL_SIZE = _env_int("DOCGEN_COMPILE_POOL_SIZE", os.cpu_count() or 1)
+FRAGMENT_CACHE_ENABLED = _env_bool("DOCGEN_FRAGMENT_CACHE", True)
+FRAGMENT_CACHE_DIR = os.environ.get("DOCGEN_FRAGMENT_CACHE_DIR", os.path.join("cache", "fragments"))
+FRAGMENT_CACHE_MAX_BYTES = _env_int("DOCGEN_FRAGMENT_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+# Jobs saving, queued or running at once before new uploads are turned away with 429 (0 = no limit)
+MAX_PENDING_JOBS = _env_int("DOCGEN_MAX_PENDING_JOBS", 4 * WORKER_POOL_SIZE)
+
+# XeLaTeX and kpsewhich processes run at once, and seconds before a run is killed
+XELATEX_CONCURRENCY = _env_int("DOCGEN_XELATEX_CONCURRENCY", os.cpu_count() or 1)
+XELATEX_TIMEOUT = _env_float("DOCGEN_XELATEX_TIMEOUT", 300)
+KPSEWHICH_CONCURRENCY = _env_int("DOCGEN_KPSEWHICH_CONCURRENCY", 4)
+KPSEWHICH_TIMEOUT = _env_float("DOCGEN_KPSEWHICH_TIMEOUT", 30)
+
+# Address space limit of every external tool process, in bytes (0 = no limit; not enforced on Windows)
+SUBPROCESS_MEMORY_LIMIT = _env_int("DOCGEN_SUBPROCESS_MEMORY_LIMIT", 2 * 1024 * 1024 * 1024)
+
+# Import the converters, index the TeX installation, build the precompiled format and start the conversion workers in the background on startup
+WARMUP_ENABLED = _env_bool("DOCGEN_WARMUP", True)
+
+# Trim, downsample and recompress the images of a document before it is compiled (see app.services.image_optimization);
+# requests can override these with the optimize_images, image_dpi and image_quality form fields
+IMAGE_OPTIMIZATION_ENABLED = _env_bool("DOCGEN_OPTIMIZE_IMAGES", False)
+IMAGE_DPI = _env_int("DOCGEN_IMAGE_DPI", 150)
+IMAGE_JPEG_QUALITY = _env_int("DOCGEN_IMAGE_JPEG_QUALITY", 85)
+IMAGE_TRIM = _env_bool("DOCGEN_IMAGE_TRIM", True)
+IMAGE_POOL_SIZE = _env_int("DOCGEN_IMAGE_POOL_SIZE", os.cpu_count() or 1)
+IMAGE_CACHE_ENABLED = _env_bool("DOCGEN_IMAGE_CACHE", True)
+IMAGE_CACHE_DIR = os.environ.get("DOCGEN_IMAGE_CACHE_DIR", os.path.join("cache", "images"))
+IMAGE_CACHE_MAX_BYTES = _env_int("DOCGEN_IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+
+# Documents a batch may describe, and documents of one batch built at the same time
+MAX_BATCH_DOCUMENTS = _env_int("DOCGEN_MAX_BATCH_DOCUMENTS", 500)
+BATCH_CONCURRENCY = _env_int("DOCGEN_BATCH_CONCURRENCY", WORKER_POOL_SIZE)
+
+# Queue and state shared with worker nodes, as a sqlite:/// or redis:// URL (empty = build jobs in this process; see app.worker)
+JOB_STORE_URL = os.environ.get("DOCGEN_JOB_STORE", "")
+BLOB_DIR = os.environ.get("DOCGEN_BLOB_DIR", os.path.join("cache", "blobs"))
+# Seconds between sweeps of the blob store for blobs no job holds, and how long those must have gone unused
+BLOB_SWEEP_INTERVAL = _env_float("DOCGEN_BLOB_SWEEP_INTERVAL", 3600)
+BLOB_SWEEP_AGE = _env_float("DOCGEN_BLOB_SWEEP_AGE", 3600)
+
+# Seconds a worker's lease on a job lasts, between its heartbeats, and claims of a job before it is given up on
+WORKER_LEASE_SECONDS = _env_float("DOCGEN_WORKER_LEASE", 60)
+WORKER_HEARTBEAT_SECONDS = _env_float("DOCGEN_WORKER_HEARTBEAT", 10)
+WORKER_POLL_INTERVAL = _env_float("DOCGEN_WORKER_POLL_INTERVAL", 0.5)
+JOB_MAX_ATTEMPTS = _env_int("DOCGEN_JOB_MAX_ATTEMPTS", 3)
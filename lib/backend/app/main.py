@@ -1,8 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import root, process
+from app import config
+from app.routers import root, process, jobs, batches, metrics
+from app.services.jobs import job_manager
+from app.services.warmup import warmup
+from app.utils.request_limits import AdmissionMiddleware, RequestSizeLimitMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Accept requests right away; the expensive first-use work happens in the background.
+    # With a job store this node only enqueues and serves, worker nodes warm up themselves
+    warmup.start(enabled=config.WARMUP_ENABLED and job_manager.store is None)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# Reject oversized uploads before they are parsed
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=config.MAX_UPLOAD_REQUEST_BYTES)
+
+# Turn uploads away with 429 while too many jobs are pending, before they are read
+app.add_middleware(AdmissionMiddleware, retry_after=job_manager.admission_retry_after, paths=["/process/", "/jobs/", "/batches/"])
 
 # Allow CORS
 app.add_middleware(
@@ -15,4 +33,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(root.router)
-app.include_router(process.router)
\ No newline at end of file
+app.include_router(process.router)
+app.include_router(jobs.router)
+app.include_router(batches.router)
+app.include_router(metrics.router)
\ No newline at end of file
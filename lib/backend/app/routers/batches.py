@@ -0,0 +1,107 @@
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.services.batches import BatchError, batch_manager, stream_archive
+from app.services.file_processing import UploadTooLargeError
+from app.services.jobs import FAILED, SUCCEEDED, job_manager
+from app.utils.response_utils import pdf_response
+
+router = APIRouter(prefix="/batches")
+
+def get_batch_or_404(batch_id: str):
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@router.post("/", status_code=202)
+async def submit_batch(
+    archive: UploadFile = File(None),
+    files: List[UploadFile] = File(None),
+    manifest: Optional[str] = Form(None),
+    optimize_images: Optional[bool] = Form(None),
+    image_dpi: Optional[int] = Form(None),
+    image_quality: Optional[int] = Form(None),
+    mode: Optional[str] = Form(None),
+    pages: Optional[int] = Form(None),
+):
+    """
+    Build many documents from a zip or tar `archive` and/or uploaded `files`, and return the batch's id right away.
+    A JSON `manifest` (or manifest.json in the archive) lists the documents and the files each one merges;
+    without one, every top-level directory of the archive and every source at its top level is a document.
+    The other fields are defaults for every document, as in POST /process/; a manifest can override them per document.
+    """
+    if archive is None and not files:
+        raise HTTPException(status_code=422, detail="Upload an archive or files")
+    defaults = {
+        "optimize_images": optimize_images,
+        "image_dpi": image_dpi,
+        "image_quality": image_quality,
+        "mode": mode,
+        "pages": pages,
+    }
+
+    try:
+        batch = await batch_manager.submit(archive, files, manifest, defaults)
+    except BatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "batch_id": batch.id,
+        "status_url": f"/batches/{batch.id}",
+        "archive_url": f"/batches/{batch.id}/archive",
+        "documents": [
+            {"name": document.name, "result_url": f"/batches/{batch.id}/documents/{document.name}"}
+            for document in batch.documents
+        ],
+    }
+
+@router.get("/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Report the state of every document of a batch, with its job id for GET /jobs/{job_id}.
+    """
+    return get_batch_or_404(batch_id).to_dict()
+
+@router.get("/{batch_id}/documents/{name}")
+async def get_batch_document(batch_id: str, name: str, request: Request):
+    """
+    Return the PDF of one document of a batch once it has been built.
+    Honors If-None-Match against the PDF's ETag.
+    """
+    document = get_batch_or_404(batch_id).document(name)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if document.state == FAILED:
+        raise HTTPException(status_code=500, detail=document.job.error if document.job else document.error)
+    if document.state != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Document is not finished yet (state: {document.state})")
+    if job_manager.get(document.job.id) is None:
+        raise HTTPException(status_code=404, detail="Document has expired")
+    return pdf_response(request, document.job.result_path, document.job.etag)
+
+@router.get("/{batch_id}/archive")
+async def get_batch_archive(batch_id: str):
+    """
+    Stream a zip of the batch's PDFs, each added as soon as it has been built,
+    followed by batch.json with the state and error of every document.
+    """
+    batch = get_batch_or_404(batch_id)
+    return StreamingResponse(
+        stream_archive(batch),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch_{batch.id}.zip"'},
+    )
+
+@router.delete("/{batch_id}", status_code=204)
+async def delete_batch(batch_id: str):
+    """
+    Discard a finished batch, its documents and its files.
+    """
+    batch = get_batch_or_404(batch_id)
+    if batch_manager.remove(batch.id) is None:
+        raise HTTPException(status_code=409, detail="Batch is still running")
@@ -0,0 +1,109 @@
+import json
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.services.draft import draft_settings
+from app.services.file_processing import UploadTooLargeError, submit_files
+from app.services.image_optimization import image_settings
+from app.services.jobs import FAILED, JobQueueFullError, SUCCEEDED, job_manager
+from app.utils.response_utils import pdf_response
+
+router = APIRouter(prefix="/jobs")
+
+def get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/", status_code=202)
+async def submit_job(
+    latex: List[UploadFile] = File(None),
+    ppt: List[UploadFile] = File(None),
+    notebook: List[UploadFile] = File(None),
+    optimize_images: Optional[bool] = Form(None),
+    image_dpi: Optional[int] = Form(None),
+    image_quality: Optional[int] = Form(None),
+    mode: Optional[str] = Form(None),
+    pages: Optional[int] = Form(None),
+):
+    """
+    Submit uploaded files for processing and return the new job's id right away.
+    Accepts the same image optimization and draft fields as POST /process/.
+    """
+    try:
+        images = image_settings(optimize_images, image_dpi, image_quality)
+        draft = draft_settings(mode, pages)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        job, _ = await submit_files(latex, ppt, notebook, images, draft)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "result_url": f"/jobs/{job.id}/result",
+    }
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, since: int = 0, wait: float = 0):
+    """
+    Report the state and per-stage progress of a job.
+    With `wait` > 0 the request long-polls until an event newer than `since` arrives.
+    """
+    job = get_job_or_404(job_id)
+    if wait > 0:
+        await job_manager.wait_for_events(job, since, wait)
+    return job.to_dict()
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream job progress as server-sent events until the job has finished.
+    """
+    job = get_job_or_404(job_id)
+
+    async def event_stream():
+        sent = 0
+        while True:
+            events = await job_manager.wait_for_events(job, sent, timeout=15)
+            for event in events:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if not events:
+                # Keep the connection alive while a long stage is running
+                yield ": keep-alive\n\n"
+            if job.finished and sent >= len(job.events):
+                break
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    """
+    Return the merged PDF of a successfully finished job.
+    Honors If-None-Match against the PDF's ETag.
+    """
+    job = get_job_or_404(job_id)
+    if job.state == FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.state != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is not finished yet (state: {job.state})")
+    return pdf_response(request, job.result_path, job.etag)
+
+@router.delete("/{job_id}", status_code=204)
+async def delete_job(job_id: str):
+    """
+    Discard a finished job and its files.
+    """
+    job = get_job_or_404(job_id)
+    if job_manager.remove(job.id) is None:
+        raise HTTPException(status_code=409, detail="Job is still running")
\ No newline at end of file
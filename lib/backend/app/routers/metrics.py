@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.utils import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def read_metrics():
+    """
+    Expose per-stage span histograms, subprocess and job counters in the Prometheus text format.
+    """
+    return Response(generate_latest(metrics.REGISTRY), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
@@ -1,21 +1,65 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from typing import List
-from app.services.file_processing import process_files
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from starlette.background import BackgroundTask
+from typing import List, Optional
+from urllib.parse import quote
+from app.services.draft import draft_settings
+from app.services.file_processing import UploadTooLargeError, submit_files
+from app.services.image_optimization import image_settings
+from app.services.jobs import FAILED, JobQueueFullError, job_manager
+from app.utils.metrics import server_timing
+from app.utils.response_utils import pdf_response
 
 router = APIRouter()
 
 @router.post("/process/")
 async def process_files_endpoint(
+    request: Request,
     latex: List[UploadFile] = File(None),
     ppt: List[UploadFile] = File(None),
     notebook: List[UploadFile] = File(None),
+    optimize_images: Optional[bool] = Form(None),
+    image_dpi: Optional[int] = Form(None),
+    image_quality: Optional[int] = Form(None),
+    mode: Optional[str] = Form(None),
+    pages: Optional[int] = Form(None),
 ):
     """
     Process uploaded files and return a merged PDF.
+    This is a synchronous wrapper around the job API: it submits a job and waits for it.
+    The PDF carries a strong ETag; repeating the request with a matching If-None-Match returns 304.
+    The time spent in each stage is reported in the Server-Timing header.
+    Sources left out because they failed to compile are listed in the X-Omitted-Sources header.
+    `optimize_images`, `image_dpi` and `image_quality` override how images are optimized for this request.
+    `mode=draft` returns a quick preview (see app.services.draft), limited to the first `pages` pages if given.
     """
     try:
-        pdf_path = await process_files(latex, ppt, notebook)
-        return FileResponse(pdf_path, media_type="application/pdf", filename="output.pdf")
+        images = image_settings(optimize_images, image_dpi, image_quality)
+        draft = draft_settings(mode, pages)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        job, done = await submit_files(latex, ppt, notebook, images, draft)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    await done
+    if job.state == FAILED:
+        job_manager.remove(job.id)
+        raise HTTPException(status_code=500, detail=job.error)
+
+    headers = {"Server-Timing": server_timing(job.spans)}
+    if job.omitted:
+        headers["X-Omitted-Sources"] = ", ".join(quote(name) for name in job.omitted)
+    # The job and its workspace are released only after the PDF has been streamed
+    return pdf_response(
+        request,
+        job.result_path,
+        job.etag,
+        background=BackgroundTask(job_manager.remove, job.id),
+        headers=headers,
+    )
\ No newline at end of file
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
+from app.services.warmup import warmup
 
 router = APIRouter()
 
@@ -12,7 +13,14 @@ async def read_root():
 
     ### Usage
     - Use the **POST /process/** endpoint to upload files and generate a PDF.
-    - Supported file types: `.tex`, `.pptx`, `.ipynb`.
+    - Use the **POST /jobs/** endpoint to submit files asynchronously, then poll **GET /jobs/{job_id}**
+      or follow **GET /jobs/{job_id}/events** and fetch the PDF from **GET /jobs/{job_id}/result**.
+    - Use the **POST /batches/** endpoint to build many documents at once from a zip or tar archive and/or files,
+      optionally with a JSON manifest (or manifest.json in the archive), then poll **GET /batches/{batch_id}**, fetch each PDF from
+      **GET /batches/{batch_id}/documents/{name}** or stream all of them as a zip from **GET /batches/{batch_id}/archive**.
+    - Supported file types: `.tex`, `.pptx`, `.ipynb`; batch archives: zip, or tar plain or compressed with gzip, bzip2 or xz.
+    - **GET /metrics** exposes stage timings and job counters in the Prometheus text format.
+    - **GET /ready** answers `200` once the service has warmed up, `503` before.
     """
     return HTMLResponse("""
     <html>
@@ -24,7 +32,26 @@ async def read_root():
             <ul>
                 <li><strong>GET /</strong>: Returns this welcome page.</li>
                 <li><strong>POST /process/</strong>: Accepts LaTeX, PowerPoint, and Jupyter Notebook files and returns a merged PDF.</li>
+                <li><strong>POST /jobs/</strong>: Accepts the same files and returns a job id without waiting for the PDF.</li>
+                <li><strong>GET /jobs/{job_id}</strong>: Reports the state and per-stage progress of a job.</li>
+                <li><strong>GET /jobs/{job_id}/events</strong>: Streams job progress as server-sent events.</li>
+                <li><strong>GET /jobs/{job_id}/result</strong>: Returns the merged PDF of a finished job.</li>
+                <li><strong>POST /batches/</strong>: Accepts a zip or tar archive and/or files, plus an optional JSON manifest listing the documents and the files each one merges, and returns a batch id. Without a manifest, every top-level directory of the archive and every source at its top level is a document.</li>
+                <li><strong>GET /batches/{batch_id}</strong>: Reports the state of every document of a batch.</li>
+                <li><strong>GET /batches/{batch_id}/documents/{name}</strong>: Returns the PDF of one document of a batch.</li>
+                <li><strong>GET /batches/{batch_id}/archive</strong>: Streams a zip of the batch's PDFs, each added as soon as it is built, followed by batch.json with the state and error of every document.</li>
+                <li><strong>DELETE /batches/{batch_id}</strong>: Discards a finished batch and its files.</li>
+                <li><strong>GET /metrics</strong>: Exposes stage timings and job counters for Prometheus.</li>
+                <li><strong>GET /ready</strong>: Reports whether the service has finished warming up.</li>
             </ul>
         </body>
     </html>
-    """)
\ No newline at end of file
+    """)
+
+@router.get("/ready")
+async def read_ready():
+    """
+    Readiness probe: 200 once the startup warmup has finished, 503 with the state of every step before.
+    """
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
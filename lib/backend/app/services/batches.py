@@ -0,0 +1,454 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from app import config
+from app.services.draft import DRAFT, FULL, DraftSettings, draft_settings
+from app.services.file_processing import UploadTooLargeError, link_inputs, save_upload, schedule_build
+from app.services.image_optimization import ImageSettings, image_settings
+from app.services.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, Job, job_manager
+from app.utils.file_utils import ensure_directory_exists, file_digest
+from app.utils.workspace import create_workspace, release_workspace
+
+# Manifest read from the archive when the request does not send one
+MANIFEST_NAME = "manifest.json"
+
+# File type of every source extension; other files of a batch are left alone
+SOURCE_TYPES = {".tex": "latex", ".pptx": "ppt", ".ipynb": "notebook"}
+
+# Options a document of a manifest can set, with the form fields' types
+DOCUMENT_OPTIONS = {"optimize_images": bool, "image_dpi": int, "image_quality": int, "mode": str, "pages": int}
+
+DOCUMENT_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]{0,127}")
+
+MAX_ARCHIVE_MEMBERS = 10000
+
+
+class BatchError(ValueError):
+    """The archive, uploads or manifest of a batch do not describe valid documents."""
+
+
+@dataclass
+class BatchDocument:
+    """One output document of a batch, and the job building it once it has been scheduled."""
+    name: str
+    sources: Dict[str, List[str]]
+    images: Optional[ImageSettings] = None
+    draft: Optional[DraftSettings] = None
+    job: Optional[Job] = None
+    error: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def state(self) -> str:
+        if self.job is not None:
+            return self.job.state
+        return FAILED if self.error else QUEUED
+
+    def to_dict(self, batch_id: str) -> dict:
+        return {
+            "name": self.name,
+            "job_id": self.job.id if self.job else None,
+            "state": self.state,
+            "stage": self.job.stage if self.job else None,
+            "error": self.job.error if self.job else self.error,
+            "result_url": f"/batches/{batch_id}/documents/{self.name}",
+        }
+
+
+@dataclass
+class Batch:
+    """Many documents built from one upload, sharing its input files."""
+    id: str
+    workspace: str
+    documents: List[BatchDocument] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def inputs(self) -> str:
+        return os.path.join(self.workspace, "inputs")
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def document(self, name: str) -> Optional[BatchDocument]:
+        return next((document for document in self.documents if document.name == name), None)
+
+    def to_dict(self) -> dict:
+        states = [document.state for document in self.documents]
+        return {
+            "batch_id": self.id,
+            "finished": self.finished,
+            "counts": {state: states.count(state) for state in (QUEUED, RUNNING, SUCCEEDED, FAILED)},
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "archive_url": f"/batches/{self.id}/archive",
+            "documents": [document.to_dict(self.id) for document in self.documents],
+        }
+
+
+def _member_path(name: str) -> Optional[str]:
+    """Relative path of an archive member or upload; None for hidden files, which are skipped."""
+    path = posixpath.normpath(name.replace("\\", "/"))
+    parts = path.split("/")
+    if path.startswith("/") or ".." in parts or re.match(r"[A-Za-z]:", path):
+        raise BatchError(f"Unsafe path in the batch: {name}")
+    if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return None
+    return path
+
+
+def _archive_members(archive_path: str):
+    """Yield the name and an open file of every regular file of a zip or tar archive."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as f:
+                        yield info.filename, f
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+                elif not member.isdir():
+                    logging.warning(f"Skipping {member.name} of a batch archive: links and devices are not extracted")
+    else:
+        raise BatchError("The archive must be a zip or tar file")
+
+
+def _copy_limited(source, destination: str, name: str, remaining: int) -> int:
+    """Copy an archive member in chunks, enforcing the upload limits on its uncompressed size."""
+    size = 0
+    with open(destination, "wb") as f:
+        while True:
+            chunk = source.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return size
+            size += len(chunk)
+            if size > config.MAX_UPLOAD_FILE_BYTES:
+                raise UploadTooLargeError(f"{name} is larger than {config.MAX_UPLOAD_FILE_BYTES} bytes")
+            if size > remaining:
+                raise UploadTooLargeError(f"The archive expands to more than {config.MAX_UPLOAD_REQUEST_BYTES} bytes")
+            f.write(chunk)
+
+
+def extract_archive(archive_path: str, destination: str) -> List[str]:
+    """
+    Extract the regular files of a zip or tar archive into `destination`. Paths
+    leaving it are rejected, links are skipped and the uncompressed contents are
+    held to the upload size limits. Returns the relative paths extracted.
+    """
+    extracted = {}
+    remaining = config.MAX_UPLOAD_REQUEST_BYTES
+    for count, (name, source) in enumerate(_archive_members(archive_path), start=1):
+        if count > MAX_ARCHIVE_MEMBERS:
+            raise BatchError(f"The archive holds more than {MAX_ARCHIVE_MEMBERS} files")
+        path = _member_path(name)
+        if path is None or path == ".":
+            continue
+        target = os.path.join(destination, *path.split("/"))
+        ensure_directory_exists(os.path.dirname(target))
+        remaining -= _copy_limited(source, target, path, remaining)
+        extracted[path] = None
+    return list(extracted)
+
+
+def _plan_document(name: str, sources: Dict[str, List[str]], options: dict) -> BatchDocument:
+    if not any(sources.values()):
+        raise BatchError(f"{name}: no LaTeX, PowerPoint or notebook files")
+    try:
+        images = image_settings(options.get("optimize_images"), options.get("image_dpi"), options.get("image_quality"))
+        draft = draft_settings(options.get("mode"), options.get("pages"))
+    except ValueError as e:
+        raise BatchError(f"{name}: {e}")
+    return BatchDocument(name=name, sources=sources, images=images, draft=draft)
+
+
+def documents_from_manifest(manifest, inputs: str, defaults: dict) -> List[BatchDocument]:
+    """
+    Documents listed by a manifest such as
+    {"documents": [{"name": "report", "latex": ["intro.tex"], "ppt": ["shared/deck.pptx"], "mode": "draft"}]}.
+    Paths are relative to the batch's files; `defaults` holds the options documents do not set.
+    """
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("documents"), list):
+        raise BatchError('The manifest must be an object with a "documents" list')
+
+    documents = []
+    for index, entry in enumerate(manifest["documents"]):
+        if not isinstance(entry, dict):
+            raise BatchError(f"Document {index} of the manifest is not an object")
+        name = entry.get("name")
+        if not isinstance(name, str) or not DOCUMENT_NAME.fullmatch(name):
+            raise BatchError(f"Document {index} of the manifest needs a name of letters, digits, '.', '_' and '-'")
+        unknown = set(entry) - {"name", "latex", "ppt", "notebook"} - set(DOCUMENT_OPTIONS)
+        if unknown:
+            raise BatchError(f"{name}: unknown fields {', '.join(sorted(unknown))}")
+
+        sources = {}
+        for file_type in ("latex", "ppt", "notebook"):
+            paths = entry.get(file_type, [])
+            paths = [paths] if isinstance(paths, str) else paths
+            if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                raise BatchError(f"{name}: {file_type} must be a list of paths")
+            sources[file_type] = []
+            for path in paths:
+                relative = _member_path(path)
+                source = os.path.join(inputs, *relative.split("/")) if relative else None
+                if source is None or not os.path.isfile(source):
+                    raise BatchError(f"{name}: {path} is not a file of the batch")
+                sources[file_type].append(source)
+
+        options = dict(defaults)
+        for option, kind in DOCUMENT_OPTIONS.items():
+            if option in entry:
+                value = entry[option]
+                if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+                    raise BatchError(f"{name}: {option} must be of type {kind.__name__}")
+                options[option] = value
+        documents.append(_plan_document(name, sources, options))
+    return documents
+
+
+def infer_documents(inputs: str, paths: List[str], defaults: dict) -> List[BatchDocument]:
+    """
+    Documents of a batch without a manifest: every top-level directory is one document
+    of the sources it holds, and every source at the top level is a document of its own,
+    named after its stem. Sources are merged in path order.
+    """
+    groups = {}
+    for path in sorted(paths):
+        file_type = SOURCE_TYPES.get(posixpath.splitext(path)[1].lower())
+        if file_type is None:
+            continue
+        top, _, rest = path.partition("/")
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", top if rest else posixpath.splitext(top)[0])[:128]
+        sources = groups.setdefault(name, {"latex": [], "ppt": [], "notebook": []})
+        sources[file_type].append(os.path.join(inputs, *path.split("/")))
+    return [_plan_document(name, sources, defaults) for name, sources in groups.items()]
+
+
+def plan_documents(inputs: str, paths: List[str], manifest: Optional[str], defaults: dict) -> List[BatchDocument]:
+    """The documents a batch builds, from its manifest or else from the layout of its files."""
+    if manifest is None and MANIFEST_NAME in paths:
+        with open(os.path.join(inputs, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = f.read()
+    if manifest is not None:
+        try:
+            manifest = json.loads(manifest)
+        except ValueError as e:
+            raise BatchError(f"The manifest is not valid JSON: {e}")
+        documents = documents_from_manifest(manifest, inputs, defaults)
+    else:
+        documents = infer_documents(inputs, paths, defaults)
+
+    if not documents:
+        raise BatchError("The batch holds no LaTeX, PowerPoint or notebook files")
+    if len(documents) > config.MAX_BATCH_DOCUMENTS:
+        raise BatchError(f"A batch can build at most {config.MAX_BATCH_DOCUMENTS} documents")
+    names = [document.name for document in documents]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise BatchError(f"Duplicate document names: {', '.join(duplicates)}")
+    return documents
+
+
+class BatchManager:
+    """
+    Builds the documents of a batch as ordinary jobs, at most `concurrency` of
+    them at a time so that one large batch leaves room for other requests, and
+    keeps track of batches until they expire. A batch is admitted as a whole;
+    its documents then bypass the job queue limit.
+    """
+
+    def __init__(self, concurrency: int = None, ttl: int = None, workspace_root: str = None):
+        self.concurrency = concurrency or config.BATCH_CONCURRENCY
+        self.ttl = config.JOB_TTL_SECONDS if ttl is None else ttl
+        self.workspace_root = workspace_root
+        self._batches: Dict[str, Batch] = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    async def submit(self, archive: Optional[UploadFile], files: List[UploadFile], manifest: Optional[str],
+                     defaults: dict) -> Batch:
+        """
+        Save and unpack the batch's uploads, plan its documents and start building them.
+        Raises BatchError when they do not describe valid documents and
+        UploadTooLargeError past the upload size limits.
+        """
+        self.purge_expired()
+        batch = Batch(id=uuid.uuid4().hex, workspace=create_workspace(self.workspace_root))
+        try:
+            ensure_directory_exists(batch.inputs)
+            paths = []
+            if archive is not None:
+                archive_path = os.path.join(batch.workspace, "archive")
+                await save_upload(archive, archive_path, config.MAX_UPLOAD_REQUEST_BYTES)
+                paths.extend(await run_in_threadpool(extract_archive, archive_path, batch.inputs))
+                os.remove(archive_path)
+            for file in files or []:
+                path = _member_path(posixpath.basename((file.filename or "").replace("\\", "/")))
+                if path in (None, ".") or path in paths:
+                    raise BatchError(f"Uploaded files need distinct, visible names: {file.filename!r}")
+                await save_upload(file, os.path.join(batch.inputs, path), config.MAX_UPLOAD_FILE_BYTES)
+                paths.append(path)
+            batch.documents = await run_in_threadpool(plan_documents, batch.inputs, paths, manifest, defaults)
+        except BaseException:
+            release_workspace(batch.workspace, retention=0)
+            raise
+
+        with self._lock:
+            self._batches[batch.id] = batch
+        # Keep a reference, the event loop only holds weak ones to its tasks
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return batch
+
+    async def _run(self, batch: Batch):
+        try:
+            sources = {path for document in batch.documents for paths in document.sources.values() for path in paths}
+            # Inputs shared by several documents are hashed once; their conversions are shared too (see app.services.conversion)
+            digests = await run_in_threadpool(lambda: {path: file_digest(path) for path in sources})
+            names = {path: os.path.relpath(path, batch.inputs).replace(os.sep, "/") for path in sources}
+            slots = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._build(document, slots, digests, names) for document in batch.documents))
+        except Exception:
+            logging.exception(f"Batch {batch.id} stopped before all of its documents were built")
+        finally:
+            # Whatever happened, every document ends up finished so that nobody waits on it forever
+            for document in batch.documents:
+                if document.job is None:
+                    document.error = document.error or "The batch stopped before this document was built"
+                elif not document.job.finished:
+                    job_manager.fail(document.job, "The batch stopped before this document was built")
+                document.done.set()
+            batch.finished_at = time.time()
+
+    async def _build(self, document: BatchDocument, slots: asyncio.Semaphore, digests: dict, names: dict):
+        try:
+            async with slots:
+                job = job_manager.create_job(admit=False)
+                job.mode = DRAFT if document.draft is not None else FULL
+                document.job = job
+                try:
+                    file_paths = await run_in_threadpool(link_inputs, document.sources, job.workspace, digests, names)
+                except Exception as e:
+                    job_manager.fail(job, str(e))
+                    return
+                file_paths["images"] = document.images
+                file_paths["draft"] = document.draft
+                await schedule_build(job, file_paths)
+        except Exception as e:
+            logging.exception(f"Could not build document {document.name} of a batch")
+            document.error = str(e)
+            if document.job is not None and not document.job.finished:
+                job_manager.fail(document.job, str(e))
+        finally:
+            document.done.set()
+
+    def get(self, batch_id: str) -> Optional[Batch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def remove(self, batch_id: str) -> Optional[Batch]:
+        """Forget a finished batch, its documents' jobs and its files."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None or not batch.finished:
+                return None
+            del self._batches[batch_id]
+        for document in batch.documents:
+            if document.job is not None:
+                job_manager.remove(document.job.id)
+        release_workspace(batch.workspace)
+        return batch
+
+    def purge_expired(self) -> int:
+        """Remove finished batches older than the TTL. Returns how many were removed."""
+        now = time.time()
+        with self._lock:
+            expired = [batch.id for batch in self._batches.values() if batch.finished and now - batch.finished_at >= self.ttl]
+        for batch_id in expired:
+            self.remove(batch_id)
+        return len(expired)
+
+
+class _ZipStream(io.RawIOBase):
+    """Unseekable sink a zip is written to while it is streamed; zipfile then writes data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> List[bytes]:
+        """The bytes written since the last call, as at most one chunk."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return [data] if data else []
+
+
+def _copy_chunk(source, entry) -> bool:
+    """Compress the next chunk of `source` into the zip entry; False once `source` is exhausted."""
+    chunk = source.read(config.UPLOAD_CHUNK_SIZE)
+    if chunk:
+        entry.write(chunk)
+    return bool(chunk)
+
+
+def _finish_archive(archive: zipfile.ZipFile, summary: str):
+    archive.writestr("batch.json", summary)
+    archive.close()
+
+
+async def _when_done(document: BatchDocument) -> BatchDocument:
+    await document.done.wait()
+    return document
+
+
+async def stream_archive(batch: Batch) -> AsyncIterator[bytes]:
+    """
+    Stream a zip of the batch's PDFs, adding each document as soon as it has been
+    built, and ending with batch.json, the state and error of every document.
+    Clients receive every PDF as it is compressed rather than once the batch is done.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    for finished in asyncio.as_completed([_when_done(document) for document in batch.documents]):
+        document = await finished
+        if document.state != SUCCEEDED or not os.path.exists(document.job.result_path):
+            continue
+        with open(document.job.result_path, "rb") as source, archive.open(f"{document.name}.pdf", "w") as entry:
+            # Reading and compressing both block; every chunk is handed to the thread pool whole
+            while await run_in_threadpool(_copy_chunk, source, entry):
+                for data in stream.drain():
+                    yield data
+        for data in stream.drain():
+            yield data
+    summary = {"batch_id": batch.id, "documents": [document.to_dict(batch.id) for document in batch.documents]}
+    await run_in_threadpool(_finish_archive, archive, json.dumps(summary, indent=2))
+    for data in stream.drain():
+        yield data
+
+
+batch_manager = BatchManager()
@@ -0,0 +1,253 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+from app import config
+from app.services import jupyter_processing, ppt_processing
+from app.utils.content_cache import ContentCache, link_or_copy
+from app.utils.file_utils import file_digest
+from app.utils.metrics import replay_spans, run_collecting_spans, span
+
+# Converter, its version and the source extension for every convertible file type
+CONVERTERS = {
+    "ppt": (ppt_processing.convert_pptx_to_latex, ppt_processing.CONVERTER_VERSION, ".pptx"),
+    "notebook": (jupyter_processing.convert_jupyter_to_latex, jupyter_processing.CONVERTER_VERSION, ".ipynb"),
+}
+
+# Converter options of every file type whose conversion differs in draft mode
+DRAFT_OPTIONS = {"notebook": {"render_html": False}}
+
+# Pipeline stage reported while sources of each file type are converted
+STAGE_BY_FILE_TYPE = {"ppt": "pptx", "notebook": "notebook"}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Conversions running for some job, by cache key; set once their outputs are cached or they failed
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+conversion_cache = ContentCache(
+    config.CONVERSION_CACHE_DIR,
+    max_bytes=config.CONVERSION_CACHE_MAX_BYTES,
+    max_entries=config.CONVERSION_CACHE_MAX_ENTRIES,
+)
+
+
+def conversion_key(file_type: str, digest: str, draft: bool = False) -> str:
+    """Cache key of a conversion: the source's content hash plus the converter version and, if it matters, the mode."""
+    _, version, _ = CONVERTERS[file_type]
+    if draft and file_type in DRAFT_OPTIONS:
+        return f"{file_type}-v{version}-draft-{digest}"
+    return f"{file_type}-v{version}-{digest}"
+
+
+class ConversionError(RuntimeError):
+    """One or more sources of a job could not be converted; `errors` maps file names to messages."""
+
+    def __init__(self, errors: dict):
+        self.errors = errors
+        super().__init__("Conversion failed for " + "; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+
+def conversion_pool():
+    """
+    Return the process pool conversions run on, creating it on first use.
+    Returns None when DOCGEN_CONVERSION_POOL_SIZE is 0, i.e. conversions run inline.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and config.CONVERSION_POOL_SIZE > 0:
+            # Forking a process that runs worker threads is unsafe, so workers are spawned
+            _pool = ProcessPoolExecutor(
+                max_workers=config.CONVERSION_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard_pool():
+    """Drop a pool whose worker died, so the next conversion starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _convert(file_type: str, source_path: str, output_dir: str, draft: bool = False) -> str:
+    converter, _, _ = CONVERTERS[file_type]
+    options = DRAFT_OPTIONS.get(file_type, {}) if draft else {}
+    with span(f"convert_{file_type}"):
+        return converter(source_path, output_dir, **options)
+
+
+def _start_conversion(file_type: str, source_path: str, workspace: str, digest: str, draft: bool = False) -> dict:
+    """
+    Start converting one source. Cached conversions are placed into the workspace right away;
+    otherwise the converter is submitted to the pool, working in a private staging directory.
+    A source another job is already converting is not converted again: the pending conversion
+    follows that one and takes its outputs from the cache once it is done.
+    """
+    _, _, ext = CONVERTERS[file_type]
+    stem = f"{file_type}_{digest[:16]}"
+    pending = {
+        "file_type": file_type,
+        "source_path": source_path,
+        "digest": digest,
+        "draft": draft,
+        "tex_path": os.path.join(workspace, f"{stem}.tex"),
+        "key": conversion_key(file_type, digest, draft),
+        "future": None,
+        "leader": None,
+        "flight": None,
+    }
+
+    if config.CONVERSION_CACHE_ENABLED:
+        if conversion_cache.get(pending["key"], workspace) is not None:
+            logging.info(f"Reusing cached conversion of {source_path}")
+            return pending
+        with _in_flight_lock:
+            pending["leader"] = _in_flight.get(pending["key"])
+            if pending["leader"] is None:
+                pending["flight"] = _in_flight[pending["key"]] = threading.Event()
+        if pending["leader"] is not None:
+            return pending
+
+    try:
+        # Convert in a private staging directory so its outputs can be told apart
+        staging = tempfile.mkdtemp(prefix=".convert_", dir=workspace)
+        staged_source = os.path.join(staging, f"{stem}{ext}")
+        link_or_copy(source_path, staged_source)
+        pending["staging"] = staging
+        pending["staged_source"] = staged_source
+
+        pool = conversion_pool()
+        pending["in_pool"] = pool is not None
+        if pool is None:
+            pending["future"] = Future()
+            try:
+                pending["future"].set_result(_convert(file_type, staged_source, staging, draft))
+            except Exception as e:
+                pending["future"].set_exception(e)
+        else:
+            # Spans recorded in the worker process are handed back with the result
+            pending["future"] = pool.submit(run_collecting_spans, _convert, file_type, staged_source, staging, draft)
+    except BaseException:
+        _abandon_conversion(pending)
+        raise
+    return pending
+
+
+def _abandon_conversion(pending: dict):
+    """Let conversions following this one go ahead on their own; its outputs will not be cached."""
+    if pending["flight"] is not None:
+        with _in_flight_lock:
+            _in_flight.pop(pending["key"], None)
+        pending["flight"].set()
+        pending["flight"] = None
+
+
+def _finish_conversion(pending: dict, workspace: str):
+    """Wait for a started conversion, cache its outputs and move them into the workspace."""
+    while pending["leader"] is not None:
+        with span("wait_conversion"):
+            pending["leader"].wait()
+        if conversion_cache.get(pending["key"], workspace) is not None:
+            logging.info(f"Reusing conversion of {pending['source_path']} shared with another job")
+            return
+        # The other conversion failed, or its outputs were evicted already
+        pending.update(_start_conversion(
+            pending["file_type"], pending["source_path"], workspace, pending["digest"], pending["draft"]
+        ))
+
+    if pending["future"] is None:
+        return
+    staging = pending["staging"]
+    try:
+        result = pending["future"].result()
+        if pending["in_pool"]:
+            replay_spans(result[1])
+        outputs = [
+            os.path.join(staging, name) for name in os.listdir(staging)
+            if name != os.path.basename(pending["staged_source"]) and not name.endswith(".log")
+            and os.path.isfile(os.path.join(staging, name))
+        ]
+        if config.CONVERSION_CACHE_ENABLED:
+            conversion_cache.put(pending["key"], outputs)
+        for path in outputs:
+            os.replace(path, os.path.join(workspace, os.path.basename(path)))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        _abandon_conversion(pending)
+
+
+def convert_sources(sources: List[Tuple[str, str, Optional[str]]], workspace: str, progress: Callable[[str], None] = None,
+                    draft: bool = False) -> List[str]:
+    """
+    Convert PowerPoint and notebook files to LaTeX fragments inside `workspace`,
+    fanning the conversions out to the process pool and reusing cached
+    conversions of identical content.
+
+    `sources` holds (file type, path, content digest or None) tuples. The .tex
+    paths are returned in the same order, so the merged document stays
+    deterministic. Outputs are named after the source's content hash rather
+    than its upload position, so a cached fragment and its images can be
+    dropped into any job. `progress` is called with each file type's stage
+    ("pptx", "notebook") when its results are first awaited. With `draft`,
+    converters skip work a preview does without (see DRAFT_OPTIONS).
+    Raises ConversionError listing every source that failed.
+    """
+    pending_by_key = {}
+    ordered = []
+    try:
+        for file_type, source_path, digest in sources:
+            digest = digest or file_digest(source_path)
+            key = conversion_key(file_type, digest, draft)
+            # Identical uploads within a job are converted once
+            if key not in pending_by_key:
+                pending_by_key[key] = _start_conversion(file_type, source_path, workspace, digest, draft)
+            ordered.append((file_type, pending_by_key[key]))
+    except BaseException:
+        for pending in pending_by_key.values():
+            _abandon_conversion(pending)
+        raise
+
+    errors = {}
+    reported_stages = set()
+    finished = set()
+    # Conversions shared with other jobs are awaited last: a job finishes its own conversions
+    # before it waits for anyone else's, so two jobs never wait for each other
+    for file_type, pending in sorted(ordered, key=lambda item: item[1]["leader"] is not None):
+        stage = STAGE_BY_FILE_TYPE[file_type]
+        if progress and stage not in reported_stages:
+            reported_stages.add(stage)
+            progress(stage)
+        if pending["key"] in finished:
+            continue
+        finished.add(pending["key"])
+        try:
+            _finish_conversion(pending, workspace)
+        except BrokenProcessPool as e:
+            _discard_pool()
+            errors[os.path.basename(pending["source_path"])] = f"conversion worker crashed: {e}"
+        except Exception as e:
+            logging.error(f"Failed to convert {pending['source_path']}: {e}")
+            errors[os.path.basename(pending["source_path"])] = str(e)
+
+    if errors:
+        raise ConversionError(errors)
+    return [pending["tex_path"] for _, pending in ordered]
+
+
+def convert_source(file_type: str, source_path: str, workspace: str, digest: str = None) -> str:
+    """
+    Convert a single PowerPoint or notebook file; see `convert_sources`.
+    Returns the path of the generated .tex file.
+    """
+    return convert_sources([(file_type, source_path, digest)], workspace)[0]
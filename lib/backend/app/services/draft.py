@@ -0,0 +1,49 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# Build modes a request can ask for
+FULL = "full"
+DRAFT = "draft"
+
+
+@dataclass(frozen=True)
+class DraftSettings:
+    """
+    A quick preview instead of the final document: HTML outputs are not rendered,
+    images are drawn as labelled boxes, XeLaTeX runs once (cross-references may
+    show as ??) and only the first `pages` pages are returned (0 = all).
+    """
+    pages: int = 0
+
+
+def draft_settings(mode: Optional[str] = None, pages: Optional[int] = None) -> Optional[DraftSettings]:
+    """
+    Settings of a request from its optional form fields. Returns None for a full build;
+    raises ValueError on bad values.
+    """
+    mode = (mode or FULL).strip().lower()
+    if mode not in (FULL, DRAFT):
+        raise ValueError(f"mode must be {FULL!r} or {DRAFT!r}")
+    if mode == FULL:
+        if pages is not None:
+            raise ValueError("pages is only supported with mode=draft")
+        return None
+    if pages is not None and pages < 1:
+        raise ValueError("pages must be at least 1")
+    return DraftSettings(pages=pages or 0)
+
+
+def truncate_pdf(pdf_path: str, pages: int):
+    """Keep only the first `pages` pages of a PDF, replacing the file."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_path)
+    if len(reader.pages) <= pages:
+        return
+    writer = PdfWriter()
+    for page in reader.pages[:pages]:
+        writer.add_page(page)
+    with open(pdf_path + ".tmp", "wb") as f:
+        writer.write(f)
+    os.replace(pdf_path + ".tmp", pdf_path)
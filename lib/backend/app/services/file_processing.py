@@ -1,60 +1,224 @@
-import shutil
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List
+from typing import Callable, List, Optional, Tuple
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from app import config
 from app.services.latex_processing import merge_latex_files, compile_latex_to_pdf
-from app.services.ppt_processing import convert_pptx_to_latex
-from app.services.jupyter_processing import convert_jupyter_to_latex
+from app.services.conversion import convert_sources
+from app.services.draft import DRAFT, FULL, DraftSettings, truncate_pdf
+from app.services.image_optimization import ImageSettings, optimize_images
+from app.services.latex_format import prepare_format
+from app.services.split_compile import compile_split
+from app.services.result_cache import RESULT_FILENAME, result_cache, result_key
+from app.services.job_store import store_inputs
+from app.services.jobs import job_manager
+from app.utils.content_cache import link_or_copy
+from app.utils.file_utils import file_digest
+from app.utils.metrics import span
 
-TEMP_DIR = "tmp"
+# Extension every file type is saved with in a job's workspace
+EXTENSIONS = {"latex": ".tex", "ppt": ".pptx", "notebook": ".ipynb"}
 
-async def process_files(latex: List[UploadFile], ppt: List[UploadFile], notebook: List[UploadFile]):
-    """z
-    Process uploaded files and generate a merged PDF.
+class UploadTooLargeError(ValueError):
+    """An uploaded file or the whole upload exceeds the configured size limits."""
+
+async def save_upload(file: UploadFile, file_path: str, max_bytes: int) -> tuple:
+    """
+    Stream one upload to disk in fixed-size chunks, hashing it on the way in.
+    Raises UploadTooLargeError as soon as more than `max_bytes` have been read.
+    Returns the number of bytes written and their SHA-256 hex digest.
     """
-    # Clear and recreate the temp directory
-    shutil.rmtree(TEMP_DIR, ignore_errors=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as f:
+        while True:
+            chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+    return size, digest.hexdigest()
 
+async def save_uploads(latex: List[UploadFile], ppt: List[UploadFile], notebook: List[UploadFile], workspace: str) -> dict:
+    """
+    Save uploaded files into the job's workspace without holding them in memory.
+    Files are checked against the per-file and per-request size limits while they are copied.
+    Returns the saved paths grouped by file type, plus the SHA-256 of every saved file under "digests"
+    and its original file name under "names".
+    """
     file_paths = {
         "latex": [],
         "ppt": [],
-        "notebook": []
+        "notebook": [],
+        "digests": {},
+        "names": {}
     }
 
-    # Save uploaded files
+    remaining = config.MAX_UPLOAD_REQUEST_BYTES
     for file_type, files in [("latex", latex), ("ppt", ppt), ("notebook", notebook)]:
         if files:
             for i, file in enumerate(files):
-                ext = {
-                    "latex": ".tex",
-                    "ppt": ".pptx",
-                    "notebook": ".ipynb"
-                }[file_type]
-                
-                file_path = os.path.join(TEMP_DIR, f"{file_type}_{i}{ext}")
-                with open(file_path, "wb") as f:
-                    f.write(await file.read())
+                file_path = os.path.join(workspace, f"{file_type}_{i}{EXTENSIONS[file_type]}")
+                try:
+                    size, digest = await save_upload(file, file_path, min(config.MAX_UPLOAD_FILE_BYTES, remaining))
+                except UploadTooLargeError:
+                    if remaining < config.MAX_UPLOAD_FILE_BYTES:
+                        raise UploadTooLargeError(f"Upload is larger than {config.MAX_UPLOAD_REQUEST_BYTES} bytes")
+                    raise
+                remaining -= size
                 file_paths[file_type].append(file_path)
+                file_paths["digests"][file_path] = digest
+                file_paths["names"][file_path] = file.filename or os.path.basename(file_path)
+
+    return file_paths
 
-    # Process PowerPoint files
-    for ppt_path in file_paths["ppt"]:
-        convert_pptx_to_latex(ppt_path, TEMP_DIR)
+def link_inputs(sources: dict, workspace: str, digests: dict = None, names: dict = None) -> dict:
+    """
+    Place files that are already on disk into a job's workspace, hardlinked where possible,
+    the way save_uploads places uploads. `sources` maps file types to lists of paths;
+    `digests` and `names` may hold the known SHA-256 and display name of each path.
+    Returns the same structure as save_uploads.
+    """
+    digests = digests or {}
+    names = names or {}
+    file_paths = {"latex": [], "ppt": [], "notebook": [], "digests": {}, "names": {}}
+    for file_type in ("latex", "ppt", "notebook"):
+        for i, source in enumerate(sources.get(file_type, [])):
+            file_path = os.path.join(workspace, f"{file_type}_{i}{EXTENSIONS[file_type]}")
+            link_or_copy(source, file_path)
+            file_paths[file_type].append(file_path)
+            file_paths["digests"][file_path] = digests.get(source) or file_digest(file_path)
+            file_paths["names"][file_path] = names.get(source, os.path.basename(source))
+    return file_paths
+
+def build_pdf(file_paths: dict, workspace: str, omitted: List[str] = None, progress: Callable[[str], None] = None) -> str:
+    """
+    Convert, merge and compile previously saved files into a single PDF.
+    This is blocking work and is meant to run on a worker thread.
+    `omitted` collects the names of sources left out of the PDF because they failed to compile;
+    a PDF missing any of them is not cached.
+    `progress` is called with the name of each pipeline stage as it starts.
+    """
+    progress = progress or (lambda stage: None)
+    draft = file_paths.get("draft")
 
-    # Process Jupyter Notebook files
-    for notebook_path in file_paths["notebook"]:
-        convert_jupyter_to_latex(notebook_path, TEMP_DIR)
+    # Convert PowerPoint and Jupyter Notebook files in parallel
+    sources = [
+        (file_type, path, file_paths["digests"].get(path))
+        for file_type in ("ppt", "notebook")
+        for path in file_paths[file_type]
+    ]
+    converted_files = convert_sources(sources, workspace, progress=progress, draft=draft is not None)
 
     # Collect all LaTeX files
     latex_files = []
     latex_files.extend(file_paths["latex"])
-    latex_files.extend([os.path.join(TEMP_DIR, f"ppt_{i}.tex") for i in range(len(file_paths["ppt"]))])
-    latex_files.extend([os.path.join(TEMP_DIR, f"notebook_{i}.tex") for i in range(len(file_paths["notebook"]))])
+    latex_files.extend(converted_files)
+
+    # Shrink the images before XeLaTeX embeds them, if the request asked for it; drafts only draw their outlines
+    image_settings = file_paths.get("images")
+    if image_settings is not None and draft is None:
+        progress("optimize_images")
+        with span("optimize_images"):
+            optimize_images(latex_files, workspace, image_settings)
 
     # Merge and compile LaTeX files
-    merged_tex_path = os.path.join(TEMP_DIR, "merged.tex")
-    merge_latex_files(latex_files, merged_tex_path)
-    compile_latex_to_pdf(merged_tex_path, TEMP_DIR)
+    progress("merge")
+    pdf_path = os.path.join(workspace, RESULT_FILENAME)
+    if config.SPLIT_COMPILE_ENABLED:
+        # Compile every source on its own and merge the PDFs, bookmarked by file name
+        names = file_paths.get("names", {})
+        titles = [
+            names.get(path, os.path.basename(path))
+            for path in file_paths["latex"] + [path for _, path, _ in sources]
+        ]
+        failed = compile_split(latex_files, titles, workspace, pdf_path, progress=progress, draft=draft is not None)
+        if omitted is not None:
+            omitted.extend(failed)
+    else:
+        merged_tex_path = os.path.join(workspace, os.path.splitext(RESULT_FILENAME)[0] + ".tex")
+        with span("merge"):
+            merge_latex_files(latex_files, merged_tex_path, draft=draft is not None)
+        format_name = prepare_format(merged_tex_path, workspace)
+        with span("compile"):
+            success, message = compile_latex_to_pdf(
+                merged_tex_path, workspace, progress=progress, max_passes=1 if draft else None, format_name=format_name
+            )
+        logging.info(message)
+        if not os.path.exists(pdf_path):
+            raise RuntimeError(message)
+        failed = []
 
     # Return the path to the generated PDF
-    return os.path.join(TEMP_DIR, "merged.pdf")
\ No newline at end of file
+    if draft is not None and draft.pages:
+        truncate_pdf(pdf_path, draft.pages)
+    # A part that failed, e.g. on a timeout, may compile next time
+    if config.RESULT_CACHE_ENABLED and not failed:
+        result_cache.put(result_key(file_paths), [pdf_path])
+    return pdf_path
+
+async def submit_files(latex: List[UploadFile], ppt: List[UploadFile], notebook: List[UploadFile],
+                       images: ImageSettings = None, draft: DraftSettings = None) -> tuple:
+    """
+    Save uploaded files into a new job's workspace and schedule the build on the worker pool.
+    `images` holds the request's image optimization settings, None to leave images as they are;
+    `draft` asks for a quick preview instead of the final document.
+    Returns the job and an awaitable that resolves once the job has finished.
+    """
+    job = job_manager.create_job()
+    job.mode = DRAFT if draft is not None else FULL
+    try:
+        with span("save_uploads", job.spans):
+            file_paths = await save_uploads(latex, ppt, notebook, job.workspace)
+        file_paths["images"] = images
+        file_paths["draft"] = draft
+    except Exception as e:
+        job_manager.fail(job, str(e))
+        job_manager.remove(job.id)
+        raise
+
+    return job, schedule_build(job, file_paths)
+
+def cached_result(file_paths: dict, workspace: str) -> Optional[Tuple[str, str]]:
+    """
+    Place the PDF built before from identical inputs into `workspace`.
+    Returns its path and SHA-256, or None on a miss. This is blocking work.
+    """
+    if not result_cache.get(result_key(file_paths), workspace):
+        return None
+    pdf_path = os.path.join(workspace, RESULT_FILENAME)
+    return pdf_path, file_digest(pdf_path)
+
+def schedule_build(job, file_paths: dict) -> asyncio.Task:
+    """
+    Build the files saved into a job's workspace on the worker pool, or serve
+    identical inputs built before straight from the result cache. With a job
+    store, the build is queued there for a worker node instead (see app.worker),
+    unless a worker has built identical inputs before.
+    Returns an awaitable that resolves once the job has finished.
+    """
+    return job_manager.start(_build(job, file_paths))
+
+async def _build(job, file_paths: dict):
+    if config.RESULT_CACHE_ENABLED:
+        # The cache key, linking the PDF in and hashing it all block; keep them off the event loop
+        try:
+            cached = await run_in_threadpool(cached_result, file_paths, job.workspace)
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            job_manager.fail(job, str(e))
+            return job
+        if cached is not None:
+            return await job_manager.complete(job, *cached)
+    if job_manager.store is not None:
+        return await job_manager.enqueue(job, store_inputs, file_paths)
+    return await job_manager.submit(job, build_pdf, file_paths, job.workspace, job.omitted)
@@ -0,0 +1,241 @@
+import atexit
+import base64
+import hashlib
+import json
+import math
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from app import config
+from app.utils.content_cache import ContentCache
+
+# Wraps rendered HTML so its size can be measured; inline-block shrinks to the content
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<style>html, body {{ margin: 0; background: #fff; }} #docgen-root {{ display: inline-block; padding: 8px; }}</style>
+</head><body><div id="docgen-root">{html}</div></body></html>"""
+
+MEASURE_SCRIPT = """(() => {
+    const r = document.getElementById('docgen-root').getBoundingClientRect();
+    return [Math.ceil(r.right), Math.ceil(r.bottom)];
+})()"""
+
+render_cache = ContentCache(
+    config.HTML_RENDER_CACHE_DIR,
+    max_bytes=config.HTML_RENDER_CACHE_MAX_BYTES,
+)
+
+
+def find_chrome() -> Optional[str]:
+    return shutil.which("chrome") or shutil.which("google-chrome") or shutil.which("chromium")
+
+
+class HeadlessBrowser:
+    """
+    One long-lived headless Chrome process, driven over the DevTools protocol.
+    Every render reuses the same page instead of launching a new browser.
+    """
+
+    def __init__(self, chrome_path: str, startup_timeout: float = 20):
+        import websocket  # Only needed once HTML is rendered
+
+        self.user_data_dir = tempfile.mkdtemp(prefix="docgen-chrome-")
+        args = [
+            chrome_path,
+            "--headless",
+            "--disable-gpu",
+            "--hide-scrollbars",
+            "--no-first-run",
+            "--remote-debugging-port=0",
+            f"--user-data-dir={self.user_data_dir}",
+            "about:blank",
+        ]
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            args.insert(1, "--no-sandbox")  # Chrome refuses to run as root with the sandbox
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._next_id = 0
+        try:
+            port = self._wait_for_port(startup_timeout)
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/list", timeout=startup_timeout) as response:
+                targets = json.load(response)
+            page = next(target for target in targets if target.get("type") == "page")
+            self.ws = websocket.create_connection(page["webSocketDebuggerUrl"], timeout=config.HTML_RENDER_TIMEOUT)
+        except Exception:
+            self.close()
+            raise
+
+    def _wait_for_port(self, timeout: float) -> int:
+        """Chrome writes the port it picked to DevToolsActivePort once it is ready."""
+        port_file = os.path.join(self.user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Chrome exited with code {self.process.returncode}")
+            try:
+                with open(port_file, "r", encoding="utf-8") as f:
+                    port = f.readline().strip()
+                if port:
+                    return int(port)
+            except OSError:
+                pass
+            time.sleep(0.05)
+        raise TimeoutError("Chrome did not open its DevTools port in time")
+
+    def call(self, method: str, **params) -> dict:
+        """Send a DevTools command and return its result, skipping unrelated events."""
+        self._next_id += 1
+        message_id = self._next_id
+        self.ws.send(json.dumps({"id": message_id, "method": method, "params": params}))
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get("id") != message_id:
+                continue
+            if "error" in message:
+                raise RuntimeError(f"{method} failed: {message['error'].get('message')}")
+            return message.get("result", {})
+
+    def render(self, html: str, viewport: Tuple[int, int]) -> bytes:
+        """Render an HTML fragment and return a PNG clipped to the fragment's bounds."""
+        width, height = viewport
+        self.call("Emulation.setDeviceMetricsOverride", width=width, height=height, deviceScaleFactor=1, mobile=False)
+        frame_id = self.call("Page.getFrameTree")["frameTree"]["frame"]["id"]
+        self.call("Page.setDocumentContent", frameId=frame_id, html=PAGE_TEMPLATE.format(html=html))
+        content_width, content_height = self.call(
+            "Runtime.evaluate", expression=MEASURE_SCRIPT, returnByValue=True
+        )["result"]["value"]
+        clip = {
+            "x": 0,
+            "y": 0,
+            "width": max(1, min(content_width, width)),
+            "height": max(1, math.ceil(content_height)),
+            "scale": 1,
+        }
+        result = self.call("Page.captureScreenshot", format="png", clip=clip, captureBeyondViewport=True)
+        return base64.b64decode(result["data"])
+
+    def close(self):
+        ws = getattr(self, "ws", None)
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    Bounded pool of headless browsers shared by all conversions of a process.
+    Browsers are launched lazily, reused across notebooks and jobs, and replaced
+    when a render fails.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._launched = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> HeadlessBrowser:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                launch = self._launched < self.size
+                if launch:
+                    self._launched += 1
+            if launch:
+                break
+            # Wait for a browser to be released, or for a broken one to free its slot
+            try:
+                return self._idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        chrome_path = find_chrome()
+        try:
+            if chrome_path is None:
+                raise RuntimeError("Chrome is either not installed or not available in the system PATH.")
+            return HeadlessBrowser(chrome_path)
+        except Exception:
+            with self._lock:
+                self._launched -= 1
+            raise
+
+    def _discard(self, browser: HeadlessBrowser):
+        browser.close()
+        with self._lock:
+            self._launched -= 1
+
+    def render(self, html: str, viewport: Tuple[int, int]) -> bytes:
+        browser = self._acquire()
+        try:
+            png = browser.render(html, viewport)
+        except Exception:
+            self._discard(browser)
+            raise
+        self._idle.put(browser)
+        return png
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+browser_pool = BrowserPool(config.BROWSER_POOL_SIZE)
+atexit.register(browser_pool.close)
+
+
+def render_key(html: str, viewport: Tuple[int, int]) -> str:
+    return hashlib.sha256(f"{viewport[0]}x{viewport[1]}\0{html}".encode("utf-8")).hexdigest()
+
+
+def render_html_to_png(html: str, image_path: str, viewport: Tuple[int, int] = None):
+    """
+    Render an HTML fragment to a PNG at `image_path`, reusing an earlier render
+    of the same HTML at the same viewport when there is one.
+    """
+    viewport = viewport or (config.HTML_RENDER_WIDTH, config.HTML_RENDER_HEIGHT)
+    key = render_key(html, viewport)
+    if render_cache.get_file(key, image_path):
+        return
+    png = browser_pool.render(html, viewport)
+    with open(image_path, "wb") as f:
+        f.write(png)
+    render_cache.put(key, [image_path])
+
+
+def render_html_batch(renders: List[Tuple[str, str]], viewport: Tuple[int, int] = None) -> List[Optional[Exception]]:
+    """
+    Render several (html, image_path) pairs concurrently on the browser pool.
+    Returns, in order, None for every successful render or the exception it raised.
+    """
+    def render_one(item):
+        html, image_path = item
+        try:
+            render_html_to_png(html, image_path, viewport)
+            return None
+        except Exception as e:
+            return e
+
+    if len(renders) <= 1:
+        return [render_one(item) for item in renders]
+    with ThreadPoolExecutor(max_workers=min(browser_pool.size, len(renders))) as executor:
+        return list(executor.map(render_one, renders))
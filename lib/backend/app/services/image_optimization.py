@@ -0,0 +1,266 @@
+import contextvars
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+from app import config
+from app.services.latex_processing import ESSENTIAL_PREAMBLE, IMAGE_REFERENCE_PATTERN
+from app.utils.content_cache import ContentCache
+from app.utils.file_utils import file_digest
+
+# Bump whenever optimized images change for the same settings, so cached ones are not reused
+OPTIMIZER_VERSION = "1"
+
+# Extensions of the raster images that are optimized
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Paper sizes in inches and length units in inches, as understood by \geometry
+PAPER_SIZES = {"a4paper": (8.27, 11.69), "a5paper": (5.83, 8.27), "letterpaper": (8.5, 11.0), "legalpaper": (8.5, 14.0)}
+LENGTH_UNITS = {"in": 1.0, "cm": 1 / 2.54, "mm": 1 / 25.4, "pt": 1 / 72.27, "bp": 1 / 72.0}
+
+# Images whose 128x128 thumbnail has more colors than this are treated as photos and stored as JPEG
+PHOTO_MIN_COLORS = 2048
+
+# Channel difference from the corner color below which a border pixel counts as background
+TRIM_THRESHOLD = 8
+TRIM_PADDING = 4
+
+# Resolution images are assumed to have when they do not say, as XeLaTeX does
+DEFAULT_DPI = 72
+
+image_cache = ContentCache(
+    config.IMAGE_CACHE_DIR,
+    max_bytes=config.IMAGE_CACHE_MAX_BYTES,
+)
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    """How the images of one request are optimized."""
+    dpi: int = config.IMAGE_DPI
+    jpeg_quality: int = config.IMAGE_JPEG_QUALITY
+    trim: bool = config.IMAGE_TRIM
+
+
+def image_settings(optimize: Optional[bool] = None, dpi: Optional[int] = None,
+                   quality: Optional[int] = None) -> Optional[ImageSettings]:
+    """
+    Settings of a request from its optional form fields, falling back to the configured
+    defaults. Returns None when images are not optimized; raises ValueError on bad values.
+    """
+    if optimize is None:
+        optimize = config.IMAGE_OPTIMIZATION_ENABLED
+    if not optimize:
+        return None
+    settings = ImageSettings(
+        dpi=config.IMAGE_DPI if dpi is None else dpi,
+        jpeg_quality=config.IMAGE_JPEG_QUALITY if quality is None else quality,
+    )
+    if not 36 <= settings.dpi <= 1200:
+        raise ValueError("image_dpi must be between 36 and 1200")
+    if not 1 <= settings.jpeg_quality <= 95:
+        raise ValueError("image_quality must be between 1 and 95")
+    return settings
+
+
+def _length(value: str) -> float:
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([a-z]+)\s*", value)
+    if match is None or match.group(2) not in LENGTH_UNITS:
+        raise ValueError(f"unsupported length {value!r}")
+    return float(match.group(1)) * LENGTH_UNITS[match.group(2)]
+
+
+def text_area() -> Tuple[float, float]:
+    """Width and height in inches of the text area set by \\geometry in the fixed preamble."""
+    options = {}
+    for line in ESSENTIAL_PREAMBLE:
+        match = re.fullmatch(r"\\geometry\{(.*)\}", line)
+        if match:
+            for option in match.group(1).split(","):
+                name, _, value = option.partition("=")
+                options[name.strip()] = value.strip()
+    width, height = next((PAPER_SIZES[name] for name in options if name in PAPER_SIZES), PAPER_SIZES["letterpaper"])
+    margin = options.get("margin", "1in")
+    left, right, top, bottom = (
+        _length(options.get(side, margin)) for side in ("left", "right", "top", "bottom")
+    )
+    return width - left - right, height - top - bottom
+
+
+def image_key(digest: str, settings: ImageSettings) -> str:
+    """Cache key of an optimized image: the original's content hash plus the settings and page size."""
+    material = f"{OPTIMIZER_VERSION}\0{sorted(asdict(settings).items())}\0{text_area()}\0{digest}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _trim(image):
+    """Crop borders of the corner's color (or fully transparent ones), keeping a small padding."""
+    from PIL import Image, ImageChops
+
+    if image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema()[0] < 255:
+        bbox = image.getchannel("A").getbbox()
+    else:
+        rgb = image.convert("RGB")
+        difference = ImageChops.difference(rgb, Image.new("RGB", rgb.size, rgb.getpixel((0, 0))))
+        bbox = difference.convert("L").point(lambda value: 255 if value > TRIM_THRESHOLD else 0).getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    bbox = (
+        max(0, left - TRIM_PADDING), max(0, top - TRIM_PADDING),
+        min(image.width, right + TRIM_PADDING), min(image.height, bottom + TRIM_PADDING),
+    )
+    return image if bbox == (0, 0, image.width, image.height) else image.crop(bbox)
+
+
+def _is_photo(image) -> bool:
+    if "A" in image.getbands() or "transparency" in image.info:
+        return False
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((128, 128))
+    return thumbnail.getcolors(PHOTO_MIN_COLORS) is None
+
+
+def optimize_image_data(data: bytes, settings: ImageSettings) -> Tuple[bytes, str]:
+    """
+    Trim, downsample and recompress one PNG or JPEG. Returns the new image and
+    its extension, or the original data when nothing was cropped or scaled and
+    recompressing did not make it smaller. The printed size is kept: the
+    resolution stored in the image grows as pixels are dropped.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as original:
+        source_format = original.format
+        image = original.copy()
+    dpi = image.info.get("dpi", (DEFAULT_DPI, DEFAULT_DPI))[0] or DEFAULT_DPI
+    size = image.size
+
+    if settings.trim:
+        image = _trim(image)
+
+    # No more pixels than the text area holds at the target resolution
+    width, height = text_area()
+    max_size = (math.ceil(width * settings.dpi), math.ceil(height * settings.dpi))
+    if image.width > max_size[0] or image.height > max_size[1]:
+        width_before = image.width
+        image.thumbnail(max_size, Image.LANCZOS)
+        dpi = dpi * image.width / width_before
+
+    buffer = io.BytesIO()
+    if _is_photo(image):
+        image.convert("RGB").save(buffer, "JPEG", quality=settings.jpeg_quality, optimize=True, dpi=(dpi, dpi))
+        extension = ".jpg"
+    else:
+        if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(buffer, "PNG", optimize=True, dpi=(dpi, dpi))
+        extension = ".png"
+    if image.size == size and len(buffer.getvalue()) >= len(data):
+        return data, ".jpg" if source_format == "JPEG" else ".png"
+    return buffer.getvalue(), extension
+
+
+def optimize_image(path: str, settings: ImageSettings) -> str:
+    """
+    Optimize the image at `path`, reusing an earlier result for identical content
+    and settings. The file is replaced, never rewritten in place, as it may be
+    linked from a cache. Returns its new path, whose extension may have changed.
+    """
+    key = image_key(file_digest(path), settings) if config.IMAGE_CACHE_ENABLED else None
+    staging = tempfile.mkdtemp(prefix=".image_", dir=os.path.dirname(path))
+    try:
+        cached = image_cache.get(key, staging) if key else None
+        if cached:
+            optimized = cached[0]
+        else:
+            with open(path, "rb") as f:
+                data, extension = optimize_image_data(f.read(), settings)
+            optimized = os.path.join(staging, f"optimized{extension}")
+            with open(optimized, "wb") as f:
+                f.write(data)
+            if key:
+                image_cache.put(key, [optimized])
+        new_path = os.path.splitext(path)[0] + os.path.splitext(optimized)[1]
+        os.replace(optimized, new_path)
+        if new_path != path:
+            os.remove(path)
+        return new_path
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _resolve(reference: str, workspace: str) -> Optional[str]:
+    """Path of an image a document references, if it is an optimizable file inside the workspace."""
+    path = os.path.normpath(os.path.join(workspace, reference.strip()))
+    if os.path.commonpath([os.path.abspath(path), os.path.abspath(workspace)]) != os.path.abspath(workspace):
+        return None
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS and os.path.isfile(path):
+        return path
+    return None
+
+
+def _rewrite_references(tex_file: str, renamed: Dict[str, str]):
+    """Point the document's image references at renamed files, replacing the file rather than editing it."""
+    with open(tex_file, "r", encoding="utf-8") as f:
+        document = f.read()
+
+    def rename(match):
+        reference = match.group(1)
+        if reference.strip() not in renamed:
+            return match.group(0)
+        start, end = match.span(1)
+        return match.group(0)[:start - match.start()] + renamed[reference.strip()] + match.group(0)[end - match.start():]
+
+    rewritten = IMAGE_REFERENCE_PATTERN.sub(rename, document)
+    if rewritten != document:
+        with open(tex_file + ".tmp", "w", encoding="utf-8") as f:
+            f.write(rewritten)
+        os.replace(tex_file + ".tmp", tex_file)
+
+
+def optimize_images(tex_files: List[str], workspace: str, settings: ImageSettings) -> int:
+    """
+    Optimize every PNG and JPEG the LaTeX files reference from the workspace, in
+    parallel, and update the references of images whose format changed.
+    Images that cannot be optimized are left as they are. Returns the number of images optimized.
+    """
+    references = {}
+    for tex_file in tex_files:
+        with open(tex_file, "r", encoding="utf-8", errors="replace") as f:
+            for match in IMAGE_REFERENCE_PATTERN.finditer(f.read()):
+                path = _resolve(match.group(1), workspace)
+                if path is not None:
+                    references.setdefault(path, set()).add(match.group(1).strip())
+    if not references:
+        return 0
+
+    paths = list(references)
+    # Pillow releases the GIL while decoding, resampling and encoding, so threads use every core
+    with ThreadPoolExecutor(max_workers=max(1, min(config.IMAGE_POOL_SIZE, len(paths)))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, optimize_image, path, settings) for path in paths]
+
+    renamed = {}
+    optimized = 0
+    for path, future in zip(paths, futures):
+        try:
+            new_path = future.result()
+        except Exception as e:
+            logging.warning(f"Could not optimize {os.path.basename(path)}, keeping it as it is: {e}")
+            continue
+        optimized += 1
+        if new_path != path:
+            for reference in references[path]:
+                stem, extension = os.path.splitext(reference)
+                renamed[reference] = stem + os.path.splitext(new_path)[1] if extension else reference
+    if renamed:
+        for tex_file in tex_files:
+            _rewrite_references(tex_file, renamed)
+    return optimized
@@ -0,0 +1,540 @@
+import abc
+import dataclasses
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+from app import config
+from app.services.draft import DraftSettings
+from app.services.image_optimization import ImageSettings
+from app.services.result_cache import RESULT_FILENAME, result_key
+from app.utils.content_cache import ContentCache
+from app.utils.file_utils import ensure_directory_exists
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Uploads and results shared between the API and worker nodes, addressed by their SHA-256.
+# Nothing is evicted: a blob is removed once the last job holding it is deleted (see JobStore.hold)
+blob_store = ContentCache(config.BLOB_DIR)
+
+
+class BlobUnavailableError(RuntimeError):
+    """A blob could not be read from or written to the shared blob store; another attempt may succeed."""
+
+
+@dataclass
+class ClaimedJob:
+    """A job a worker has leased from the store, with the payload it is built from."""
+    id: str
+    payload: dict
+    attempts: int
+
+
+class JobStore(abc.ABC):
+    """
+    Queue and state of jobs shared by the API nodes, which enqueue jobs and
+    follow them, and the worker nodes, which build them (see app.services.worker).
+
+    A worker leases a job when it claims it and keeps the lease alive with
+    heartbeats. A job whose lease runs out, because its worker died or hung, is
+    handed to the next worker that asks, up to `max_attempts` claims in all.
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, job_id: str, payload: dict):
+        """Queue a job for the workers, with the payload it is built from."""
+
+    @abc.abstractmethod
+    def claim(self, worker_id: str, lease: float, max_attempts: int) -> Optional[ClaimedJob]:
+        """Lease the oldest queued or abandoned job for `lease` seconds; None when there is none."""
+
+    @abc.abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str, lease: float) -> bool:
+        """Extend a lease; False if the job is no longer leased by this worker."""
+
+    @abc.abstractmethod
+    def add_event(self, job_id: str, stage: str):
+        """Record that a job has reached `stage`."""
+
+    @abc.abstractmethod
+    def finish(self, job_id: str, worker_id: str, state: str, result: str = None, error: str = None,
+               spans: list = None, omitted: list = None) -> bool:
+        """Record the outcome of a leased job; False if another worker holds it by now."""
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        """State, attempts, result digest, error, spans and omitted sources of a job."""
+
+    @abc.abstractmethod
+    def events(self, job_id: str, since: int = 0) -> List[dict]:
+        """Stage events of a job, from index `since` on."""
+
+    @abc.abstractmethod
+    def hold(self, job_id: str, digests: List[str]):
+        """Keep the blobs `digests` in the blob store at least until the job is deleted."""
+
+    @abc.abstractmethod
+    def unheld(self, digests: List[str]) -> List[str]:
+        """The digests among `digests` that no job holds."""
+
+    @abc.abstractmethod
+    def delete(self, job_id: str) -> List[str]:
+        """Forget a job and its events; returns the digests of the blobs no other job holds."""
+
+    @abc.abstractmethod
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+
+    @abc.abstractmethod
+    def remember_result(self, key: str, digest: str):
+        """Record that the build with result key `key` produced the PDF stored under `digest`."""
+
+    @abc.abstractmethod
+    def cached_result(self, key: str) -> Optional[str]:
+        """Digest of the PDF last built for `key`, if any; the blob is gone once no job holds it."""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a SQLite database, for workers on one host or sharing a volume
+    whose file locks SQLite can rely on. Every thread gets its own connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_until REAL,
+            result TEXT,
+            error TEXT,
+            spans TEXT,
+            omitted TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, created_at);
+        CREATE TABLE IF NOT EXISTS events (
+            job_id TEXT NOT NULL,
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            stage TEXT NOT NULL,
+            timestamp REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_by_job ON events (job_id, seq);
+        CREATE TABLE IF NOT EXISTS blobs (
+            job_id TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (job_id, digest)
+        );
+        CREATE INDEX IF NOT EXISTS blobs_by_digest ON blobs (digest);
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            digest TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS results_by_digest ON results (digest);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            ensure_directory_exists(os.path.dirname(path))
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit; writes that must be atomic open their own transaction
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, job_id: str, payload: dict):
+        self._connection().execute(
+            "INSERT INTO jobs (id, state, payload, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), time.time()),
+        )
+
+    def claim(self, worker_id: str, lease: float, max_attempts: int) -> Optional[ClaimedJob]:
+        connection = self._connection()
+        now = time.time()
+        # Take the write lock up front so two workers never claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = connection.execute(
+                    "SELECT id, payload, attempts FROM jobs"
+                    " WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+                if row["attempts"] >= max_attempts:
+                    connection.execute(
+                        "UPDATE jobs SET state = ?, error = ?, lease_until = NULL WHERE id = ?",
+                        (FAILED, f"Gave up after {row['attempts']} attempts: the workers stopped responding", row["id"]),
+                    )
+                    continue
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, worker_id, now + lease, row["id"]),
+                )
+                connection.execute("COMMIT")
+                return ClaimedJob(id=row["id"], payload=json.loads(row["payload"]), attempts=row["attempts"] + 1)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, job_id: str, worker_id: str, lease: float) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?",
+            (time.time() + lease, job_id, worker_id, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def add_event(self, job_id: str, stage: str):
+        self._connection().execute(
+            "INSERT INTO events (job_id, stage, timestamp) VALUES (?, ?, ?)", (job_id, stage, time.time())
+        )
+
+    def finish(self, job_id: str, worker_id: str, state: str, result: str = None, error: str = None,
+               spans: list = None, omitted: list = None) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE jobs SET state = ?, result = ?, error = ?, spans = ?, omitted = ?, lease_until = NULL"
+            " WHERE id = ? AND worker = ? AND state = ?",
+            (state, result, error, json.dumps(spans or []), json.dumps(omitted or []), job_id, worker_id, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT state, attempts, worker, result, error, spans, omitted FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["spans"] = json.loads(record["spans"] or "[]")
+        record["omitted"] = json.loads(record["omitted"] or "[]")
+        return record
+
+    def events(self, job_id: str, since: int = 0) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT stage, timestamp FROM events WHERE job_id = ? ORDER BY seq LIMIT -1 OFFSET ?", (job_id, since)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def hold(self, job_id: str, digests: List[str]):
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO blobs (job_id, digest) VALUES (?, ?)", [(job_id, digest) for digest in digests]
+        )
+
+    def unheld(self, digests: List[str]) -> List[str]:
+        connection = self._connection()
+        return [
+            digest for digest in digests
+            if connection.execute("SELECT 1 FROM blobs WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None
+        ]
+
+    def delete(self, job_id: str) -> List[str]:
+        connection = self._connection()
+        # One transaction, so that a blob another job takes hold of meanwhile is never reported as released
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            digests = [row[0] for row in connection.execute("SELECT digest FROM blobs WHERE job_id = ?", (job_id,))]
+            connection.execute("DELETE FROM blobs WHERE job_id = ?", (job_id,))
+            connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            connection.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            released = [
+                digest for digest in digests
+                if connection.execute("SELECT 1 FROM blobs WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None
+            ]
+            connection.executemany("DELETE FROM results WHERE digest = ?", [(digest,) for digest in released])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return released
+
+    def queue_depth(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+
+    def remember_result(self, key: str, digest: str):
+        self._connection().execute("INSERT OR REPLACE INTO results (key, digest) VALUES (?, ?)", (key, digest))
+
+    def cached_result(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT digest FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+class RedisJobStore(JobStore):
+    """
+    Job store on a Redis-compatible server, for worker nodes on many hosts.
+    Queued ids wait in a list, leased ones in a sorted set scored by the end of
+    their lease; claims run in WATCH/MULTI transactions. Finished jobs expire
+    after the job TTL.
+    """
+
+    def __init__(self, client, prefix: str = "docgen"):
+        self.client = client
+        self.prefix = prefix
+        self.queue_key = f"{prefix}:queue"
+        self.leases_key = f"{prefix}:leases"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _events_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}:events"
+
+    def _blobs_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}:blobs"
+
+    def _holders_key(self, digest: str) -> str:
+        return f"{self.prefix}:blob:{digest}"
+
+    def _result_key(self, key: str) -> str:
+        return f"{self.prefix}:result:{key}"
+
+    def enqueue(self, job_id: str, payload: dict):
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={"state": QUEUED, "payload": json.dumps(payload), "attempts": 0})
+        pipe.lpush(self.queue_key, job_id)
+        pipe.execute()
+
+    def claim(self, worker_id: str, lease: float, max_attempts: int) -> Optional[ClaimedJob]:
+        while True:
+            claimed = self.client.transaction(
+                lambda pipe: self._claim(pipe, worker_id, lease, max_attempts),
+                self.queue_key, self.leases_key, value_from_callable=True,
+            )
+            # A job given up on is skipped; look for the next one
+            if claimed is not False:
+                return claimed
+
+    def _claim(self, pipe, worker_id: str, lease: float, max_attempts: int):
+        now = time.time()
+        expired = pipe.zrangebyscore(self.leases_key, "-inf", now, start=0, num=1)
+        job_id = expired[0] if expired else pipe.lindex(self.queue_key, -1)
+        if job_id is None:
+            return None
+        job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+        job = {key.decode(): value.decode() for key, value in pipe.hgetall(self._job_key(job_id)).items()}
+
+        pipe.multi()
+        if expired:
+            pipe.zrem(self.leases_key, job_id)
+        else:
+            pipe.rpop(self.queue_key)
+        if not job:
+            # Deleted while it waited
+            return False
+        attempts = int(job["attempts"])
+        if attempts >= max_attempts:
+            error = f"Gave up after {attempts} attempts: the workers stopped responding"
+            pipe.hset(self._job_key(job_id), mapping={"state": FAILED, "error": error})
+            return False
+        pipe.hset(self._job_key(job_id), mapping={"state": RUNNING, "worker": worker_id, "attempts": attempts + 1})
+        pipe.zadd(self.leases_key, {job_id: now + lease})
+        return ClaimedJob(id=job_id, payload=json.loads(job["payload"]), attempts=attempts + 1)
+
+    def _owned(self, pipe, job_id: str, worker_id: str) -> bool:
+        state, worker = pipe.hmget(self._job_key(job_id), "state", "worker")
+        return state == RUNNING.encode() and worker == worker_id.encode()
+
+    def heartbeat(self, job_id: str, worker_id: str, lease: float) -> bool:
+        def extend(pipe):
+            if not self._owned(pipe, job_id, worker_id):
+                return False
+            pipe.multi()
+            pipe.zadd(self.leases_key, {job_id: time.time() + lease})
+            return True
+
+        return self.client.transaction(extend, self._job_key(job_id), value_from_callable=True)
+
+    def add_event(self, job_id: str, stage: str):
+        self.client.rpush(self._events_key(job_id), json.dumps({"stage": stage, "timestamp": time.time()}))
+
+    def finish(self, job_id: str, worker_id: str, state: str, result: str = None, error: str = None,
+               spans: list = None, omitted: list = None) -> bool:
+        def record(pipe):
+            if not self._owned(pipe, job_id, worker_id):
+                return False
+            pipe.multi()
+            fields = {
+                "state": state,
+                "result": result or "",
+                "error": error or "",
+                "spans": json.dumps(spans or []),
+                "omitted": json.dumps(omitted or []),
+            }
+            pipe.hset(self._job_key(job_id), mapping=fields)
+            pipe.zrem(self.leases_key, job_id)
+            pipe.expire(self._job_key(job_id), config.JOB_TTL_SECONDS)
+            pipe.expire(self._events_key(job_id), config.JOB_TTL_SECONDS)
+            return True
+
+        return self.client.transaction(record, self._job_key(job_id), value_from_callable=True)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = {key.decode(): value.decode() for key, value in self.client.hgetall(self._job_key(job_id)).items()}
+        if not job:
+            return None
+        return {
+            "state": job["state"],
+            "attempts": int(job["attempts"]),
+            "worker": job.get("worker"),
+            "result": job.get("result") or None,
+            "error": job.get("error") or None,
+            "spans": json.loads(job.get("spans") or "[]"),
+            "omitted": json.loads(job.get("omitted") or "[]"),
+        }
+
+    def events(self, job_id: str, since: int = 0) -> List[dict]:
+        return [json.loads(event) for event in self.client.lrange(self._events_key(job_id), since, -1)]
+
+    def hold(self, job_id: str, digests: List[str]):
+        if not digests:
+            return
+        pipe = self.client.pipeline()
+        pipe.sadd(self._blobs_key(job_id), *digests)
+        for digest in digests:
+            pipe.sadd(self._holders_key(digest), job_id)
+        pipe.execute()
+
+    def unheld(self, digests: List[str]) -> List[str]:
+        pipe = self.client.pipeline()
+        for digest in digests:
+            pipe.scard(self._holders_key(digest))
+        return [digest for digest, holders in zip(digests, pipe.execute()) if not holders]
+
+    def delete(self, job_id: str) -> List[str]:
+        def release(pipe):
+            digests = [digest.decode() for digest in pipe.smembers(self._blobs_key(job_id))]
+            # Start over if another job takes hold of one of these blobs before the deletion is done
+            if digests:
+                pipe.watch(*[self._holders_key(digest) for digest in digests])
+            released = [
+                digest for digest in digests
+                if pipe.smembers(self._holders_key(digest)) <= {job_id.encode()}
+            ]
+            pipe.multi()
+            for digest in digests:
+                pipe.srem(self._holders_key(digest), job_id)
+            pipe.delete(self._job_key(job_id), self._events_key(job_id), self._blobs_key(job_id))
+            pipe.lrem(self.queue_key, 0, job_id)
+            pipe.zrem(self.leases_key, job_id)
+            return released
+
+        return self.client.transaction(release, self._blobs_key(job_id), value_from_callable=True)
+
+    def queue_depth(self) -> int:
+        return self.client.llen(self.queue_key)
+
+    # Results are remembered for as long as jobs keep their PDFs, renewed whenever one is reused
+    def remember_result(self, key: str, digest: str):
+        self.client.set(self._result_key(key), digest, ex=config.JOB_TTL_SECONDS)
+
+    def cached_result(self, key: str) -> Optional[str]:
+        pipe = self.client.pipeline()
+        pipe.get(self._result_key(key))
+        pipe.expire(self._result_key(key), config.JOB_TTL_SECONDS)
+        digest, _ = pipe.execute()
+        return digest.decode() if digest else None
+
+
+def store_inputs(store: JobStore, job_id: str, file_paths: dict) -> dict:
+    """
+    Put the files saved into a job's workspace into the blob store, held by the
+    job, and return the payload a worker builds the job from (see fetch_inputs).
+    """
+    paths = [path for file_type in ("latex", "ppt", "notebook") for path in file_paths[file_type]]
+    # Hold the blobs before storing them, so that deleting another job with the same inputs leaves them be
+    store.hold(job_id, sorted({file_paths["digests"][path] for path in paths}))
+    sources = {}
+    for file_type in ("latex", "ppt", "notebook"):
+        sources[file_type] = []
+        for path in file_paths[file_type]:
+            digest = file_paths["digests"][path]
+            blob_store.put(digest, [path])
+            sources[file_type].append({
+                "digest": digest,
+                "file": os.path.basename(path),
+                "name": file_paths["names"].get(path, os.path.basename(path)),
+            })
+    images = file_paths.get("images")
+    draft = file_paths.get("draft")
+    return {
+        # The worker records its PDF under this key, for any API node to reuse (see JobStore.cached_result)
+        "result_key": result_key(file_paths) if config.RESULT_CACHE_ENABLED else None,
+        "sources": sources,
+        "images": dataclasses.asdict(images) if images else None,
+        "draft": dataclasses.asdict(draft) if draft else None,
+    }
+
+
+def sweep_blobs(store: JobStore, max_age: float) -> int:
+    """
+    Remove the blobs no job holds that have gone unused for `max_age` seconds,
+    e.g. those of a node that died before its jobs were deleted. Returns how many were removed.
+    """
+    released = store.unheld(blob_store.unused_since(time.time() - max_age))
+    for digest in released:
+        blob_store.remove(digest)
+    return len(released)
+
+
+def fetch_inputs(payload: dict, workspace: str) -> dict:
+    """Place the inputs of a payload into a worker's workspace; returns the same structure as save_uploads."""
+    file_paths = {"latex": [], "ppt": [], "notebook": [], "digests": {}, "names": {}}
+    for file_type, sources in payload["sources"].items():
+        for source in sources:
+            path = os.path.join(workspace, source["file"])
+            try:
+                found = blob_store.get_file(source["digest"], path)
+            except OSError as e:
+                raise BlobUnavailableError(f"Could not read {source['name']} from the blob store: {e}") from e
+            if not found:
+                # Shared storage may be slow to show a new file to other hosts; another attempt can find it
+                raise BlobUnavailableError(f"{source['name']} is not in the blob store")
+            file_paths[file_type].append(path)
+            file_paths["digests"][path] = source["digest"]
+            file_paths["names"][path] = source["name"]
+    file_paths["images"] = ImageSettings(**payload["images"]) if payload["images"] else None
+    file_paths["draft"] = DraftSettings(**payload["draft"]) if payload["draft"] else None
+    return file_paths
+
+
+def fetch_result(digest: str, workspace: str) -> str:
+    """Place the PDF a worker stored under `digest` into a job's workspace and return its path."""
+    pdf_path = os.path.join(workspace, RESULT_FILENAME)
+    if not blob_store.get_file(digest, pdf_path):
+        raise RuntimeError("The PDF is no longer in the blob store")
+    return pdf_path
+
+
+def open_job_store(url: str) -> Optional[JobStore]:
+    """
+    Open the job store at `url`: sqlite:///jobs.sqlite3 (relative, sqlite:////srv/jobs.sqlite3
+    for an absolute path) or redis://host:port/db. Returns None for an empty URL,
+    in which case jobs are built by the API process itself.
+    """
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteJobStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("DOCGEN_JOB_STORE points to Redis, install the redis package to use it")
+        return RedisJobStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported job store {url!r}, expected a sqlite:/// or redis:// URL")
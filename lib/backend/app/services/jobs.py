@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from app import config
+from app.services.draft import FULL
+from app.services.job_store import FAILED, QUEUED, RUNNING, SUCCEEDED, JobStore, blob_store, fetch_result, open_job_store
+from app.utils.file_utils import file_digest
+from app.utils.metrics import (
+    JOB_SECONDS, JOBS, JOBS_IN_PROGRESS, JOBS_QUEUED, JOBS_THROTTLED, collect_spans, replay_spans, summarize_spans,
+)
+from app.utils.workspace import create_workspace, release_workspace
+
+# Pipeline stages in the order a job goes through them
+STAGES = ["saving", "pptx", "notebook", "optimize_images", "merge", "compile_fragments", "merge_pdf", "compile_pass_1", "compile_pass_2"]
+
+
+class JobQueueFullError(RuntimeError):
+    """Too many jobs are pending; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Too many documents are being built, retry in {retry_after} seconds")
+
+
+@dataclass
+class Job:
+    """State of a single document build."""
+    id: str
+    workspace: str
+    state: str = QUEUED
+    mode: str = FULL
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    result_path: Optional[str] = None
+    etag: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: List[dict] = field(default_factory=list)
+    spans: List[Tuple[str, float]] = field(default_factory=list)
+    omitted: List[str] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    @property
+    def progress(self) -> float:
+        if self.state == SUCCEEDED:
+            return 1.0
+        if self.stage not in STAGES:
+            return 0.0
+        return STAGES.index(self.stage) / len(STAGES)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "mode": self.mode,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "compile_passes": sum(1 for event in self.events if event["stage"].startswith("compile_pass_")),
+            "error": self.error,
+            "omitted": list(self.omitted),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": list(self.events),
+            "timings": {name: round(seconds, 4) for name, seconds in summarize_spans(list(self.spans)).items()},
+        }
+
+
+class JobManager:
+    """
+    Runs document builds on a bounded pool of worker threads, off the event loop,
+    and keeps track of their progress until they expire. With a `store`, builds
+    are queued there instead for worker nodes to pull (see `enqueue`).
+    """
+
+    def __init__(self, max_workers: int = None, job_ttl: int = None, workspace_root: str = None, max_pending: int = None,
+                 store: JobStore = None):
+        self.workspace_root = workspace_root
+        self.store = store
+        self.max_workers = max_workers or config.WORKER_POOL_SIZE
+        self.job_ttl = config.JOB_TTL_SECONDS if job_ttl is None else job_ttl
+        self.max_pending = config.MAX_PENDING_JOBS if max_pending is None else max_pending
+        self._durations = deque(maxlen=50)  # Build times of the latest jobs, to estimate Retry-After
+        self._queued = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="docgen-job")
+        self._jobs: Dict[str, Job] = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def create_job(self, admit: bool = True) -> Job:
+        """
+        Register a new job with its own workspace, in the "saving" stage.
+        Raises JobQueueFullError when `max_pending` jobs are already saving, queued or running,
+        unless `admit` is False, e.g. for the documents of a batch that was admitted as a whole.
+        """
+        self.purge_expired()
+        with self._lock:
+            retry_after = self._admission_retry_after() if admit else None
+            if retry_after is not None:
+                raise JobQueueFullError(retry_after)
+            job = Job(id=uuid.uuid4().hex, workspace=None)
+            self._jobs[job.id] = job
+        try:
+            job.workspace = create_workspace(self.workspace_root)
+        except Exception:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        self._record(job, "saving")
+        return job
+
+    def submit(self, job: Job, func: Callable, *args) -> asyncio.Future:
+        """
+        Schedule `func(*args, progress=...)` for the job on the worker pool.
+        `func` must return the path of the generated PDF.
+        Returns an awaitable that resolves once the job has finished.
+        """
+        job.state = QUEUED
+        with self._lock:
+            self._queued += 1
+        return asyncio.wrap_future(self._executor.submit(self._run, job, func, *args))
+
+    def enqueue(self, job: Job, prepare: Callable, *args) -> asyncio.Future:
+        """
+        Queue the job on the job store for a worker node to build, and follow its progress there.
+        `prepare(store, job_id, *args)` runs on a thread and returns the payload the worker builds the job from.
+        Returns an awaitable that resolves once the job has finished, like `submit`.
+        """
+        job.state = QUEUED
+        return self.start(self._dispatch(job, prepare, *args))
+
+    def start(self, coroutine) -> asyncio.Task:
+        """Run a coroutine that drives a job in the background; returns its task."""
+        task = asyncio.get_running_loop().create_task(coroutine)
+        # Keep a reference, the event loop only holds weak ones to its tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _dispatch(self, job: Job, prepare: Callable, *args) -> Job:
+        started = time.monotonic()
+        try:
+            payload = await asyncio.to_thread(prepare, self.store, job.id, *args)
+            digest = await asyncio.to_thread(self._reuse_result, job, payload.get("result_key"))
+            if digest is None:
+                await asyncio.to_thread(self.store.enqueue, job.id, payload)
+                record = await self._follow(job)
+                # The worker node's spans are exported here, with those of the API
+                spans = [(name, seconds) for name, seconds in record["spans"]]
+                job.spans.extend(spans)
+                replay_spans(spans)
+                job.omitted.extend(record["omitted"])
+                if record["state"] == FAILED:
+                    self.fail(job, record["error"])
+                    return job
+                digest = record["result"]
+                job.result_path = await asyncio.to_thread(fetch_result, digest, job.workspace)
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            self.fail(job, str(e))
+            return job
+        self._durations.append(time.monotonic() - started)
+        # The store holds the PDF under its SHA-256, which is also its ETag
+        job.etag = f'"{digest}"'
+        job.state = SUCCEEDED
+        job.finished_at = time.time()
+        self._record(job, SUCCEEDED)
+        return job
+
+    def _reuse_result(self, job: Job, key: Optional[str]) -> Optional[str]:
+        """
+        Place the PDF a worker already built for result key `key` into the job's
+        workspace. Returns its digest, or None when the job has to be built.
+        """
+        digest = self.store.cached_result(key) if key else None
+        if digest is None:
+            return None
+        # Hold the PDF first: once held, it outlives the job that built it
+        self.store.hold(job.id, [digest])
+        try:
+            job.result_path = fetch_result(digest, job.workspace)
+        except RuntimeError:
+            # Removed along with the last job holding it
+            return None
+        return digest
+
+    async def _follow(self, job: Job) -> dict:
+        """Mirror the events of a queued job from the store until a worker has finished it; returns its record."""
+        seen = 0
+        while True:
+            record = await asyncio.to_thread(self.store.get, job.id)
+            if record is None:
+                raise RuntimeError("The job is no longer in the job store")
+            events = await asyncio.to_thread(self.store.events, job.id, seen)
+            seen += len(events)
+            for event in events:
+                self._record(job, event["stage"], event["timestamp"])
+            if record["state"] in (SUCCEEDED, FAILED):
+                return record
+            if record["state"] == RUNNING:
+                job.state = RUNNING
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+
+    def _pending_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def admission_retry_after(self) -> Optional[int]:
+        """
+        Return None while another job can be admitted, otherwise the seconds
+        after which the client should retry. Counts the rejection as throttled.
+        """
+        with self._lock:
+            return self._admission_retry_after()
+
+    def _admission_retry_after(self) -> Optional[int]:
+        if not self.max_pending or self._pending_count() < self.max_pending:
+            return None
+        JOBS_THROTTLED.inc()
+        return self._retry_after()
+
+    def _retry_after(self) -> int:
+        """Estimate the seconds until a slot frees up from the build times of recent jobs."""
+        average = sum(self._durations) / len(self._durations) if self._durations else 5.0
+        waves = (self._pending_count() - self.max_pending) // self.max_workers + 1
+        return max(1, min(300, math.ceil(average * waves)))
+
+    def queue_depth(self) -> int:
+        """Number of jobs submitted to the worker pool, or waiting in the job store, that have not started yet."""
+        if self.store is not None:
+            return self.store.queue_depth()
+        with self._lock:
+            return self._queued
+
+    def _run(self, job: Job, func: Callable, *args):
+        started = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+        job.state = RUNNING
+        JOBS_IN_PROGRESS.inc()
+        try:
+            # Spans recorded while building are attributed to the job
+            with collect_spans(job.spans):
+                job.result_path = func(*args, progress=lambda stage: self._record(job, stage))
+            job.etag = f'"{file_digest(job.result_path)}"'
+            job.state = SUCCEEDED
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            JOBS_IN_PROGRESS.dec()
+        self._durations.append(time.monotonic() - started)
+        job.finished_at = time.time()
+        self._record(job, job.state)
+        return job
+
+    def complete(self, job: Job, result_path: str, digest: str = None) -> asyncio.Future:
+        """
+        Mark a job as succeeded without running it, e.g. when its result was cached.
+        Pass the PDF's `digest` if it is known, hashing it blocks.
+        Returns an already resolved awaitable, like `submit`.
+        """
+        job.result_path = result_path
+        job.etag = f'"{digest or file_digest(result_path)}"'
+        job.state = SUCCEEDED
+        job.finished_at = time.time()
+        self._record(job, SUCCEEDED)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(job)
+        return future
+
+    def fail(self, job: Job, error: str):
+        """Mark a job as failed before it reached the worker pool."""
+        job.error = error
+        job.state = FAILED
+        job.finished_at = time.time()
+        self._record(job, FAILED)
+
+    def _record(self, job: Job, stage: str, timestamp: float = None):
+        if stage in STAGES:
+            job.stage = stage
+        elif stage in (SUCCEEDED, FAILED):
+            JOBS.labels(stage).inc()
+            JOB_SECONDS.labels(job.mode).observe(job.finished_at - job.created_at)
+        job.events.append({"stage": stage, "timestamp": timestamp or time.time()})
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str) -> Optional[Job]:
+        """Forget a finished job and release its workspace."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.finished:
+                return None
+            del self._jobs[job_id]
+        if self.store is not None:
+            for digest in self.store.delete(job_id):
+                blob_store.remove(digest)
+        release_workspace(job.workspace)
+        return job
+
+    def purge_expired(self) -> int:
+        """Remove finished jobs older than the job TTL. Returns how many were removed."""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job.id for job in self._jobs.values()
+                if job.finished and now - job.finished_at >= self.job_ttl
+            ]
+        for job_id in expired:
+            self.remove(job_id)
+        return len(expired)
+
+    async def wait_for_events(self, job: Job, since: int, timeout: float) -> List[dict]:
+        """Long-poll for events newer than index `since`, for at most `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while len(job.events) <= since and not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+        return job.events[since:]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(store=open_job_store(config.JOB_STORE_URL))
+JOBS_QUEUED.set_function(job_manager.queue_depth)
@@ -1,18 +1,31 @@
 import os
-import nbformat
-from nbconvert import LatexExporter
-from nbconvert.preprocessors import ExtractOutputPreprocessor
-from traitlets.config import Config
-from html2image import Html2Image
-from PIL import Image
-import uuid
+import hashlib
 import logging
 import base64
-import time
-import shutil
-import random
 import io
+import queue
+from contextlib import contextmanager
+from app.services.html_rendering import find_chrome, render_html_batch
 from app.utils.file_utils import ensure_directory_exists
+from app.utils.metrics import span
+
+# nbformat, nbconvert, ijson and PIL are imported on first use: they take most of the
+# service's startup time and are only needed once a notebook is converted
+
+# Bump whenever the generated LaTeX or images change, so cached conversions are not reused
+CONVERTER_VERSION = "3"
+
+# Image outputs written to files, with the extension XeLaTeX includes them by
+IMAGE_TYPES = {"image/png": ".png", "image/jpeg": ".jpg", "application/pdf": ".pdf"}
+
+# ijson prefix of the mime bundle of a cell output
+OUTPUT_DATA = "cells.item.outputs.item.data."
+
+# Bytes the notebook is read in; ijson's default 64 KiB makes tokenizing long base64 strings several times slower
+READ_BUFFER_SIZE = 1 << 20
+
+# Idle LatexExporters, reused by every notebook conversion of the process
+_idle_exporters = queue.LifoQueue()
 
 
 # Configure logging
@@ -30,63 +43,152 @@ def setup_logging(output_dir, log_file="jupyter_processing.log"):
     )
     return logging.getLogger(__name__)
 
-def extract_images(notebook, output_dir, prefix):
-    """Extract images from the notebook and ensure unique filenames."""
-    ensure_directory_exists(output_dir)
+class SpilledImage(str):
+    """Image output data already written to disk by read_notebook; the value is the file name."""
 
-    for i, cell in enumerate(notebook.cells):
-        if 'outputs' not in cell:
-            continue
-        for o, output in enumerate(cell['outputs']):
-            if 'metadata' not in output or 'image/png' not in output.get('data', {}):
+
+def save_image(content, mime_type, output_dir):
+    """
+    Decode and check one image output and write it to `output_dir`, named by content hash.
+    Returns the file name and whether it was written; raises on invalid content.
+    """
+    from PIL import Image
+
+    if isinstance(content, list):
+        content = "".join(content)
+    if isinstance(content, str):
+        content = base64.b64decode(content)
+    if mime_type != "application/pdf":
+        Image.open(io.BytesIO(content)).verify()
+
+    filename = f"image_{hashlib.sha256(content).hexdigest()[:24]}{IMAGE_TYPES[mime_type]}"
+    image_path = os.path.join(output_dir, filename)
+    if os.path.exists(image_path):
+        return filename, False
+    with open(image_path, "wb") as image_file:
+        image_file.write(content)
+    return filename, True
+
+def read_notebook(notebook_file, output_dir):
+    """
+    Read a notebook incrementally, writing its image outputs to `output_dir` as
+    they are parsed. Image data in the returned notebook is replaced by the file
+    name (a SpilledImage), so memory is bounded by the largest single output
+    rather than the file. Invalid images are dropped. Like nbformat.read, older
+    formats are converted to version 4 and validation errors are only logged.
+    """
+    import ijson
+    import nbformat
+    from nbformat import NBFormatError, versions
+    from nbformat.reader import get_version
+
+    ensure_directory_exists(output_dir)
+    builder = ijson.ObjectBuilder()
+    cell = output = -1
+    lines = None
+    written = 0
+
+    def spill(mime_type, content):
+        nonlocal written
+        try:
+            filename, was_written = save_image(content, mime_type, output_dir)
+        except Exception as e:
+            # Without it the output falls back to its next representation, e.g. text/plain
+            logging.error(f"Invalid {mime_type} content in cell {cell}, output {output}: {e}")
+            return
+        written += was_written
+        builder.event("string", SpilledImage(filename))
+
+    with open(notebook_file, "rb") as f:
+        for prefix, event, value in ijson.parse(f, buf_size=READ_BUFFER_SIZE, use_float=True):
+            if lines is not None:
+                # Image data stored as a list of base64 lines
+                if event == "end_array" and prefix == OUTPUT_DATA + mime_type:
+                    spill(mime_type, lines)
+                    lines = None
+                else:
+                    lines.append(value)
                 continue
+            if event == "start_map" and prefix == "cells.item":
+                cell += 1
+                output = -1
+            elif event == "start_map" and prefix == "cells.item.outputs.item":
+                output += 1
+            elif prefix.startswith(OUTPUT_DATA) and prefix[len(OUTPUT_DATA):] in IMAGE_TYPES:
+                mime_type = prefix[len(OUTPUT_DATA):]
+                if event == "string":
+                    spill(mime_type, value)
+                    continue
+                if event == "start_array":
+                    lines = []
+                    continue
+            builder.event(event, value)
 
-            # Generate a truly unique filename
-            unique_filename = f"{prefix}_cell{i}_output{o}_{prefix+i+o}.png"
-            complete_filename = os.path.normpath(os.path.join(output_dir, unique_filename))
+    major, minor = get_version(builder.value)
+    if major not in versions:
+        raise NBFormatError(f"Unsupported nbformat version {major}")
+    notebook = nbformat.convert(versions[major].to_notebook_json(builder.value, minor=minor), 4)
+    try:
+        nbformat.validate(notebook)
+    except nbformat.ValidationError as e:
+        logging.error(f"Notebook JSON is invalid: {e}")
 
-            try:
-                content = output['data']['image/png']
+    logging.info(f"Saved {written} images to {output_dir} while reading the notebook")
+    return notebook
 
-                # Convert base64 string to bytes if needed
-                if isinstance(content, str):
-                    content = base64.b64decode(content)
+def extract_images(notebook, output_dir):
+    """
+    Write every image output of the notebook to `output_dir` in a single pass and
+    point the output's metadata at the file, for the exporter to include.
+    Each output is decoded once and its file named by content hash, so an image
+    repeated across cells or notebooks is written, and embedded by XeLaTeX, once.
+    Images read_notebook already wrote are only referenced.
+    Returns the number of files written.
+    """
+    ensure_directory_exists(output_dir)
+    written = 0
 
-                # Validate image content before saving
+    for i, cell in enumerate(notebook.cells):
+        for o, output in enumerate(cell.get('outputs', [])):
+            if output.get('output_type') not in ('display_data', 'execute_result'):
+                continue
+            data = output.get('data', {})
+            filenames = {}
+            for mime_type in IMAGE_TYPES:
+                if mime_type not in data:
+                    continue
+                if isinstance(data[mime_type], SpilledImage):
+                    filenames[mime_type] = str(data[mime_type])
+                    continue
                 try:
-                    Image.open(io.BytesIO(content)).verify()
+                    filename, was_written = save_image(data[mime_type], mime_type, output_dir)
                 except Exception as e:
-                    logging.error(f"Invalid image content in cell {i}, output {o}: {e}")
+                    # Without it the output falls back to its next representation, e.g. text/plain
+                    logging.error(f"Invalid {mime_type} content in cell {i}, output {o}: {e}")
+                    del data[mime_type]
                     continue
+                written += was_written
+                filenames[mime_type] = filename
 
-                with open(complete_filename, "wb") as image_file:
-                    image_file.write(content)
+            if 'image/svg+xml' in data and not filenames:
+                logging.warning(f"XeLaTeX cannot include the SVG output of cell {i}, output {o}; using its text instead")
+                del data['image/svg+xml']
+            if filenames:
+                output.setdefault('metadata', {})['filenames'] = filenames
 
-                logging.info(f"Saved image: {complete_filename}")
-                output['metadata']['filenames'] = {'image/png': unique_filename}
-            except Exception as e:
-                logging.error(f"Error saving image {unique_filename}: {e}")
+    logging.info(f"Saved {written} images to {output_dir}")
+    return written
 
 def extract_html_displays(notebook, output_dir, prefix):
-    """Extract and render HTML displays as images."""
+    """
+    Render HTML displays as images on the shared browser pool.
+    All HTML outputs of the notebook are rendered concurrently and clipped to their content.
+    """
     output_dir = os.path.normpath(output_dir)
     ensure_directory_exists(output_dir)
 
-    # Check for Chrome installation
-    chrome_path = shutil.which("chrome") or shutil.which("google-chrome") or shutil.which("chromium")
-    if chrome_path is None:
-        logging.error("Chrome is either not installed or not available in the system PATH.")
-        return
-
-    try:
-        # Initialize Html2Image with the path to the Chrome executable
-        hti = Html2Image(browser_executable=chrome_path, output_path=output_dir, size=(1920, 1080))
-    except Exception as e:
-        logging.error(f"Failed to initialize Html2Image: {e}")
-        return
-
-    logging.info(f"Output directory set to: {output_dir}")
-
+    renders = []
+    locations = []
     for i, cell in enumerate(notebook.cells):
         if 'outputs' not in cell:
             continue
@@ -94,81 +196,79 @@ def extract_html_displays(notebook, output_dir, prefix):
             html_content = output.get('data', {}).get('text/html', None)
             if html_content is None:
                 continue
+            if isinstance(html_content, list):
+                html_content = "".join(html_content)
 
-            # Create a unique filename
-            unique_filename = f"{prefix}_cell{i}_output{o}_{int(time.time())}_{uuid.uuid4().hex}_{random.randint(1000,9999)}.png"
-            image_path = os.path.normpath(os.path.join(output_dir, unique_filename))
-
-            try:
-                logging.info(f"Rendering HTML from cell {i}, output {o}: {html_content[:500]}")
+            image_path = os.path.join(output_dir, f"{prefix}_cell{i}_output{o}_html.png")
+            renders.append((html_content, image_path))
+            locations.append((i, o))
 
-                # Convert HTML to an image
-                hti.screenshot(html_str=html_content, save_as=unique_filename)
-
-                # Validate if the image file was saved
-                if not os.path.exists(image_path):
-                    logging.error(f"Failed to save image: {image_path}")
-                    continue
-
-                # Open and process the image
-                with Image.open(image_path) as img:
-                    img = img.convert('RGB')  # Convert image to RGB format
-                    img.save(image_path, format='PNG')  # Save as PNG
-
-                logging.info(f"HTML successfully rendered to image: {image_path}")
-            except Exception as e:
-                logging.error(f"Error rendering HTML in cell {i}, output {o}: {e}")
+    if not renders:
+        return
+    if find_chrome() is None:
+        logging.error("Chrome is either not installed or not available in the system PATH.")
+        return
 
-def modify_output_filenames(notebook, prefix):
+    logging.info(f"Rendering {len(renders)} HTML outputs into {output_dir}")
+    for (i, o), (_, image_path), error in zip(locations, renders, render_html_batch(renders)):
+        if error is not None:
+            logging.error(f"Error rendering HTML in cell {i}, output {o}: {error}")
+        else:
+            logging.info(f"HTML successfully rendered to image: {image_path}")
+
+def build_latex_exporter():
+    """Build a LatexExporter, with its template already compiled."""
+    from nbconvert import LatexExporter
+    from traitlets.config import Config
+
+    c = Config()
+    # Images are already written by extract_images, which also drops SVG outputs
+    c.ExtractOutputPreprocessor.enabled = False
+    c.SVG2PDFPreprocessor.enabled = False
+    exporter = LatexExporter(config=c)
+    exporter.template  # Discover and compile the Jinja templates now rather than on the first export
+    return exporter
+
+@contextmanager
+def latex_exporter():
     """
-    Ensure unique filenames for all output images to prevent overwriting issues.
+    Lend out an idle LatexExporter, building one when all are in use.
+    An export re-registers its per-notebook filters (e.g. the code lexer), so an
+    exporter is reused across notebooks and jobs but never used by two threads at once.
     """
-    seen_filenames = set()
-
-    for i, cell in enumerate(notebook.cells):
-        if 'outputs' not in cell:
-            continue
-
-        for o, output in enumerate(cell['outputs']):
-            if 'metadata' not in output:
-                output['metadata'] = {}
-
-            if 'filenames' not in output['metadata']:
-                output['metadata']['filenames'] = {}
-
-            # Generate a unique filename
-            while True:
-                unique_filename = f"{prefix}_cell{i}_output{o}_{int(time.time())}_{uuid.uuid4().hex}_{random.randint(1000,9999)}.png"
-                if unique_filename not in seen_filenames:
-                    seen_filenames.add(unique_filename)
-                    break
-
-            output['metadata']['filenames']['image/png'] = unique_filename
-
-            logging.info(f"Updated filename metadata for cell {i}, output {o} to {unique_filename}")
+    try:
+        exporter = _idle_exporters.get_nowait()
+    except queue.Empty:
+        exporter = build_latex_exporter()
+    try:
+        yield exporter
+    finally:
+        _idle_exporters.put(exporter)
 
-def convert_jupyter_to_latex(notebook_file, output_dir):
-    """Convert Jupyter Notebook to LaTeX while ensuring unique image filenames."""
+def convert_jupyter_to_latex(notebook_file, output_dir, render_html=True):
+    """
+    Convert Jupyter Notebook to LaTeX while ensuring unique image filenames.
+    With `render_html` False, e.g. for drafts, HTML outputs are not rendered to images.
+    """
     logger = setup_logging(output_dir)
     ensure_directory_exists(output_dir)
 
     try:
-        # Read and process the notebook
-        with open(notebook_file, "r", encoding="utf-8") as f:
-            notebook = nbformat.read(f, as_version=4)
+        # Read the notebook, writing its images out as they are parsed
+        with span("read_notebook"):
+            notebook = read_notebook(notebook_file, output_dir)
 
         logging.info(f"Processing notebook: {notebook_file}")
 
         base_name = os.path.splitext(os.path.basename(notebook_file))[0]
-        modify_output_filenames(notebook, base_name)
-        extract_images(notebook, output_dir, base_name)
-        extract_html_displays(notebook, output_dir, base_name)
-
-        c = Config()
-        c.LatexExporter.preprocessors = [ExtractOutputPreprocessor]
-        exporter = LatexExporter(config=c)
-
-        (body, _) = exporter.from_notebook_node(notebook)
+        with span("extract_images"):
+            extract_images(notebook, output_dir)
+        if render_html:
+            with span("render_html"):
+                extract_html_displays(notebook, output_dir, base_name)
+
+        with span("export_latex"), latex_exporter() as exporter:
+            (body, _) = exporter.from_notebook_node(notebook)
         output_path = os.path.normpath(os.path.join(output_dir, f"{base_name}.tex"))
 
         with open(output_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,142 @@
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Optional
+from app import config
+from app.services.latex_processing import DUMP_MARKER, ESSENTIAL_PREAMBLE, preamble_version, toolchain_version
+from app.utils.content_cache import link_or_copy
+from app.utils.file_utils import ensure_directory_exists
+from app.utils.metrics import span
+from app.utils.processes import run_tool
+
+FORMAT_PREFIX = "docgen-"
+
+_lock = threading.Lock()
+_failed_formats = set()
+
+
+@functools.lru_cache(maxsize=None)
+def base_format_path() -> Optional[str]:
+    """Return the path of the installed xelatex.fmt, or None if it cannot be found."""
+    try:
+        result = run_tool(
+            "kpsewhich",
+            ["kpsewhich", "-engine=xetex", "xelatex.fmt"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=False,
+        )
+    except Exception:
+        return None
+    return result.stdout.strip() or None
+
+
+def format_name() -> str:
+    """
+    Name of the precompiled format for the fixed preamble.
+    It changes with the preamble, the XeLaTeX version and whenever the
+    installation's own xelatex.fmt is regenerated (e.g. after a package update).
+    """
+    base = base_format_path()
+    base_mtime = os.path.getmtime(base) if base and os.path.exists(base) else 0
+    material = f"{preamble_version()}|{toolchain_version()}|{base}|{base_mtime}"
+    return FORMAT_PREFIX + hashlib.sha256(material.encode("utf-8")).hexdigest()[:12]
+
+
+def is_format_compatible(tex_file: str) -> bool:
+    """
+    Check that a document starts with exactly the fixed preamble followed by the dump marker,
+    i.e. that the part skipped when loading the format is the part it was built from.
+    """
+    expected = ESSENTIAL_PREAMBLE + [DUMP_MARKER]
+    try:
+        with open(tex_file, "r", encoding="utf-8") as f:
+            for expected_line in expected:
+                if f.readline().strip() != expected_line:
+                    return False
+    except OSError:
+        return False
+    return True
+
+
+def build_format(name: str, format_dir: str) -> Optional[str]:
+    """
+    Dump the fixed preamble into `<format_dir>/<name>.fmt` with mylatexformat.
+    Returns the path of the format, or None if XeLaTeX could not build it.
+    """
+    ensure_directory_exists(format_dir)
+    build_dir = tempfile.mkdtemp(prefix=".build_", dir=format_dir)
+    try:
+        with open(os.path.join(build_dir, f"{name}.tex"), "w", encoding="utf-8") as f:
+            f.write("\n".join(ESSENTIAL_PREAMBLE + [DUMP_MARKER, r"\begin{document}", r"\end{document}"]) + "\n")
+
+        result = run_tool(
+            "xelatex",
+            ["xelatex", "-ini", "-interaction=nonstopmode", f"-jobname={name}", "&xelatex", "mylatexformat.ltx", f"{name}.tex"],
+            cwd=build_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            check=False,
+        )
+        built = os.path.join(build_dir, f"{name}.fmt")
+        if result.returncode != 0 or not os.path.exists(built):
+            logging.warning(f"Could not build precompiled format {name}:\n{result.stdout[-2000:]}")
+            return None
+
+        format_path = os.path.join(format_dir, f"{name}.fmt")
+        os.replace(built, format_path)
+        logging.info(f"Built precompiled format {format_path}")
+
+        # Formats built for an older preamble or TeX installation are stale now
+        for entry in os.listdir(format_dir):
+            if entry.startswith(FORMAT_PREFIX) and entry.endswith(".fmt") and entry != f"{name}.fmt":
+                os.remove(os.path.join(format_dir, entry))
+        return format_path
+    except Exception as e:
+        logging.warning(f"Could not build precompiled format {name}: {e}")
+        return None
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def ensure_format() -> Optional[str]:
+    """
+    Return the path of the current precompiled format, building it on first use.
+    Returns None when formats are disabled or the format cannot be built.
+    """
+    if not config.PRECOMPILED_FORMAT_ENABLED:
+        return None
+    name = format_name()
+    format_path = os.path.join(config.FORMAT_DIR, f"{name}.fmt")
+    with _lock:
+        if os.path.exists(format_path):
+            return format_path
+        if name in _failed_formats:
+            return None
+        with span("build_format"):
+            format_path = build_format(name, config.FORMAT_DIR)
+        if format_path is None:
+            _failed_formats.add(name)
+        return format_path
+
+
+def prepare_format(tex_file: str, output_dir: str) -> Optional[str]:
+    """
+    Make the precompiled format available to a compile in `output_dir`.
+    Returns the format name to pass to `compile_latex_to_pdf`, or None to compile
+    the plain way because the document is incompatible or no format is available.
+    """
+    if not is_format_compatible(tex_file):
+        return None
+    format_path = ensure_format()
+    if format_path is None:
+        return None
+    link_or_copy(format_path, os.path.join(output_dir, os.path.basename(format_path)))
+    return os.path.splitext(os.path.basename(format_path))[0]
@@ -1,6 +1,11 @@
+import functools
+import hashlib
 import os
 import re
 import subprocess
+from app import config
+from app.services.tex_packages import package_index, parse_usepackage
+from app.utils.processes import ToolTimeoutError, run_tool
 
 def escape_latex_special_chars(text: str) -> str:
     """
@@ -31,51 +36,92 @@ def escape_latex_special_chars(text: str) -> str:
         text
     )
 
-def merge_latex_files(latex_files: list, output_file: str):
+# Fixed preamble every merged document starts with
+ESSENTIAL_PREAMBLE = [
+    r"\documentclass{article}",
+    r"\usepackage{enumitem}",
+    r"\setlistdepth{8}",  
+    r"\setlist[itemize,1]{label=\textbullet}",
+    r"\setlist[itemize,2]{label=--}",
+    r"\setlist[itemize,3]{label=*}",
+    r"\setlist[itemize,4]{label=-}",
+    r"\setlist[itemize,5]{label=$\cdot$}",  
+    r"\setlist[itemize,6]{label=$\diamond$}",  
+    r"\setlist[itemize,7]{label=$\ast$}",  
+    r"\setlist[itemize,8]{label=$\circ$}", 
+    r"\usepackage{ulem}",
+    r"\usepackage{graphicx}",
+    r"\usepackage{hyperref}",
+    r"\usepackage{geometry}",
+    r"\geometry{a4paper, margin=1in}",
+]
+
+# Images included with \includegraphics or nbconvert's \adjustimage; group 1 is the file name
+IMAGE_REFERENCE_PATTERN = re.compile(
+    r"\\(?:includegraphics\s*(?:\[[^\]]*\])?|adjustimage\s*\{(?:[^{}]|\{[^{}]*\})*\})\s*\{([^}]*)\}"
+)
+
+# Appended to the preamble of drafts: images are drawn as boxes labelled with their file name
+DRAFT_PREAMBLE = [r"\setkeys{Gin}{draft}"]
+
+# Ends the part of the preamble that can be loaded from a precompiled format
+# (see app.services.latex_format); expands to \relax in a plain compile
+DUMP_MARKER = r"\csname endofdump\endcsname"
+
+# Packages loaded by the fixed preamble
+ESSENTIAL_PACKAGES = [
+    name for line in ESSENTIAL_PREAMBLE if line.startswith(r"\usepackage")
+    for name in parse_usepackage(line)[1]
+]
+
+def merge_latex_files(latex_files: list, output_file: str, draft: bool = False) -> list:
     """
     Merge multiple LaTeX files into one document with proper structure.
+    Fragments are streamed line by line: every package is loaded once, a
+    fragment's other preamble commands are kept as a whole unless an earlier
+    fragment had exactly the same ones (as notebooks converted by nbconvert do),
+    and every body is written to a body-only file next
+    to `output_file` that the merged document pulls in with \\input. Memory use
+    and merge time therefore do not grow with the size of the document.
+    With `draft`, DRAFT_PREAMBLE ends the preamble.
+    Returns the paths of the body files.
     """
-    essential_preamble = [
-        r"\documentclass{article}",
-        r"\usepackage{enumitem}",
-        r"\setlistdepth{8}",  
-        r"\setlist[itemize,1]{label=\textbullet}",
-        r"\setlist[itemize,2]{label=--}",
-        r"\setlist[itemize,3]{label=*}",
-        r"\setlist[itemize,4]{label=-}",
-        r"\setlist[itemize,5]{label=$\cdot$}",  
-        r"\setlist[itemize,6]{label=$\diamond$}",  
-        r"\setlist[itemize,7]{label=$\ast$}",  
-        r"\setlist[itemize,8]{label=$\circ$}", 
-        r"\usepackage{ulem}",
-        r"\usepackage{graphicx}",
-        r"\usepackage{hyperref}",
-        r"\usepackage{geometry}",
-        r"\geometry{a4paper, margin=1in}",
-    ]
-    
     custom_preamble = []
-    content = []
+    seen_preambles = set()
+    loaded_packages = set(ESSENTIAL_PACKAGES)
+    output_dir = os.path.dirname(output_file)
+    body_prefix = os.path.splitext(os.path.basename(output_file))[0] + "_body_"
+    body_names = []
 
-    for latex_file in latex_files:
-        with open(latex_file, "r", encoding="utf-8") as infile:
+    for index, latex_file in enumerate(latex_files):
+        body_name = f"{body_prefix}{index}"
+        with open(latex_file, "r", encoding="utf-8") as infile, \
+                open(os.path.join(output_dir, body_name + ".tex"), "w", encoding="utf-8") as body:
             in_preamble = True  # Start in the preamble
+            preamble = []
             for line in infile:
                 line = line.strip()
                 if line.startswith(r"\documentclass"):
                     continue  # Skip duplicate document classes
                 if line.startswith(r"\usepackage"):
-                    # Extract the package name using regex
-                    match = re.search(r'\\usepackage\{(.*?)\}', line)
-                    if match:
-                        package_name = match.group(1)
-                        if not is_package_available(package_name):
-                            print(f"Package {package_name} is not available. Ignoring.")
-                            continue
-                        if line not in essential_preamble and line not in custom_preamble:
-                            custom_preamble.append(line)
-                    else:
+                    options, package_names = parse_usepackage(line)
+                    if not package_names:
                         print(f"Warning: Could not parse package name from line: {line}")
+                        continue
+                    # Loading a package twice with other options is an option clash
+                    new_packages = [name for name in package_names if name not in loaded_packages]
+                    availability = package_index.check_many(new_packages)
+                    kept = []
+                    for package_name in new_packages:
+                        if not availability[package_name]:
+                            print(f"Package {package_name} is not available. Ignoring.")
+                        elif package_name not in kept:
+                            loaded_packages.add(package_name)
+                            kept.append(package_name)
+                    if kept == package_names:
+                        preamble.append(line)
+                    elif kept:
+                        preamble.append(f"\\usepackage{options}{{{','.join(kept)}}}")
                     continue
                 if line.startswith(r"\begin{document}"):
                     in_preamble = False
@@ -85,56 +131,149 @@ def merge_latex_files(latex_files: list, output_file: str):
                 if in_preamble:
                     # Collect other preamble commands (e.g., \newcommand)
                     if line and not line.startswith("%"):  # Skip comments
-                        custom_preamble.append(line)
+                        preamble.append(line)
                 else:
-                    # Collect content after \begin{document}
-                    content.append(line + "\n")
-            
-            
-            content.append("\n")
+                    # Stream content after \begin{document} to the fragment's body file
+                    body.write(line + "\n")
+        # Single lines are not dropped: they may open or close a group, \makeatletter or \if
+        commands = tuple(line for line in preamble if not line.startswith(r"\usepackage"))
+        if commands in seen_preambles:
+            custom_preamble.extend(line for line in preamble if line.startswith(r"\usepackage"))
+        else:
+            seen_preambles.add(commands)
+            custom_preamble.extend(preamble)
+        body_names.append(body_name)
 
     # Build final preamble
-    full_preamble = essential_preamble + custom_preamble + [r"\begin{document}"]
+    full_preamble = ESSENTIAL_PREAMBLE + [DUMP_MARKER] + custom_preamble
+    if draft:
+        full_preamble += DRAFT_PREAMBLE
+    full_preamble.append(r"\begin{document}")
 
     # Write merged file
     with open(output_file, "w", encoding="utf-8") as outfile:
         outfile.write("\n".join(full_preamble) + "\n")
-        outfile.write("".join(content))
+        for body_name in body_names:
+            outfile.write(f"\\input{{{body_name}}}\n\n")
         outfile.write(r"\end{document}" + "\n")
 
+    return [os.path.join(output_dir, body_name + ".tex") for body_name in body_names]
+
 def is_package_available(package_name: str) -> bool:
     """
     Check if a LaTeX package is available in the system.
+    Answered from the in-process package index; see `app.services.tex_packages`.
+    """
+    return package_index.is_available(package_name)
+
+def preamble_version() -> str:
+    """
+    Return a short hash identifying the fixed preamble.
+    """
+    return hashlib.sha256("\n".join(ESSENTIAL_PREAMBLE).encode("utf-8")).hexdigest()[:16]
+
+@functools.lru_cache(maxsize=None)
+def toolchain_version() -> str:
+    """
+    Return the version banner of the installed XeLaTeX, or "unavailable".
     """
     try:
-        result = subprocess.run(
-            ["kpsewhich", f"{package_name}.sty"],
+        result = run_tool(
+            "xelatex",
+            ["xelatex", "--version"],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
             check=False,
         )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"Error checking package {package_name}: {e}")
-        return False
+        return result.stdout.splitlines()[0].strip() if result.stdout else "unavailable"
+    except Exception:
+        return "unavailable"
+
+# Auxiliary files whose contents feed back into the next XeLaTeX pass
+RERUN_AUX_EXTENSIONS = [".aux", ".toc", ".out", ".lof", ".lot"]
 
-def compile_latex_to_pdf(tex_file: str, output_dir: str) -> tuple[bool, str]:
+# Lines LaTeX writes to every .aux file, which never require another pass
+TRIVIAL_AUX_LINES = (
+    r"\relax",
+    r"\providecommand",
+    r"\HyperFirstAtBeginDocument",
+    r"\AtBeginDocument",
+    r"\gdef \@abspage@last",
+)
+
+RERUN_WARNING_PATTERN = re.compile(
+    r"Rerun to get|Label\(s\) may have changed|Please \(?re\)?run LaTeX|Rerun LaTeX|has changed\. Rerun"
+)
+
+def aux_snapshot(tex_file: str) -> dict:
+    """
+    Hash the auxiliary files of a document, ignoring lines that never change between passes.
+    Files without meaningful content are left out, so they compare equal to missing files.
+    """
+    base = os.path.splitext(tex_file)[0]
+    snapshot = {}
+    for ext in RERUN_AUX_EXTENSIONS:
+        try:
+            with open(base + ext, "r", encoding="utf-8", errors="replace") as f:
+                lines = [line for line in f if line.strip() and not line.startswith(TRIVIAL_AUX_LINES)]
+        except OSError:
+            continue
+        if lines:
+            snapshot[ext] = hashlib.sha256("".join(lines).encode("utf-8")).hexdigest()
+    return snapshot
+
+def rerun_requested(output: str) -> bool:
+    """
+    Check XeLaTeX output for warnings asking for another pass.
+    """
+    # TeX wraps long log lines, so search the output with line breaks removed
+    return bool(RERUN_WARNING_PATTERN.search(output.replace("\n", "")))
+
+# XeLaTeX output when a precompiled format cannot be loaded or was dumped badly
+FORMAT_ERROR_PATTERN = re.compile(
+    r"can't find the format file|Fatal format file error|---! \S+ was written by|\\dump"
+)
+
+def format_failed(output: str, pdf_file: str) -> bool:
+    """
+    Check whether a XeLaTeX run failed because of its precompiled format rather than
+    the document: it produced no PDF, or its output reports a format error.
+    """
+    return not os.path.exists(pdf_file) or bool(FORMAT_ERROR_PATTERN.search(output))
+
+def compile_latex_to_pdf(tex_file: str, output_dir: str, progress=None, max_passes: int = None, format_name: str = None, log_name: str = "latex_output.log") -> tuple[bool, str]:
     """
     Compile LaTeX document to PDF using XeLaTeX.
+    Like latexmk, XeLaTeX is rerun only while the auxiliary files (.aux, .toc, .out, ...)
+    keep changing or the log asks for a rerun, up to `max_passes` passes.
+    With `format_name`, the precompiled format of that name (found in `output_dir`) is used;
+    if the format cannot be loaded, the document is compiled again without it.
+    A pass that times out fails the compile and removes the PDF of earlier passes.
+    `progress` is called with "compile_pass_<n>" before each pass.
+    XeLaTeX's output is appended to `log_name` in `output_dir`.
     Returns a tuple (success, message).
     """
+    max_passes = max(1, max_passes or config.XELATEX_MAX_PASSES)
     try:
         tex_file = tex_file.replace("\\", "/")
         output_dir = output_dir.replace("\\", "/")
         tex_file_name = os.path.basename(tex_file)
 
-        log_file = os.path.join(output_dir, "latex_output.log")
+        log_file = os.path.join(output_dir, log_name)
         
-        # Run XeLaTeX twice to resolve cross-references
-        for _ in range(2):
-            result = subprocess.run(
-                ["xelatex", "-synctex=1", "-interaction=nonstopmode", tex_file_name],
+        tex_path = os.path.join(output_dir, tex_file_name)
+        pdf_file = os.path.splitext(tex_file)[0] + ".pdf"
+        previous_snapshot = aux_snapshot(tex_path)
+
+        # Rerun XeLaTeX until cross-references have converged
+        for pass_number in range(1, max_passes + 1):
+            if progress:
+                progress(f"compile_pass_{pass_number}")
+            format_args = [f"-fmt={format_name}"] if format_name else []
+            result = run_tool(
+                "xelatex",
+                ["xelatex"] + format_args + ["-synctex=1", "-interaction=nonstopmode", tex_file_name],
                 cwd=output_dir,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
@@ -148,6 +287,20 @@ def compile_latex_to_pdf(tex_file: str, output_dir: str) -> tuple[bool, str]:
                 if result.returncode != 0:
                     f.write(f"\nXeLaTeX exited with code {result.returncode}")
 
+            # A format that fails to load does so on the first pass; recoverable errors still leave a PDF
+            if format_name and pass_number == 1 and result.returncode != 0 and format_failed(result.stdout, pdf_file):
+                print(f"Warning: Loading format {format_name} failed, retrying without it.")
+                # The first pass has been reported already; the retry takes its place
+                def retry_progress(stage):
+                    if progress and stage != "compile_pass_1":
+                        progress(stage)
+                return compile_latex_to_pdf(tex_file, output_dir, retry_progress, max_passes, log_name=log_name)
+
+            snapshot = aux_snapshot(tex_path)
+            if snapshot == previous_snapshot and not rerun_requested(result.stdout):
+                break
+            previous_snapshot = snapshot
+
         if result.returncode != 0:
             # Check if the error is due to missing packages
             if "LaTeX Error: File `" in result.stdout:
@@ -155,12 +308,16 @@ def compile_latex_to_pdf(tex_file: str, output_dir: str) -> tuple[bool, str]:
             else:
                 return False, f"XeLaTeX failed with exit code {result.returncode}"
 
-        pdf_file = os.path.splitext(tex_file)[0] + ".pdf"
         if not os.path.exists(pdf_file):
             return False, f"PDF file not generated. Check log: {log_file}"
 
-        return True, "Compilation successful."
-            
+        return True, f"Compilation successful after {pass_number} pass{'es' if pass_number > 1 else ''}."
+
+    except ToolTimeoutError as e:
+        # A PDF left by an earlier pass is incomplete and must not be mistaken for the result
+        if os.path.exists(pdf_file):
+            os.remove(pdf_file)
+        return False, str(e)
     except Exception as e:
         error_msg = f"LaTeX compilation error: {str(e)}"
         if os.path.exists(log_file):
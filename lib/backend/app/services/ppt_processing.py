@@ -1,95 +1,196 @@
 import os
-from pptx import Presentation
+import posixpath
+import zipfile
+from typing import Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
 from app.services.latex_processing import escape_latex_special_chars
 
-def convert_pptx_to_latex(pptx_file: str, output_dir: str):
+# Bump whenever the generated LaTeX changes, so cached conversions are not reused
+CONVERTER_VERSION = "1"
+
+MAX_LIST_DEPTH = 8
+
+# Namespaces of the package parts a deck is read from
+NS = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+SHAPE_TREE = f"{{{NS['p']}}}spTree"
+TEXT_SHAPE = f"{{{NS['p']}}}sp"
+# Elements that are shapes when they are children of a slide's shape tree
+SHAPES = {f"{{{NS['p']}}}{tag}" for tag in ("sp", "grpSp", "graphicFrame", "cxnSp", "pic", "contentPart")}
+# Depth of the shape tree in a slide: p:sld/p:cSld/p:spTree
+SHAPE_TREE_DEPTH = 3
+
+RUN = f"{{{NS['a']}}}r"
+FIELD = f"{{{NS['a']}}}fld"
+LINE_BREAK = f"{{{NS['a']}}}br"
+
+
+def _relationships(package: zipfile.ZipFile, part_name: str) -> dict:
+    """Type and part name of every internal relationship of a part ("" for the package), by id."""
+    directory, name = posixpath.split(part_name)
+    with package.open(posixpath.join(directory, "_rels", f"{name}.rels")) as f:
+        root = ElementTree.parse(f).getroot()
+    relationships = {}
+    for relationship in root.iterfind("rel:Relationship", NS):
+        if relationship.get("TargetMode") == "External":
+            continue
+        target = relationship.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        relationships[relationship.get("Id")] = (relationship.get("Type"), target)
+    return relationships
+
+
+def _slide_parts(package: zipfile.ZipFile) -> List[str]:
+    """Part names of the deck's slides, in presentation order."""
+    presentation = next(
+        part for kind, part in _relationships(package, "").values() if kind.endswith("/officeDocument")
+    )
+    parts = _relationships(package, presentation)
+    with package.open(presentation) as f:
+        root = ElementTree.parse(f).getroot()
+    return [parts[slide.get(f"{{{NS['r']}}}id")][1] for slide in root.iterfind("p:sldIdLst/p:sldId", NS)]
+
+
+def _paragraph_text(paragraph) -> str:
+    """Plain text of an a:p element, with line breaks as vertical tabs like python-pptx."""
+    text = []
+    for child in paragraph:
+        if child.tag == LINE_BREAK:
+            text.append("\v")
+        elif child.tag in (RUN, FIELD):
+            text.append(child.findtext("a:t", "", NS))
+    return "".join(text)
+
+
+def _paragraph_level(paragraph) -> int:
+    properties = paragraph.find("a:pPr", NS)
+    return int(properties.get("lvl", 0)) if properties is not None else 0
+
+
+def _read_slide(package: zipfile.ZipFile, part_name: str) -> Tuple[Optional[str], List[Tuple[str, int]]]:
     """
-    Convert PowerPoint to LaTeX with safe list nesting.
+    Title and formatted (text, level) paragraphs of one slide. The slide's XML
+    is parsed incrementally and every shape is dropped once it has been read.
+    The title is the first placeholder with index 0, as in python-pptx.
     """
-    MAX_LIST_DEPTH = 8  
-    
-    try:
-        prs = Presentation(pptx_file)
-        latex_content = []
-        base_name = os.path.splitext(os.path.basename(pptx_file))[0]
-        output_path = os.path.join(output_dir, f"{base_name}.tex")
-        
-        list_stack = []
-        current_depth = -1
+    title = None
+    title_found = False
+    paragraphs = []
+    ancestors = []
+    with package.open(part_name) as f:
+        for event, element in ElementTree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                ancestors.append(element)
+                continue
+            ancestors.pop()
+            if len(ancestors) != SHAPE_TREE_DEPTH or ancestors[-1].tag != SHAPE_TREE or element.tag not in SHAPES:
+                continue
 
-        for slide in prs.slides:
+            placeholder = element.find("*/p:nvPr/p:ph", NS)
+            is_title = not title_found and placeholder is not None and int(placeholder.get("idx", 0)) == 0
+            title_found = title_found or is_title
+            # Only text shapes have a text frame; text inside groups is not read
+            if element.tag == TEXT_SHAPE:
+                shape_paragraphs = element.findall("p:txBody/a:p", NS)
+                if is_title:
+                    title = "\n".join(_paragraph_text(paragraph) for paragraph in shape_paragraphs)
+                for paragraph in shape_paragraphs:
+                    cleaned_text = process_paragraph(paragraph)
+                    if cleaned_text:
+                        paragraphs.append((cleaned_text, _paragraph_level(paragraph)))
+            ancestors[-1].remove(element)
+    return title, paragraphs
+
+
+def iter_pptx_latex(pptx_file: str) -> Iterator[str]:
+    """
+    Generate the LaTeX lines of a deck with safe list nesting. Slides are read
+    one at a time straight from the package zip; media and layouts are never loaded.
+    """
+    with zipfile.ZipFile(pptx_file) as package:
+        current_depth = -1
+        for part_name in _slide_parts(package):
+            title, paragraphs = _read_slide(package, part_name)
             # Slide title handling
-            if slide.shapes.title and slide.shapes.title.text.strip():
-                title = escape_latex_special_chars(slide.shapes.title.text.strip())
-                latex_content.append(f"\\section*{{{title}}}\n")
+            if title and title.strip():
+                yield f"\\section*{{{escape_latex_special_chars(title.strip())}}}\n"
 
-            for shape in slide.shapes:
-                if not shape.has_text_frame:
-                    continue
+            for cleaned_text, level in paragraphs:
+                # List handling
+                if level >= 0:
+                    target_depth = min(level, MAX_LIST_DEPTH - 1)
+                    while current_depth < target_depth:
+                        yield "\\begin{itemize}"
+                        current_depth += 1
+                    while current_depth > target_depth:
+                        yield "\\end{itemize}"
+                        current_depth -= 1
+                    yield f"\\item {cleaned_text}"
+                else:
+                    # Close lists for regular text
+                    while current_depth >= 0:
+                        yield "\\end{itemize}"
+                        current_depth -= 1
+                    yield f"{cleaned_text}\n"
 
-                for paragraph in shape.text_frame.paragraphs:
-                    # Paragraph processing
-                    cleaned_text = process_paragraph(paragraph)
-                    if not cleaned_text:
-                        continue
-
-                    # List handling
-                    if paragraph.level >= 0:
-                        target_depth = min(paragraph.level, MAX_LIST_DEPTH-1)
-                        
-                        # Adjust list depth
-                        while current_depth < target_depth:
-                            latex_content.append("\\begin{itemize}")
-                            list_stack.append("itemize")
-                            current_depth += 1
-                        while current_depth > target_depth:
-                            latex_content.append("\\end{itemize}")
-                            list_stack.pop()
-                            current_depth -= 1
-                            
-                        latex_content.append(f"\\item {cleaned_text}")
-                    else:
-                        # Close lists for regular text
-                        while list_stack:
-                            latex_content.append("\\end{itemize}")
-                            list_stack.pop()
-                            current_depth -= 1
-                        latex_content.append(f"{cleaned_text}\n")
-
-            # Close remaining lists 
-            while list_stack:
-                latex_content.append("\\end{itemize}")
-                list_stack.pop()
+            # Close remaining lists
+            while current_depth >= 0:
+                yield "\\end{itemize}"
                 current_depth -= 1
 
-        # Write to file
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(latex_content))
 
+def convert_pptx_to_latex(pptx_file: str, output_dir: str):
+    """
+    Convert PowerPoint to LaTeX, writing the document as it is generated.
+    """
+    base_name = os.path.splitext(os.path.basename(pptx_file))[0]
+    output_path = os.path.join(output_dir, f"{base_name}.tex")
+
+    try:
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            for index, line in enumerate(iter_pptx_latex(pptx_file)):
+                f.write(f"\n{line}" if index else line)
+        os.replace(output_path + ".tmp", output_path)
     except Exception as e:
+        if os.path.exists(output_path + ".tmp"):
+            os.remove(output_path + ".tmp")
         raise RuntimeError(f"PPTX conversion failed: {str(e)}")
 
-def process_paragraph(paragraph):
+
+def _is_set(properties, name: str) -> bool:
+    return properties is not None and properties.get(name) in ("1", "true")
+
+
+def process_paragraph(paragraph) -> str:
     """
-    Process paragraph content with formatting.
+    Process the runs of an a:p element with their formatting.
     """
     formatted_runs = []
-    for run in paragraph.runs:
-        text = escape_latex_special_chars(run.text.strip())
+    for run in paragraph.iterfind("a:r", NS):
+        text = escape_latex_special_chars(run.findtext("a:t", "", NS).strip())
         if not text:
             continue
-        
+
         # Handle smart quotes
         text = text.replace('“', '``').replace('”', "''").replace('„', ',,')
 
         # Apply formatting
-        if run.font.bold:
+        properties = run.find("a:rPr", NS)
+        if _is_set(properties, "b"):
             text = f"\\textbf{{{text}}}"
-        if run.font.italic:
+        if _is_set(properties, "i"):
             text = f"\\textit{{{text}}}"
-        if run.font.underline:
+        if properties is not None and properties.get("u", "none") != "none":
             text = f"\\underline{{{text}}}"
-            
+
         formatted_runs.append(text)
-    
-    return " ".join(formatted_runs).strip()
\ No newline at end of file
+
+    return " ".join(formatted_runs).strip()
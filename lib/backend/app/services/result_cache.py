@@ -0,0 +1,42 @@
+import dataclasses
+import hashlib
+import json
+from app import config
+from app.services.conversion import CONVERTERS
+from app.services.latex_processing import preamble_version, toolchain_version
+from app.utils.content_cache import ContentCache
+
+# Name of the merged PDF inside a job workspace and inside a cache entry
+RESULT_FILENAME = "merged.pdf"
+
+result_cache = ContentCache(
+    config.RESULT_CACHE_DIR,
+    max_bytes=config.RESULT_CACHE_MAX_BYTES,
+    max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+)
+
+
+def result_key(file_paths: dict) -> str:
+    """
+    Cache key of a whole build: the ordered content hashes of all inputs, plus
+    the versions of the fixed preamble, the converters and the TeX toolchain,
+    whether the sources are compiled separately, how images are optimized and
+    the draft settings.
+    """
+    images = file_paths.get("images")
+    draft = file_paths.get("draft")
+    inputs = [
+        [file_type, file_paths["digests"][path]]
+        for file_type in ("latex", "ppt", "notebook")
+        for path in file_paths[file_type]
+    ]
+    key_material = {
+        "inputs": inputs,
+        "preamble": preamble_version(),
+        "converters": {file_type: version for file_type, (_, version, _) in CONVERTERS.items()},
+        "toolchain": toolchain_version(),
+        "split_compile": config.SPLIT_COMPILE_ENABLED,
+        "images": dataclasses.asdict(images) if images else None,
+        "draft": dataclasses.asdict(draft) if draft else None,
+    }
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode("utf-8")).hexdigest()
@@ -0,0 +1,127 @@
+import contextvars
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from app import config
+from app.services.latex_format import prepare_format
+from app.services.latex_processing import IMAGE_REFERENCE_PATTERN, compile_latex_to_pdf, merge_latex_files, toolchain_version
+from app.utils.content_cache import ContentCache
+from app.utils.file_utils import file_digest
+from app.utils.metrics import span
+
+fragment_cache = ContentCache(
+    config.FRAGMENT_CACHE_DIR,
+    max_bytes=config.FRAGMENT_CACHE_MAX_BYTES,
+)
+
+
+def fragment_key(tex_files: List[str], workspace: str) -> str:
+    """
+    Cache key of a compiled fragment: its standalone document and the body files
+    it inputs, the content of every image they include and the TeX toolchain version.
+    """
+    digest = hashlib.sha256(toolchain_version().encode("utf-8"))
+    for tex_file in tex_files:
+        with open(tex_file, "rb") as f:
+            document = f.read()
+        digest.update(f"\0{os.path.basename(tex_file)}\0".encode("utf-8"))
+        digest.update(document)
+        for match in IMAGE_REFERENCE_PATTERN.finditer(document.decode("utf-8", errors="replace")):
+            image_path = os.path.join(workspace, match.group(1).strip())
+            if os.path.isfile(image_path):
+                digest.update(f"\0{match.group(1)}\0{file_digest(image_path)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compile_fragment(tex_file: str, body_files: List[str], workspace: str, format_name: Optional[str],
+                     max_passes: int = None) -> str:
+    """
+    Compile one standalone fragment document, reusing a PDF compiled earlier from identical input.
+    Returns the path of the PDF; raises RuntimeError if XeLaTeX produced none.
+    """
+    base = os.path.splitext(tex_file)[0]
+    pdf_path = base + ".pdf"
+    key = fragment_key([tex_file] + body_files, workspace) if config.FRAGMENT_CACHE_ENABLED else None
+    if key and fragment_cache.get_file(key, pdf_path):
+        logging.info(f"Reusing cached PDF of {os.path.basename(tex_file)}")
+        return pdf_path
+
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)  # Never mistake a stale PDF for the result of this compile
+    success, message = compile_latex_to_pdf(
+        tex_file, workspace, max_passes=max_passes, format_name=format_name,
+        log_name=f"{os.path.basename(base)}_output.log",
+    )
+    if not os.path.exists(pdf_path):
+        raise RuntimeError(message)
+    if key:
+        fragment_cache.put(key, [pdf_path])
+    return pdf_path
+
+
+def merge_pdfs(parts: List[Tuple[str, str]], output_file: str):
+    """Concatenate (title, pdf path) parts into one PDF with a top-level bookmark per part."""
+    from pypdf import PdfReader, PdfWriter  # Only needed in split mode
+
+    writer = PdfWriter()
+    for title, pdf_path in parts:
+        # The part's own bookmarks (sections, slides) are nested under its title
+        writer.append(PdfReader(pdf_path), outline_item=title)
+    writer.page_mode = "/UseOutlines"
+    with open(output_file, "wb") as f:
+        writer.write(f)
+
+
+def compile_split(latex_files: List[str], titles: List[str], workspace: str, output_file: str,
+                  progress: Callable[[str], None] = None, draft: bool = False) -> List[str]:
+    """
+    Compile every LaTeX fragment as a standalone document with the shared preamble,
+    in parallel, and concatenate the PDFs into `output_file` in input order.
+
+    A fragment that fails to compile is left out instead of failing the whole
+    document; RuntimeError is raised only if no fragment compiled. Returns the
+    titles of the fragments that were left out. With `draft`, fragments get the
+    draft preamble and a single XeLaTeX pass.
+    """
+    progress = progress or (lambda stage: None)
+    documents = []
+    with span("merge"):
+        for i, latex_file in enumerate(latex_files):
+            document = os.path.join(workspace, f"fragment_{i}.tex")
+            documents.append((document, merge_latex_files([latex_file], document, draft=draft)))
+    if not documents:
+        raise RuntimeError("No LaTeX sources to compile")
+
+    # Every standalone document starts with the same fixed preamble, so one format serves all
+    format_name = prepare_format(documents[0][0], workspace)
+
+    progress("compile_fragments")
+    with span("compile_fragments"), ThreadPoolExecutor(max_workers=max(1, min(config.COMPILE_POOL_SIZE, len(documents)))) as executor:
+        futures = [
+            # Run in a copy of this context, so spans are attributed to the current job
+            executor.submit(
+                contextvars.copy_context().run, compile_fragment, document, body_files, workspace, format_name,
+                1 if draft else None,
+            )
+            for document, body_files in documents
+        ]
+
+    parts = []
+    failed = []
+    errors = []
+    for title, future in zip(titles, futures):
+        try:
+            parts.append((title, future.result()))
+        except Exception as e:
+            logging.error(f"Could not compile {title}, leaving it out: {e}")
+            failed.append(title)
+            errors.append(f"{title}: {e}")
+    if not parts:
+        raise RuntimeError("; ".join(errors))
+
+    progress("merge_pdf")
+    with span("merge_pdf"):
+        merge_pdfs(parts, output_file)
+    return failed
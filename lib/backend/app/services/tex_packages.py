@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+from app import config
+from app.utils.metrics import span
+from app.utils.processes import run_tool
+
+USEPACKAGE_PATTERN = re.compile(r"\\usepackage\s*(\[[^\]]*\])?\s*\{([^}]*)\}")
+
+
+def parse_usepackage(line: str) -> Tuple[str, List[str]]:
+    """
+    Parse a \\usepackage line, including the `\\usepackage[opts]{a,b,c}` form.
+    Returns the option block (e.g. "[utf8]", or "" without options) and the package names.
+    Returns ("", []) when the line cannot be parsed.
+    """
+    match = USEPACKAGE_PATTERN.search(line)
+    if not match:
+        return "", []
+    packages = [name.strip() for name in match.group(2).split(",") if name.strip()]
+    return match.group(1) or "", packages
+
+
+def texmf_databases() -> List[str]:
+    """Return the paths of the ls-R filename databases of the TeX installation."""
+    result = run_tool(
+        "kpsewhich",
+        ["kpsewhich", "-var-value=TEXMFDBS"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        check=False,
+    )
+    roots = re.split(r"[,{}" + re.escape(os.pathsep) + r"]", result.stdout.strip())
+    databases = []
+    for root in roots:
+        root = root.strip().lstrip("!")
+        if not root:
+            continue
+        for name in ("ls-R", "ls-r"):
+            path = os.path.join(os.path.expanduser(root), name)
+            if os.path.isfile(path):
+                databases.append(path)
+                break
+    return databases
+
+
+def read_style_files(database: str) -> Set[str]:
+    """Return the names (without extension) of all .sty files listed in an ls-R database."""
+    packages = set()
+    with open(database, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.endswith(".sty"):
+                packages.add(line[:-4])
+    return packages
+
+
+class PackageIndex:
+    """
+    In-process index of the installed LaTeX packages.
+
+    The index is built once from the ls-R databases of the TeX installation and
+    rebuilt after `ttl` seconds or on `refresh()`. Packages missing from the
+    index (e.g. in an unindexed TEXMFHOME) are resolved with a single batched
+    kpsewhich call and the answer is memoized until the next refresh.
+    """
+
+    def __init__(self, ttl: int = None):
+        self.ttl = config.PACKAGE_INDEX_TTL if ttl is None else ttl
+        self._installed: Set[str] = set()
+        self._memo: Dict[str, bool] = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+        self.index_hits = 0
+        self.memo_hits = 0
+        self.lookups = 0
+        self.kpsewhich_calls = 0
+        self.refreshes = 0
+
+    def refresh(self):
+        """Rebuild the index from the ls-R databases now."""
+        installed = set()
+        try:
+            for database in texmf_databases():
+                installed |= read_style_files(database)
+        except Exception as e:
+            logging.warning(f"Could not read the TeX filename databases: {e}")
+        with self._lock:
+            self._installed = installed
+            self._memo = {}
+            self._built_at = time.monotonic()
+            self.refreshes += 1
+        logging.info(f"Indexed {len(installed)} installed LaTeX packages")
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self.refresh()
+
+    def check_many(self, package_names: Iterable[str]) -> Dict[str, bool]:
+        """Return the availability of every package, spawning at most one kpsewhich process."""
+        with span("package_lookup"):
+            return self._check_many(package_names)
+
+    def _check_many(self, package_names: Iterable[str]) -> Dict[str, bool]:
+        self._ensure_fresh()
+        availability = {}
+        unknown = []
+        with self._lock:
+            for name in package_names:
+                self.lookups += 1
+                if name in self._installed:
+                    self.index_hits += 1
+                    availability[name] = True
+                elif name in self._memo:
+                    self.memo_hits += 1
+                    availability[name] = self._memo[name]
+                elif name not in unknown:
+                    unknown.append(name)
+            if unknown:
+                self.kpsewhich_calls += 1
+
+        if unknown:
+            found = self._kpsewhich(unknown)
+            with self._lock:
+                for name in unknown:
+                    self._memo[name] = name in found
+                    availability[name] = name in found
+        return availability
+
+    def is_available(self, package_name: str) -> bool:
+        return self.check_many([package_name])[package_name]
+
+    def _kpsewhich(self, package_names: List[str]) -> Set[str]:
+        """Look up several packages with one kpsewhich call; returns the names that were found."""
+        try:
+            result = run_tool(
+                "kpsewhich",
+                ["kpsewhich"] + [f"{name}.sty" for name in package_names],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=False,
+            )
+        except Exception as e:
+            logging.error(f"Error checking packages {', '.join(package_names)}: {e}")
+            return set()
+        return {
+            os.path.splitext(os.path.basename(path.strip()))[0]
+            for path in result.stdout.splitlines() if path.strip()
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "indexed_packages": len(self._installed),
+                "memoized_packages": len(self._memo),
+                "lookups": self.lookups,
+                "index_hits": self.index_hits,
+                "memo_hits": self.memo_hits,
+                "kpsewhich_calls": self.kpsewhich_calls,
+                "refreshes": self.refreshes,
+                "age_seconds": None if self._built_at is None else time.monotonic() - self._built_at,
+            }
+
+
+package_index = PackageIndex()
@@ -0,0 +1,117 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Callable, List, Tuple
+from app import config
+from app.services import conversion, jupyter_processing, latex_format
+from app.services.latex_processing import toolchain_version
+from app.services.tex_packages import package_index
+
+# Modules the converters import on first use
+CONVERTER_MODULES = ["nbformat", "nbconvert", "traitlets", "ijson", "PIL.Image", "pypdf"]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def import_converters() -> List[str]:
+    """
+    Import the converters' dependencies into this process and build its first
+    LatexExporter; returns the modules that are missing.
+    """
+    missing = []
+    for name in CONVERTER_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            missing.append(name)
+    if not {"nbconvert", "traitlets"} & set(missing):
+        with jupyter_processing.latex_exporter():
+            pass
+    return missing
+
+
+def warm_conversion_pool():
+    """Start every conversion worker and have it import the converters' dependencies and build its exporter."""
+    pool = conversion.conversion_pool()
+    if pool is None:
+        return
+    # The pool starts a worker for every task submitted while none is idle
+    for future in [pool.submit(import_converters) for _ in range(config.CONVERSION_POOL_SIZE)]:
+        future.result()
+
+
+def _import_in_process():
+    missing = import_converters()
+    if missing:
+        raise ImportError(f"missing {', '.join(missing)}")
+
+
+class Warmup:
+    """
+    Runs the expensive first-use work (imports, package index, precompiled
+    format, conversion workers) on a background thread after startup, so the
+    first requests do not pay for it. Each step's state is kept for /ready.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], object]]]):
+        self.steps = steps
+        self.status = {name: PENDING for name, _ in steps}
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self, enabled: bool = None):
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        if not (config.WARMUP_ENABLED if enabled is None else enabled):
+            self.status = {name: SKIPPED for name in self.status}
+            self.finished_at = self.started_at
+            self._done.set()
+            return
+        self._thread = threading.Thread(target=self.run, name="docgen-warmup", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        for name, step in self.steps:
+            self.status[name] = RUNNING
+            try:
+                step()
+                self.status[name] = DONE
+            except Exception as e:
+                # The service still works, the first request pays for this step instead
+                logging.warning(f"Warmup step {name} failed: {e}")
+                self.status[name] = FAILED
+                self.errors[name] = str(e)
+        self.finished_at = time.time()
+        self._done.set()
+
+    def is_ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "steps": dict(self.status),
+            "errors": dict(self.errors),
+            "seconds": (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+        }
+
+
+warmup = Warmup([
+    ("imports", _import_in_process),
+    ("package_index", package_index.refresh),
+    ("toolchain", toolchain_version),
+    ("format", latex_format.ensure_format),
+    ("conversion_pool", warm_conversion_pool),
+])
@@ -0,0 +1,142 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+from app import config
+from app.services.file_processing import build_pdf
+from app.services.job_store import (
+    FAILED, SUCCEEDED, BlobUnavailableError, ClaimedJob, JobStore, blob_store, fetch_inputs, sweep_blobs,
+)
+from app.utils.file_utils import file_digest
+from app.utils.metrics import collect_spans
+from app.utils.workspace import create_workspace, release_workspace
+
+
+class Worker:
+    """
+    Pulls jobs from the job store and builds them, `concurrency` at a time, on a
+    worker node. Leases of the jobs being built are renewed by a heartbeat thread;
+    a worker that dies lets its leases run out and its jobs go to other workers.
+    """
+
+    def __init__(self, store: JobStore, concurrency: int = None, workspace_root: str = None, worker_id: str = None):
+        self.store = store
+        self.concurrency = concurrency or config.WORKER_POOL_SIZE
+        self.workspace_root = workspace_root
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"docgen-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="docgen-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Worker {self.id} building {self.concurrency} jobs at a time")
+
+    def stop(self):
+        """Stop claiming jobs, wait for the running builds and stop the heartbeats."""
+        self._stopping.set()
+        for thread in self._threads[:-1]:
+            thread.join()
+        self._stopped.set()
+        self._threads[-1].join()
+
+    def run(self):
+        """Build jobs until interrupted, then finish the running ones."""
+        self.start()
+        try:
+            self._stopped.wait()
+        except KeyboardInterrupt:
+            logging.info(f"Worker {self.id} stopping once its running jobs are finished")
+            self.stop()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = self.store.claim(self.id, config.WORKER_LEASE_SECONDS, config.JOB_MAX_ATTEMPTS)
+            except Exception:
+                logging.exception("Could not claim a job from the job store")
+                claimed = None
+            if claimed is None:
+                self._stopping.wait(config.WORKER_POLL_INTERVAL)
+                continue
+            self.build(claimed)
+
+    def build(self, claimed: ClaimedJob) -> Optional[str]:
+        """
+        Build a claimed job and record its outcome in the store. Returns the job's
+        final state, or None when the job is left for another worker to retry.
+        """
+        with self._lock:
+            self._active.add(claimed.id)
+        workspace = create_workspace(self.workspace_root)
+        spans = []
+        omitted = []
+        try:
+            with collect_spans(spans):
+                file_paths = fetch_inputs(claimed.payload, workspace)
+                pdf_path = build_pdf(
+                    file_paths, workspace, omitted, progress=lambda stage: self.store.add_event(claimed.id, stage)
+                )
+                result = file_digest(pdf_path)
+                self.store.hold(claimed.id, [result])
+                try:
+                    blob_store.put(result, [pdf_path])
+                except OSError as e:
+                    raise BlobUnavailableError(f"Could not store the PDF in the blob store: {e}") from e
+            state, error = SUCCEEDED, None
+        except BlobUnavailableError:
+            # The shared storage is in trouble: the lease runs out and another worker retries the job.
+            # Any other error, a missing tool or a full disk included, would repeat and fails the job below
+            logging.exception(f"Job {claimed.id} could not be built on this worker (attempt {claimed.attempts})")
+            return None
+        except Exception as e:
+            logging.exception(f"Job {claimed.id} failed")
+            state, result, error = FAILED, None, str(e)
+        finally:
+            with self._lock:
+                self._active.discard(claimed.id)
+            release_workspace(workspace)
+
+        if not self.store.finish(claimed.id, self.id, state, result=result, error=error, spans=spans, omitted=omitted):
+            logging.warning(f"Job {claimed.id} went to another worker after its lease ran out, dropping this result")
+            return None
+        # A PDF missing parts that failed to compile is not reused, they may compile next time
+        if state == SUCCEEDED and not omitted and claimed.payload.get("result_key"):
+            self.store.remember_result(claimed.payload["result_key"], result)
+        return state
+
+    def sweep(self):
+        """Remove the blobs no job holds any longer from the blob store."""
+        try:
+            removed = sweep_blobs(self.store, config.BLOB_SWEEP_AGE)
+        except Exception:
+            logging.exception("Could not sweep the blob store")
+            return
+        if removed:
+            logging.info(f"Removed {removed} blobs no job holds from the blob store")
+
+    def _heartbeat(self):
+        next_sweep = time.monotonic() + config.BLOB_SWEEP_INTERVAL
+        while not self._stopped.wait(config.WORKER_HEARTBEAT_SECONDS):
+            if config.BLOB_SWEEP_INTERVAL and time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + config.BLOB_SWEEP_INTERVAL
+                self.sweep()
+            with self._lock:
+                active = list(self._active)
+            for job_id in active:
+                try:
+                    if not self.store.heartbeat(job_id, self.id, config.WORKER_LEASE_SECONDS):
+                        logging.warning(f"Lost the lease on job {job_id}")
+                except Exception:
+                    logging.exception(f"Could not renew the lease on job {job_id}")
@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+from app.utils.file_utils import ensure_directory_exists
+
+
+def link_or_copy(src: str, dst: str):
+    """Hardlink `src` to `dst`, falling back to a copy across filesystems."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ContentCache:
+    """
+    Disk-backed store of file bundles addressed by a content hash.
+
+    Every entry is a directory named after its key holding a flat set of files,
+    in one of 256 shard directories picked by a hash of the key.
+    Entries are evicted least-recently-used first once the cache grows past
+    `max_bytes` or `max_entries` (0 disables a limit). Entries survive restarts;
+    their last use is tracked through the directory's modification time.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 0, max_entries: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # key -> size in bytes, in least-recently-used order
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shard(key: str) -> str:
+        # Keys share fixed prefixes ("conv-", "frag-", ...), so shard on a hash of the whole key
+        return hashlib.sha1(key.encode()).hexdigest()[:2]
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, self._shard(key), key)
+
+    def _load(self):
+        """Build the in-memory index from the entries already on disk."""
+        if self._entries is not None:
+            return
+        found = self._scan()
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self._size = sum(self._entries.values())
+
+    def _scan(self) -> List[tuple]:
+        """(last use, key, size) of every entry on disk, including those other processes stored."""
+        ensure_directory_exists(self.root)
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry_dir = os.path.join(shard_dir, key)
+                if shard != self._shard(key):
+                    # Left by an older layout that sharded on the key's first characters
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                try:
+                    found.append((os.path.getmtime(entry_dir), key, self._entry_size(entry_dir)))
+                except OSError:
+                    continue  # Removed by another process meanwhile
+        return found
+
+    def get(self, key: str, dest_dir: str) -> Optional[List[str]]:
+        """
+        Place the files of entry `key` into `dest_dir` as hardlinks (or copies).
+        Returns the destination paths, or None on a miss.
+        """
+        with self._lock:
+            self._load()
+            entry_dir = self._lookup(key)
+            if entry_dir is None:
+                return None
+            paths = []
+            for name in os.listdir(entry_dir):
+                dst = os.path.join(dest_dir, name)
+                link_or_copy(os.path.join(entry_dir, name), dst)
+                paths.append(dst)
+            return paths
+
+    def get_file(self, key: str, dest_path: str) -> bool:
+        """
+        Place the single file of entry `key` at `dest_path`, under that name.
+        Returns False on a miss.
+        """
+        with self._lock:
+            self._load()
+            entry_dir = self._lookup(key)
+            if entry_dir is None:
+                return False
+            name = os.listdir(entry_dir)[0]
+            link_or_copy(os.path.join(entry_dir, name), dest_path)
+            return True
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Find an entry, count the hit or miss and mark it as recently used."""
+        entry_dir = self._entry_dir(key)
+        exists = os.path.isdir(entry_dir)
+        if key in self._entries and not exists:
+            # Removed from disk behind our back, e.g. by another process
+            self._size -= self._entries.pop(key)
+        elif key not in self._entries and exists:
+            # Stored by another process sharing the cache directory
+            self._entries[key] = self._entry_size(entry_dir)
+            self._size += self._entries[key]
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        os.utime(entry_dir)
+        return entry_dir
+
+    @staticmethod
+    def _entry_size(entry_dir: str) -> int:
+        return sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+
+    def put(self, key: str, files: List[str]):
+        """Store `files` under `key`, then evict old entries to stay within the limits."""
+        with self._lock:
+            self._load()
+            if key in self._entries:
+                if os.path.isdir(self._entry_dir(key)):
+                    # Storing it again counts as a use
+                    self._entries.move_to_end(key)
+                    os.utime(self._entry_dir(key))
+                    return
+                # Removed from disk by another process sharing the cache directory
+                self._size -= self._entries.pop(key)
+            staging = tempfile.mkdtemp(prefix=".put_", dir=self.root)
+            size = 0
+            for path in files:
+                dst = os.path.join(staging, os.path.basename(path))
+                link_or_copy(path, dst)
+                size += os.path.getsize(dst)
+
+            entry_dir = self._entry_dir(key)
+            ensure_directory_exists(os.path.dirname(entry_dir))
+            try:
+                os.rename(staging, entry_dir)
+            except OSError:
+                # Another process stored the same entry first
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+            self._entries[key] = size
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_bytes and self._size > self.max_bytes)
+            or (self.max_entries and len(self._entries) > self.max_entries)
+        ):
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._size -= size
+            self.evictions += 1
+            logging.info(f"Evicted cache entry {key} ({size} bytes) from {self.root}")
+
+    def unused_since(self, timestamp: float) -> List[str]:
+        """Keys of the entries on disk last used before `timestamp`."""
+        with self._lock:
+            return [key for last_use, key, _ in self._scan() if last_use < timestamp]
+
+    def remove(self, key: str):
+        """Remove entry `key`, if there is one."""
+        with self._lock:
+            self._load()
+            if key in self._entries:
+                self._size -= self._entries.pop(key)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._entries = None
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 def ensure_directory_exists(directory):
@@ -5,4 +6,12 @@ def ensure_directory_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
     if not os.access(directory, os.W_OK):
-        raise PermissionError(f"Cannot write to directory: {directory}")
\ No newline at end of file
+        raise PermissionError(f"Cannot write to directory: {directory}")
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
\ No newline at end of file
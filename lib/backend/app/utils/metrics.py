@@ -0,0 +1,125 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, ProcessCollector
+
+# A registry of our own rather than the global default one, so every import of this module gets fresh metrics
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+SPAN_SECONDS = Histogram(
+    "docgen_span_duration_seconds",
+    "Time spent in each pipeline stage and subprocess.",
+    ["span"],
+    buckets=DURATION_BUCKETS,
+    registry=REGISTRY,
+)
+SUBPROCESSES = Counter(
+    "docgen_subprocesses_total",
+    "Subprocesses run, by tool and outcome (ok, failed, timeout or error).",
+    ["tool", "outcome"],
+    registry=REGISTRY,
+)
+JOBS = Counter(
+    "docgen_jobs_total",
+    "Finished jobs, by final state.",
+    ["state"],
+    registry=REGISTRY,
+)
+JOB_SECONDS = Histogram(
+    "docgen_job_duration_seconds",
+    "Time from submitting a job until it finished, by build mode (full or draft).",
+    ["mode"],
+    buckets=DURATION_BUCKETS,
+    registry=REGISTRY,
+)
+JOBS_IN_PROGRESS = Gauge(
+    "docgen_jobs_in_progress",
+    "Jobs currently running on the worker pool.",
+    registry=REGISTRY,
+)
+JOBS_QUEUED = Gauge(
+    "docgen_jobs_queued",
+    "Jobs waiting for a worker.",
+    registry=REGISTRY,
+)
+JOBS_THROTTLED = Counter(
+    "docgen_jobs_throttled_total",
+    "Uploads turned away with 429 because too many jobs were pending.",
+    registry=REGISTRY,
+)
+TOOLS_WAITING = Gauge(
+    "docgen_tool_waiting",
+    "Threads waiting for a free slot to run an external tool.",
+    ["tool"],
+    registry=REGISTRY,
+)
+TOOLS_RUNNING = Gauge(
+    "docgen_tool_running",
+    "External tool processes currently running.",
+    ["tool"],
+    registry=REGISTRY,
+)
+
+# (name, seconds) spans of the job the current thread works on, if any
+_current_spans: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("docgen_spans", default=None)
+
+
+def record_span(name: str, seconds: float, spans: list = None):
+    """Observe a span and attribute it to `spans`, or else to the current job."""
+    SPAN_SECONDS.labels(name).observe(seconds)
+    spans = _current_spans.get() if spans is None else spans
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str, spans: list = None):
+    """Time the enclosed block as span `name`; see `record_span`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, spans)
+
+
+@contextmanager
+def collect_spans(spans: list):
+    """Attribute every span recorded in this context to `spans`, e.g. those of one job."""
+    token = _current_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_spans.reset(token)
+
+
+def run_collecting_spans(func: Callable, *args) -> Tuple[object, List[Tuple[str, float]]]:
+    """
+    Run `func(*args)` and return its result with the spans it recorded.
+    Used in worker processes, whose metrics are not exported; the caller hands
+    the spans to `replay_spans` in the serving process.
+    """
+    spans = []
+    with collect_spans(spans):
+        return func(*args), spans
+
+
+def replay_spans(spans: List[Tuple[str, float]]):
+    for name, seconds in spans:
+        record_span(name, seconds)
+
+
+def summarize_spans(spans: List[Tuple[str, float]]) -> dict:
+    """Total seconds per span name, in order of first appearance."""
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return totals
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Format spans as a Server-Timing header value, which browser dev tools display."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in summarize_spans(spans).items())
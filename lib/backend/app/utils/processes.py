@@ -0,0 +1,88 @@
+import functools
+import os
+import shutil
+import subprocess
+import threading
+from typing import Optional, Tuple
+from app import config
+from app.utils.metrics import SUBPROCESSES, TOOLS_RUNNING, TOOLS_WAITING, span
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+class ToolTimeoutError(RuntimeError):
+    """An external tool ran longer than its wall-clock limit and was killed."""
+
+
+def tool_limits(tool: str) -> Tuple[int, Optional[float]]:
+    """Return how many processes of `tool` may run at once (0 = no limit) and their timeout in seconds."""
+    limits = {
+        "xelatex": (config.XELATEX_CONCURRENCY, config.XELATEX_TIMEOUT),
+        "kpsewhich": (config.KPSEWHICH_CONCURRENCY, config.KPSEWHICH_TIMEOUT),
+    }
+    concurrency, timeout = limits.get(tool, (0, None))
+    return concurrency, timeout or None
+
+
+def _semaphore(tool: str) -> Optional[threading.BoundedSemaphore]:
+    concurrency, _ = tool_limits(tool)
+    if concurrency <= 0:
+        return None
+    with _semaphores_lock:
+        if tool not in _semaphores:
+            _semaphores[tool] = threading.BoundedSemaphore(concurrency)
+        return _semaphores[tool]
+
+
+@functools.lru_cache(maxsize=None)
+def _prlimit() -> Optional[str]:
+    return shutil.which("prlimit")
+
+
+def _limit_memory(args: list) -> list:
+    """
+    Wrap `args` so that the tool starts with its address space capped.
+    A preexec_fn would do it in the forked child, which is not safe in a threaded server;
+    prlimit (or the shell's ulimit) sets the limit and then execs the tool in its place.
+    """
+    limit = config.SUBPROCESS_MEMORY_LIMIT
+    if _prlimit():
+        return [_prlimit(), f"--as={limit}", "--", *args]
+    return ["/bin/sh", "-c", f'ulimit -v {max(limit // 1024, 1)} && exec "$@"', "sh", *args]
+
+
+def run_tool(tool: str, args: list, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Run an external tool like subprocess.run, within the tool's limits:
+    at most its configured number of processes run at once across all jobs,
+    each is killed after its timeout (raising ToolTimeoutError) and its address
+    space is capped at DOCGEN_SUBPROCESS_MEMORY_LIMIT.
+    Every run is timed as a span named after the tool and counted by outcome.
+    """
+    _, timeout = tool_limits(tool)
+    kwargs.setdefault("timeout", timeout)
+    if os.name == "posix" and config.SUBPROCESS_MEMORY_LIMIT > 0:
+        args = _limit_memory(args)
+
+    semaphore = _semaphore(tool)
+    if semaphore is not None:
+        TOOLS_WAITING.labels(tool).inc()
+        semaphore.acquire()
+        TOOLS_WAITING.labels(tool).dec()
+    TOOLS_RUNNING.labels(tool).inc()
+    try:
+        with span(tool):
+            result = subprocess.run(args, **kwargs)
+    except subprocess.TimeoutExpired:
+        SUBPROCESSES.labels(tool, "timeout").inc()
+        raise ToolTimeoutError(f"{tool} did not finish within {kwargs['timeout']} seconds and was killed")
+    except Exception:
+        SUBPROCESSES.labels(tool, "error").inc()
+        raise
+    finally:
+        TOOLS_RUNNING.labels(tool).dec()
+        if semaphore is not None:
+            semaphore.release()
+    SUBPROCESSES.labels(tool, "ok" if result.returncode == 0 else "failed").inc()
+    return result
@@ -0,0 +1,84 @@
+from typing import Callable, Iterable, Optional
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Allowance for multipart boundaries and part headers on top of the file contents
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than `max_bytes` with 413 before they are parsed.
+    A declared Content-Length is checked up front; chunked bodies are counted as they stream in.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        too_large = PlainTextResponse("Request body too large", status_code=413)
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes and not response_started:
+                    # Answer right away and make the app see a disconnected client;
+                    # whatever it tries to send afterwards is dropped
+                    rejected = True
+                    await too_large(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message: Message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracking_send)
+
+
+class AdmissionMiddleware:
+    """
+    Turn uploads to `paths` away with 429 and a Retry-After header while the
+    server is saturated, before their bodies are read. `retry_after` returns
+    the seconds to advertise, or None while new work is admitted.
+    """
+
+    def __init__(self, app: ASGIApp, retry_after: Callable[[], Optional[int]], paths: Iterable[str]):
+        self.app = app
+        self.retry_after = retry_after
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            retry_after = self.retry_after()
+            if retry_after is not None:
+                response = PlainTextResponse(
+                    "Too many documents are being built, try again later",
+                    status_code=429,
+                    headers={"Retry-After": str(retry_after)},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
\ No newline at end of file
@@ -0,0 +1,30 @@
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+def pdf_response(request: Request, path: str, etag: str, background: BackgroundTask = None, headers: dict = None) -> Response:
+    """
+    Serve a generated PDF with a strong ETag, or an empty 304 when the client already has it.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers["ETag"] = etag
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers, background=background)
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename="output.pdf",
+        headers=headers,
+        background=background,
+    )
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import time
+from app import config
+from app.utils.file_utils import ensure_directory_exists
+
+TMPFS_DIR = "/dev/shm"
+WORKSPACE_PREFIX = "job_"
+DONE_MARKER = ".done"
+
+
+def workspace_root() -> str:
+    """Return the directory under which job workspaces are created."""
+    if config.WORKSPACE_USE_TMPFS and os.path.isdir(TMPFS_DIR):
+        return os.path.join(TMPFS_DIR, "document_generator")
+    return config.WORKSPACE_ROOT
+
+
+def create_workspace(root: str = None) -> str:
+    """
+    Create a fresh, private workspace directory for a single job.
+    Expired workspaces of earlier jobs are purged on the way.
+    """
+    root = root or workspace_root()
+    ensure_directory_exists(root)
+    purge_expired_workspaces(root)
+    return tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=root)
+
+
+def release_workspace(workspace: str, retention: int = None):
+    """
+    Release a workspace once its job is finished and the response has been sent.
+    With a retention period the directory is only marked as done and is removed
+    by a later purge.
+    """
+    retention = config.WORKSPACE_RETENTION_SECONDS if retention is None else retention
+    if retention <= 0:
+        shutil.rmtree(workspace, ignore_errors=True)
+        return
+    try:
+        with open(os.path.join(workspace, DONE_MARKER), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+    except OSError:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def purge_expired_workspaces(root: str = None, retention: int = None) -> int:
+    """
+    Remove released workspaces whose retention period has elapsed.
+    Workspaces of jobs that are still running are never touched.
+    Returns the number of removed workspaces.
+    """
+    root = root or workspace_root()
+    retention = config.WORKSPACE_RETENTION_SECONDS if retention is None else retention
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for name in os.listdir(root):
+        if not name.startswith(WORKSPACE_PREFIX):
+            continue
+        marker = os.path.join(root, name, DONE_MARKER)
+        try:
+            released_at = os.path.getmtime(marker)
+        except OSError:
+            continue
+        if now - released_at >= retention:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    return removed
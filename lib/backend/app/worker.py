@@ -0,0 +1,33 @@
+import argparse
+import logging
+import sys
+from typing import List
+from app import config
+from app.services.job_store import open_job_store
+from app.services.warmup import warmup
+from app.services.worker import Worker
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the jobs the API nodes queue in the job store.")
+    parser.add_argument("--store", default=config.JOB_STORE_URL, help="job store URL (default DOCGEN_JOB_STORE)")
+    parser.add_argument("--concurrency", type=int, default=config.WORKER_POOL_SIZE,
+                        help="jobs built at a time (default DOCGEN_WORKER_POOL_SIZE)")
+    args = parser.parse_args(argv)
+
+    try:
+        store = open_job_store(args.store)
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+    if store is None:
+        parser.error("set DOCGEN_JOB_STORE or pass --store")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+    # Jobs can be claimed right away; the warmup only spares the first ones its cost
+    warmup.start()
+    Worker(store, concurrency=args.concurrency).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import base64
+import io
+import os
+import nbformat
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_notebook, new_output
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Pt
+
+# Synthetic inputs are deterministic for the same parameters, so timings taken
+# on different days or machines describe the same work
+
+# Packages the generated LaTeX documents load, cycled through when more are requested
+LATEX_PACKAGES = ["amsmath", "amssymb", "xcolor", "booktabs", "tikz", "listings", "float", "caption"]
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua & 50% of $costs_{total} #1."
+)
+
+
+def make_pptx(path: str, slides: int = 20, depth: int = 3, paragraphs: int = 6, runs: int = 3) -> str:
+    """
+    Write a deck of `slides` title-and-content slides. Every slide holds
+    `paragraphs` bullets nested up to `depth` levels, each made of `runs`
+    alternately bold, italic and underlined runs.
+    """
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for s in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {s + 1}: results & findings"
+        text_frame = slide.placeholders[1].text_frame
+        for p in range(paragraphs):
+            paragraph = text_frame.paragraphs[0] if p == 0 else text_frame.add_paragraph()
+            paragraph.level = p % max(1, depth)
+            for r in range(runs):
+                run = paragraph.add_run()
+                run.text = f"{LOREM[:40 + 10 * r]} "
+                run.font.bold = r % 3 == 0
+                run.font.italic = r % 3 == 1
+                run.font.underline = r % 3 == 2
+                run.font.size = Pt(14 + r)
+    prs.save(path)
+    return path
+
+
+def make_png(width: int = 320, height: int = 240, seed: int = 0) -> bytes:
+    """Return a gradient PNG; different seeds give images with different content."""
+    image = Image.new("RGB", (width, height))
+    image.putdata([
+        ((x + seed * 37) % 256, (y + seed * 91) % 256, (x * y + seed) % 256)
+        for y in range(height) for x in range(width)
+    ])
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_html_table(rows: int = 10, columns: int = 5) -> str:
+    header = "".join(f"<th>column {c}</th>" for c in range(columns))
+    body = "".join(
+        "<tr>" + "".join(f"<td>{r * columns + c}</td>" for c in range(columns)) + "</tr>"
+        for r in range(rows)
+    )
+    return f'<table border="1"><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def make_notebook(path: str, cells: int = 40, png_outputs: int = 5, html_outputs: int = 5,
+                  png_size: tuple = (320, 240)) -> str:
+    """
+    Write a notebook of `cells` alternating markdown and code cells. The first
+    `png_outputs` code cells display a distinct PNG, the next `html_outputs`
+    display an HTML table, and the rest print text.
+    """
+    notebook = new_notebook()
+    code_cells = 0
+    for i in range(cells):
+        if i % 2 == 0:
+            notebook.cells.append(new_markdown_cell(f"## Section {i // 2}\n\n{LOREM}"))
+            continue
+        outputs = []
+        if code_cells < png_outputs:
+            png = base64.b64encode(make_png(*png_size, seed=code_cells)).decode("ascii")
+            outputs.append(new_output("display_data", data={"image/png": png, "text/plain": "<Figure>"}))
+        elif code_cells < png_outputs + html_outputs:
+            outputs.append(new_output("display_data", data={"text/html": make_html_table(), "text/plain": "<Table>"}))
+        else:
+            outputs.append(new_output("stream", name="stdout", text=f"result {i}\n"))
+        notebook.cells.append(new_code_cell(f"result = compute({i})\nprint(result)", outputs=outputs, execution_count=code_cells + 1))
+        code_cells += 1
+    with open(path, "w", encoding="utf-8") as f:
+        nbformat.write(notebook, f)
+    return path
+
+
+def make_latex(path: str, sections: int = 20, paragraphs: int = 5, packages: int = 4) -> str:
+    """
+    Write a standalone LaTeX document with `sections` sections of `paragraphs`
+    paragraphs, lists and equations, loading `packages` packages.
+    """
+    lines = [r"\documentclass{article}"]
+    lines += [rf"\usepackage{{{LATEX_PACKAGES[i % len(LATEX_PACKAGES)]}}}" for i in range(packages)]
+    lines += [r"\newcommand{\R}{\mathbb{R}}", r"\begin{document}"]
+    for s in range(sections):
+        lines.append(rf"\section{{Section {s + 1}}}\label{{sec:{s}}}")
+        for p in range(paragraphs):
+            lines.append(f"Paragraph {p + 1} of section {s + 1}, see Section~\\ref{{sec:{(s + 1) % sections}}}. "
+                         "Lorem ipsum dolor sit amet, consectetur adipiscing elit.")
+            lines.append("")
+        lines += [r"\begin{itemize}", r"\item First point", r"\item Second point", r"\end{itemize}"]
+        lines.append(rf"\begin{{equation}} x_{{{s}}} = \sum_{{i=1}}^{{n}} i^2 \end{{equation}}")
+    lines.append(r"\end{document}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def make_notebook_batch(directory: str, notebooks: int = 10, cells: int = 6) -> list:
+    """Write `notebooks` small text-only notebooks, as uploaded by a class or a report series."""
+    return [
+        make_notebook(os.path.join(directory, f"batch_{n}.ipynb"), cells=cells, png_outputs=0, html_outputs=0)
+        for n in range(notebooks)
+    ]
+
+
+def make_inputs(directory: str, params: dict) -> dict:
+    """Generate one input of every kind into `directory`; returns their paths by kind."""
+    return {
+        "latex": make_latex(os.path.join(directory, "bench.tex"), **params["latex"]),
+        "ppt": make_pptx(os.path.join(directory, "bench.pptx"), **params["ppt"]),
+        "notebook": make_notebook(os.path.join(directory, "bench.ipynb"), **params["notebook"]),
+        "notebook_batch": make_notebook_batch(directory, **params["notebook_batch"]),
+    }
@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+import psutil
+from benchmarks.generators import make_latex, make_notebook, make_pptx
+
+# Latency histogram bucket bounds in seconds; the last bucket is open-ended
+HISTOGRAM_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Upload field and content type of every fixture kind
+UPLOADS = {
+    "latex": ("latex", "application/x-tex"),
+    "ppt": ("ppt", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    "notebook": ("notebook", "application/x-ipynb+json"),
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse a request mix like "latex=3,ppt=1,notebook=1" into weights per fixture kind."""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in UPLOADS:
+            raise ValueError(f"unknown upload kind {kind!r}, expected one of {', '.join(UPLOADS)}")
+        weights[kind] = float(weight or 1)
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("the request mix needs at least one positive weight")
+    return weights
+
+
+def make_fixtures(directory: str) -> Dict[str, str]:
+    """Generate one small input of every kind."""
+    return {
+        "latex": make_latex(os.path.join(directory, "load.tex"), sections=5, paragraphs=3, packages=2),
+        "ppt": make_pptx(os.path.join(directory, "load.pptx"), slides=5, depth=3, paragraphs=4, runs=2),
+        "notebook": make_notebook(os.path.join(directory, "load.ipynb"), cells=10, png_outputs=0, html_outputs=0),
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def histogram(latencies: List[float]) -> List[dict]:
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for latency in latencies:
+        index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS) if latency <= bound), len(HISTOGRAM_BUCKETS))
+        counts[index] += 1
+    return [
+        {"le": HISTOGRAM_BUCKETS[i] if i < len(HISTOGRAM_BUCKETS) else None, "count": count}
+        for i, count in enumerate(counts)
+    ]
+
+
+class ResourceSampler:
+    """
+    Samples the resident memory of this process and all its descendants in the
+    background, and remembers every descendant process it has seen.
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.seen = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="docgen-loadtest-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = 0
+            for process in [self.process] + self.process.children(recursive=True):
+                try:
+                    rss += process.memory_info().rss
+                    if process.pid != self.process.pid:
+                        self.seen.add((process.pid, process.create_time()))
+                except psutil.Error:
+                    continue  # Exited between listing and sampling
+            self.peak_rss = max(self.peak_rss, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class SpawnCounter:
+    """Counts every subprocess this process starts, through the subprocess.Popen audit event."""
+
+    def __init__(self):
+        self.count = 0
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if event == "subprocess.Popen":
+            self.count += 1
+
+
+async def send_request(client, kind: str, fixture: str, results: list):
+    field, content_type = UPLOADS[kind]
+    start = time.perf_counter()
+    try:
+        with open(fixture, "rb") as f:
+            response = await client.post("/process/", files=[(field, (os.path.basename(fixture), f.read(), content_type))])
+        status = response.status_code
+    except Exception as e:
+        status = type(e).__name__
+    results.append({"kind": kind, "status": status, "latency": time.perf_counter() - start})
+
+
+async def run_load(client, fixtures: Dict[str, str], weights: Dict[str, float], requests: int,
+                   concurrency: int = None, rate: float = None, seed: int = 0) -> list:
+    """
+    Send `requests` uploads drawn from the weighted mix, either closed-loop with
+    `concurrency` clients sending back to back, or open-loop with Poisson
+    arrivals at `rate` requests per second.
+    """
+    rng = random.Random(seed)
+    kinds = rng.choices(list(weights), weights=list(weights.values()), k=requests)
+    results = []
+    if rate:
+        tasks = []
+        for kind in kinds:
+            tasks.append(asyncio.create_task(send_request(client, kind, fixtures[kind], results)))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+    else:
+        queue = list(reversed(kinds))
+
+        async def worker():
+            while queue:
+                kind = queue.pop()
+                await send_request(client, kind, fixtures[kind], results)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency or 1))))
+    return results
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    latencies = sorted(result["latency"] for result in results)
+    statuses = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    errors = sum(1 for result in results if result["status"] not in (200, 304))
+    by_kind = {}
+    for kind in sorted({result["kind"] for result in results}):
+        kind_latencies = sorted(result["latency"] for result in results if result["kind"] == kind)
+        by_kind[kind] = {
+            "requests": len(kind_latencies),
+            "p50": percentile(kind_latencies, 0.5),
+            "p99": percentile(kind_latencies, 0.99),
+        }
+    return {
+        "requests": len(results),
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(results) if results else 0.0,
+        "statuses": statuses,
+        "latency": {
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        },
+        "by_kind": by_kind,
+        "histogram": histogram(latencies),
+    }
+
+
+def print_report(report: dict):
+    latency = report["latency"]
+    print(f"requests      {report['requests']} in {report['elapsed']:.2f} s ({report['throughput']:.2f} req/s)")
+    print(f"errors        {report['error_rate']:.1%}  statuses {report['statuses']}")
+    print(f"latency       p50 {latency['p50'] * 1000:.0f} ms  p90 {latency['p90'] * 1000:.0f} ms  "
+          f"p99 {latency['p99'] * 1000:.0f} ms  max {latency['max'] * 1000:.0f} ms")
+    for kind, stats in report["by_kind"].items():
+        print(f"  {kind:10}  {stats['requests']:5} requests  p50 {stats['p50'] * 1000:.0f} ms  p99 {stats['p99'] * 1000:.0f} ms")
+    print(f"peak RSS      {report['peak_rss_bytes'] / 2 ** 20:.1f} MiB (this process and its children)")
+    print(f"subprocesses  {report['subprocesses_per_request']:.2f} spawned per request, "
+          f"{report['child_processes_seen']} child processes seen")
+    width = max((bucket["count"] for bucket in report["histogram"]), default=0) or 1
+    for bucket in report["histogram"]:
+        bound = f"<= {bucket['le'] * 1000:.0f} ms" if bucket["le"] is not None else "> 60000 ms"
+        print(f"  {bound:>12} {bucket['count']:6} {'#' * round(40 * bucket['count'] / width)}")
+
+
+async def main_async(args) -> dict:
+    # Imported here so the cache settings from the command line apply to the app
+    import httpx
+    from app.main import app
+
+    weights = parse_mix(args.mix)
+    fixtures_dir = tempfile.mkdtemp(prefix="docgen-load-")
+    spawns = SpawnCounter()
+    try:
+        fixtures = make_fixtures(fixtures_dir)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://docgen", timeout=args.timeout) as client:
+            with ResourceSampler() as sampler:
+                start = time.perf_counter()
+                results = await run_load(client, fixtures, weights, args.requests, args.concurrency, args.rate, args.seed)
+                elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    report = summarize(results, elapsed)
+    report.update({
+        "mix": weights,
+        "concurrency": None if args.rate else args.concurrency,
+        "rate": args.rate,
+        "cold": args.cold,
+        "peak_rss_bytes": sampler.peak_rss,
+        "subprocesses_spawned": spawns.count,
+        "subprocesses_per_request": spawns.count / len(results) if results else 0.0,
+        "child_processes_seen": len(sampler.seen),
+    })
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive concurrent uploads through /process/ of the app, in process.")
+    parser.add_argument("--requests", type=int, default=50, help="total number of requests (default 50)")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients sending back to back (default 4)")
+    parser.add_argument("--rate", type=float, help="open-loop Poisson arrivals per second instead of fixed concurrency")
+    parser.add_argument("--mix", default="latex=1,ppt=1,notebook=1", help="weights of the upload kinds (default equal)")
+    parser.add_argument("--cold", action="store_true", help="disable the conversion, fragment, image and PDF caches")
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the request mix and arrival times")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.cold:
+        for name in ("DOCGEN_CONVERSION_CACHE", "DOCGEN_FRAGMENT_CACHE", "DOCGEN_IMAGE_CACHE", "DOCGEN_RESULT_CACHE"):
+            os.environ[name] = "0"
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+from unittest import mock
+from app import config
+from app.services import jupyter_processing
+from app.services.draft import DraftSettings
+from app.services.file_processing import build_pdf
+from app.services.jupyter_processing import convert_jupyter_to_latex
+from app.services.latex_processing import compile_latex_to_pdf, is_package_available, merge_latex_files, toolchain_version
+from app.services.ppt_processing import convert_pptx_to_latex
+from app.services.tex_packages import package_index
+from benchmarks.generators import LATEX_PACKAGES, make_inputs
+
+# Input sizes of the generated workloads
+SIZES = {
+    "small": {
+        "latex": {"sections": 5, "paragraphs": 3, "packages": 2},
+        "ppt": {"slides": 5, "depth": 2, "paragraphs": 4, "runs": 2},
+        "notebook": {"cells": 10, "png_outputs": 1, "html_outputs": 1},
+        "notebook_batch": {"notebooks": 10, "cells": 6},
+    },
+    "medium": {
+        "latex": {"sections": 40, "paragraphs": 5, "packages": 4},
+        "ppt": {"slides": 40, "depth": 4, "paragraphs": 6, "runs": 3},
+        "notebook": {"cells": 80, "png_outputs": 10, "html_outputs": 5},
+        "notebook_batch": {"notebooks": 25, "cells": 6},
+    },
+    "large": {
+        "latex": {"sections": 200, "paragraphs": 10, "packages": 8},
+        "ppt": {"slides": 200, "depth": 8, "paragraphs": 10, "runs": 5},
+        "notebook": {"cells": 400, "png_outputs": 50, "html_outputs": 20},
+        "notebook_batch": {"notebooks": 100, "cells": 6},
+    },
+}
+
+STAGES = [
+    "import_app",
+    "convert_pptx_to_latex",
+    "convert_jupyter_to_latex",
+    "convert_notebook_batch",
+    "convert_notebook_batch_fresh_exporter",
+    "merge_latex_files",
+    "is_package_available",
+    "compile_latex_to_pdf",
+    "build_pdf_full",
+    "build_pdf_draft",
+]
+
+# Seconds a draft build of the inputs may take (median) before the run fails, see --draft-target
+DRAFT_LATENCY_TARGET = 5.0
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stages faster than this are too noisy to flag as regressions
+MIN_DELTA_SECONDS = 0.005
+
+
+class SkipStage(Exception):
+    """The stage cannot run on this machine, e.g. because XeLaTeX is not installed."""
+
+
+def _workdir(root: str, name: str) -> str:
+    path = os.path.join(root, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def stage_functions(inputs: dict, root: str) -> Dict[str, Callable[[], None]]:
+    """Return one callable per stage; each run works in a fresh directory under `root`."""
+    fragments = _workdir(root, "fragments")
+    convert_pptx_to_latex(inputs["ppt"], fragments)
+    merge_inputs = [inputs["latex"], os.path.join(fragments, "bench.tex")]
+
+    def import_app():
+        # A fresh interpreter, as when a worker starts
+        subprocess.run([sys.executable, "-c", "import app.main"], cwd=BACKEND_DIR, check=True)
+
+    def convert_pptx():
+        convert_pptx_to_latex(inputs["ppt"], _workdir(root, "pptx"))
+
+    def convert_notebook():
+        convert_jupyter_to_latex(inputs["notebook"], _workdir(root, "notebook"))
+
+    def convert_batch():
+        output_dir = _workdir(root, "batch")
+        for notebook in inputs["notebook_batch"]:
+            convert_jupyter_to_latex(notebook, output_dir)
+
+    def convert_batch_fresh_exporter():
+        # Builds a LatexExporter for every notebook, as before exporters were reused
+        fresh = lambda: contextlib.nullcontext(jupyter_processing.build_latex_exporter())
+        with mock.patch.object(jupyter_processing, "latex_exporter", fresh):
+            convert_batch()
+
+    def merge():
+        merge_latex_files(merge_inputs, os.path.join(_workdir(root, "merge"), "merged.tex"))
+
+    def package_lookups():
+        package_index.refresh()  # Time a cold index, as after a restart
+        for name in LATEX_PACKAGES + ["missingpkg"]:
+            is_package_available(name)
+
+    def compile_pdf():
+        if shutil.which("xelatex") is None:
+            raise SkipStage("xelatex is not installed")
+        output_dir = _workdir(root, "compile")
+        merged = os.path.join(output_dir, "merged.tex")
+        merge_latex_files(merge_inputs, merged)
+        success, message = compile_latex_to_pdf(merged, output_dir)
+        if not success:
+            raise RuntimeError(message)
+
+    def build(draft: bool):
+        if shutil.which("xelatex") is None:
+            raise SkipStage("xelatex is not installed")
+        workspace = _workdir(root, "draft" if draft else "full")
+        file_paths = {"digests": {}, "names": {}, "draft": DraftSettings() if draft else None}
+        for file_type in ("latex", "ppt", "notebook"):
+            path = os.path.join(workspace, os.path.basename(inputs[file_type]))
+            shutil.copy(inputs[file_type], path)
+            file_paths[file_type] = [path]
+        # Every run does the whole build, as for a new upload
+        with mock.patch.multiple(config, CONVERSION_CACHE_ENABLED=False, FRAGMENT_CACHE_ENABLED=False,
+                                 RESULT_CACHE_ENABLED=False):
+            build_pdf(file_paths, workspace)
+
+    return {
+        "import_app": import_app,
+        "convert_pptx_to_latex": convert_pptx,
+        "convert_jupyter_to_latex": convert_notebook,
+        "convert_notebook_batch": convert_batch,
+        "convert_notebook_batch_fresh_exporter": convert_batch_fresh_exporter,
+        "merge_latex_files": merge,
+        "is_package_available": package_lookups,
+        "compile_latex_to_pdf": compile_pdf,
+        "build_pdf_full": lambda: build(draft=False),
+        "build_pdf_draft": lambda: build(draft=True),
+    }
+
+
+def time_stage(func: Callable[[], None], repeat: int) -> dict:
+    """Run a stage `repeat` times; failures and skips are recorded instead of raised."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except SkipStage as e:
+            return {"skipped": str(e)}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+        runs.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "mean": statistics.mean(runs),
+        "runs": runs,
+    }
+
+
+def run_benchmarks(size: str = "small", repeat: int = 3, stages: List[str] = None) -> dict:
+    """Generate the inputs for `size` and time every selected stage on them."""
+    params = SIZES[size]
+    root = tempfile.mkdtemp(prefix="docgen-bench-")
+    try:
+        inputs = make_inputs(root, params)
+        functions = stage_functions(inputs, root)
+        results = {}
+        for stage in stages or STAGES:
+            results[stage] = time_stage(functions[stage], repeat)
+            print(f"{stage:28} {format_result(results[stage])}", file=sys.stderr)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "size": size,
+        "params": params,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "toolchain": toolchain_version(),
+        "stages": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    if "median" in result:
+        return f"median {result['median'] * 1000:9.1f} ms   min {result['min'] * 1000:9.1f} ms"
+    if "skipped" in result:
+        return f"skipped ({result['skipped']})"
+    return f"failed ({result['error']})"
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """
+    Compare two benchmark results. Returns a message for every stage whose median
+    grew by more than `tolerance` (0.2 = 20%) and MIN_DELTA_SECONDS, or that ran
+    in the baseline but fails now.
+    """
+    regressions = []
+    if baseline.get("size") != current.get("size"):
+        regressions.append(f"baseline was taken with size {baseline.get('size')!r}, not {current.get('size')!r}")
+    for stage, before in baseline.get("stages", {}).items():
+        after = current.get("stages", {}).get(stage)
+        if after is None or "median" not in before:
+            continue
+        if "error" in after:
+            regressions.append(f"{stage}: {after['error']}")
+        elif "median" in after:
+            delta = after["median"] - before["median"]
+            if delta > MIN_DELTA_SECONDS and after["median"] > before["median"] * (1 + tolerance):
+                regressions.append(
+                    f"{stage}: median {before['median'] * 1000:.1f} ms -> {after['median'] * 1000:.1f} ms "
+                    f"(+{delta / before['median']:.0%})"
+                )
+    return regressions
+
+
+def check_draft(results: dict, target: float) -> List[str]:
+    """
+    Report how much faster a draft build is than a full one. Returns a message
+    if the draft build's median missed the latency target.
+    """
+    stages = results.get("stages", {})
+    full, draft = stages.get("build_pdf_full", {}), stages.get("build_pdf_draft", {})
+    if "median" in full and "median" in draft:
+        print(f"Draft builds are {full['median'] / draft['median']:.1f}x faster than full builds.", file=sys.stderr)
+    if "median" in draft and draft["median"] > target:
+        return [f"build_pdf_draft: median {draft['median']:.2f} s misses the {target:.2f} s draft latency target"]
+    return []
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time every stage of the document pipeline on synthetic inputs.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the median is compared")
+    parser.add_argument("--stages", help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--output", help="write the results to this JSON file, e.g. to record a baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a JSON baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage regresses (default 0.2)")
+    parser.add_argument("--draft-target", type=float, default=DRAFT_LATENCY_TARGET,
+                        help=f"seconds a draft build may take (default {DRAFT_LATENCY_TARGET})")
+    args = parser.parse_args(argv)
+
+    stages = args.stages.split(",") if args.stages else None
+    unknown = set(stages or []) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmarks(args.size, max(1, args.repeat), stages)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+    regressions = check_draft(results, args.draft_target)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions += compare(baseline, results, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if regressions:
+        return 1
+    if args.compare:
+        print("No regressions against the baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
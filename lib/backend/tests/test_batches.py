@@ -0,0 +1,223 @@
+import unittest
+import asyncio
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock
+from backend.app.services import batches
+from backend.app.services.batches import BatchError, BatchManager, extract_archive, infer_documents, plan_documents, stream_archive
+from backend.app.services.jobs import FAILED, SUCCEEDED, JobManager
+
+class FakeUpload:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.size = len(data)
+        self.file = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self.file.read(size)
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return path
+
+class TestExtractArchive(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.destination = os.path.join(self.test_dir, "inputs")
+        os.makedirs(self.destination)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_zip(self):
+        archive = make_zip(os.path.join(self.test_dir, "a.zip"), {
+            "report/intro.tex": "intro", "deck.pptx": "deck", ".hidden": "x", "__MACOSX/report/._intro.tex": "x",
+        })
+        self.assertEqual(sorted(extract_archive(archive, self.destination)), ["deck.pptx", "report/intro.tex"])
+        with open(os.path.join(self.destination, "report", "intro.tex")) as f:
+            self.assertEqual(f.read(), "intro")
+
+    def test_rejects_paths_outside_the_destination(self):
+        for name in ["../escape.tex", "/etc/escape.tex", "report/../../escape.tex"]:
+            with self.subTest(name=name):
+                archive = make_zip(os.path.join(self.test_dir, "evil.zip"), {name: "x"})
+                with self.assertRaises(BatchError):
+                    extract_archive(archive, self.destination)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "escape.tex")))
+
+    def test_tar_skips_links(self):
+        archive = os.path.join(self.test_dir, "a.tar.gz")
+        with tarfile.open(archive, "w:gz") as tar:
+            info = tarfile.TarInfo("doc/main.tex")
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"main"))
+            link = tarfile.TarInfo("doc/passwd.tex")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "/etc/passwd"
+            tar.addfile(link)
+        self.assertEqual(extract_archive(archive, self.destination), ["doc/main.tex"])
+        self.assertFalse(os.path.lexists(os.path.join(self.destination, "doc", "passwd.tex")))
+
+    def test_uncompressed_size_limit(self):
+        archive = make_zip(os.path.join(self.test_dir, "bomb.zip"), {"a.tex": "0" * 4096})
+        with mock.patch.object(batches.config, "MAX_UPLOAD_FILE_BYTES", 1024):
+            with self.assertRaises(batches.UploadTooLargeError):
+                extract_archive(archive, self.destination)
+
+    def test_not_an_archive(self):
+        path = os.path.join(self.test_dir, "plain.txt")
+        with open(path, "w") as f:
+            f.write("plain text")
+        with self.assertRaises(BatchError):
+            extract_archive(path, self.destination)
+
+class TestPlanDocuments(unittest.TestCase):
+    def setUp(self):
+        self.inputs = tempfile.mkdtemp()
+        self.paths = ["report/b.tex", "report/a.tex", "report/deck.pptx", "notes.ipynb", "shared/logo.png", "readme.md"]
+        for path in self.paths:
+            os.makedirs(os.path.join(self.inputs, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(self.inputs, path), "w") as f:
+                f.write(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.inputs)
+
+    def test_infer_documents(self):
+        documents = {document.name: document for document in infer_documents(self.inputs, self.paths, {})}
+        self.assertEqual(sorted(documents), ["notes", "report"])
+        report = documents["report"].sources
+        self.assertEqual([os.path.basename(path) for path in report["latex"]], ["a.tex", "b.tex"])
+        self.assertEqual([os.path.basename(path) for path in report["ppt"]], ["deck.pptx"])
+        self.assertEqual(documents["notes"].sources["notebook"], [os.path.join(self.inputs, "notes.ipynb")])
+
+    def test_manifest(self):
+        manifest = json.dumps({"documents": [
+            {"name": "full", "latex": ["report/a.tex"], "ppt": "report/deck.pptx"},
+            {"name": "preview", "notebook": ["notes.ipynb"], "mode": "draft", "pages": 2},
+        ]})
+        documents = plan_documents(self.inputs, self.paths, manifest, {"mode": None, "pages": None})
+        self.assertEqual([document.name for document in documents], ["full", "preview"])
+        self.assertIsNone(documents[0].draft)
+        self.assertEqual(documents[1].draft.pages, 2)
+
+    def test_invalid_manifests(self):
+        cases = {
+            "not json": "{",
+            "no documents": "{}",
+            "missing file": '{"documents": [{"name": "a", "latex": ["missing.tex"]}]}',
+            "escaping path": '{"documents": [{"name": "a", "latex": ["../report/a.tex"]}]}',
+            "bad name": '{"documents": [{"name": "../a", "latex": ["report/a.tex"]}]}',
+            "no sources": '{"documents": [{"name": "a"}]}',
+            "unknown field": '{"documents": [{"name": "a", "latex": ["report/a.tex"], "colour": 1}]}',
+            "bad option": '{"documents": [{"name": "a", "latex": ["report/a.tex"], "pages": "2"}]}',
+            "bad mode": '{"documents": [{"name": "a", "latex": ["report/a.tex"], "mode": "fast"}]}',
+            "duplicate": '{"documents": [{"name": "a", "latex": ["report/a.tex"]}, {"name": "a", "latex": ["report/b.tex"]}]}',
+        }
+        for case, manifest in cases.items():
+            with self.subTest(case=case):
+                with self.assertRaises(BatchError):
+                    plan_documents(self.inputs, self.paths, manifest, {})
+
+    def test_document_limit(self):
+        with mock.patch.object(batches.config, "MAX_BATCH_DOCUMENTS", 1):
+            with self.assertRaises(BatchError):
+                plan_documents(self.inputs, self.paths, None, {})
+
+class TestBatchManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.jobs = JobManager(max_workers=2, job_ttl=3600, workspace_root=self.root)
+        self.manager = BatchManager(concurrency=2, ttl=3600, workspace_root=self.root)
+        self.builds = []
+        patches = [
+            mock.patch.object(batches, "job_manager", self.jobs),
+            mock.patch.object(batches, "schedule_build", self.fake_schedule_build),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.jobs.shutdown()
+        shutil.rmtree(self.root)
+
+    async def fake_schedule_build(self, job, file_paths):
+        self.builds.append(file_paths)
+        if any("broken" in name for name in file_paths["names"].values()):
+            self.jobs.fail(job, "compilation failed")
+            return
+        result_path = os.path.join(job.workspace, "merged.pdf")
+        with open(result_path, "wb") as f:
+            f.write(b"%PDF-1.4 " + ",".join(sorted(file_paths["names"].values())).encode())
+        self.jobs.complete(job, result_path)
+
+    async def test_batch_archive(self):
+        archive = make_zip(os.path.join(self.root, "batch.zip"), {
+            "report/intro.tex": "intro", "report/shared.tex": "shared", "other/shared.tex": "shared",
+            "broken/broken.tex": "x",
+        })
+        with open(archive, "rb") as f:
+            upload = FakeUpload("batch.zip", f.read())
+        batch = await self.manager.submit(upload, [FakeUpload("extra.tex", b"extra")], None, {})
+        self.assertEqual([document.name for document in batch.documents], ["broken", "extra", "other", "report"])
+
+        offloaded = []
+        run_in_threadpool = batches.run_in_threadpool
+        async def recording_run_in_threadpool(func, *args):
+            offloaded.append(func)
+            return await run_in_threadpool(func, *args)
+
+        with mock.patch.object(batches, "run_in_threadpool", recording_run_in_threadpool):
+            streamed = b"".join([chunk async for chunk in stream_archive(batch)])
+        self.assertIn(batches._copy_chunk, offloaded)
+        self.assertIn(batches._finish_archive, offloaded)
+
+        self.assertTrue(batch.finished)
+        states = {document.name: document.state for document in batch.documents}
+        self.assertEqual(states, {"broken": FAILED, "extra": SUCCEEDED, "other": SUCCEEDED, "report": SUCCEEDED})
+        report = batch.document("report")
+        self.assertEqual(self.jobs.get(report.job.id), report.job)
+
+        with zipfile.ZipFile(io.BytesIO(streamed)) as result:
+            self.assertEqual(sorted(result.namelist()), ["batch.json", "extra.pdf", "other.pdf", "report.pdf"])
+            self.assertEqual(result.read("report.pdf"), b"%PDF-1.4 report/intro.tex,report/shared.tex")
+            summary = json.loads(result.read("batch.json"))
+        self.assertEqual(summary["batch_id"], batch.id)
+        self.assertEqual({document["name"]: document["error"] for document in summary["documents"]}["broken"], "compilation failed")
+
+        removed = self.manager.remove(batch.id)
+        self.assertIs(removed, batch)
+        self.assertIsNone(self.jobs.get(report.job.id))
+        self.assertIsNone(self.manager.get(batch.id))
+
+    async def test_batch_that_stops_early_finishes_every_document(self):
+        def unreadable(path):
+            raise OSError(f"Could not read {path}")
+
+        with mock.patch.object(batches, "file_digest", unreadable):
+            batch = await self.manager.submit(None, [FakeUpload("a.tex", b"a"), FakeUpload("b.tex", b"b")], None, {})
+            for document in batch.documents:
+                await asyncio.wait_for(document.done.wait(), 5)
+
+        self.assertTrue(batch.finished)
+        self.assertEqual([document.state for document in batch.documents], [FAILED, FAILED])
+        self.assertEqual(self.builds, [])
+        self.assertIs(self.manager.remove(batch.id), batch)
+
+    async def test_invalid_batch_leaves_nothing_behind(self):
+        with self.assertRaises(BatchError):
+            await self.manager.submit(None, [FakeUpload("notes.txt", b"x")], None, {})
+        with self.assertRaises(BatchError):
+            await self.manager.submit(None, [FakeUpload("a.tex", b"x"), FakeUpload("dir/a.tex", b"y")], None, {})
+        self.assertEqual(os.listdir(self.root), [])
+
+if __name__ == "__main__":
+    unittest.main()
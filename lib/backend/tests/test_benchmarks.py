@@ -0,0 +1,54 @@
+import unittest
+import os
+import tempfile
+import shutil
+import nbformat
+from pptx import Presentation
+from backend.benchmarks.generators import make_latex, make_notebook, make_pptx
+from backend.benchmarks.run import compare
+
+def result(size="small", **medians):
+    stages = {}
+    for stage, median in medians.items():
+        stages[stage] = median if isinstance(median, dict) else {"median": median}
+    return {"size": size, "stages": stages}
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generators(self):
+        deck = Presentation(make_pptx(os.path.join(self.test_dir, "deck.pptx"), slides=3, depth=3, paragraphs=4, runs=2))
+        self.assertEqual(len(deck.slides), 3)
+        self.assertEqual([p.level for p in deck.slides[0].placeholders[1].text_frame.paragraphs], [0, 1, 2, 0])
+
+        notebook_path = make_notebook(os.path.join(self.test_dir, "notebook.ipynb"), cells=10, png_outputs=2, html_outputs=1)
+        notebook = nbformat.read(notebook_path, as_version=4)
+        nbformat.validate(notebook)
+        outputs = [output for cell in notebook.cells if cell.cell_type == "code" for output in cell.outputs]
+        self.assertEqual(sum("image/png" in output.get("data", {}) for output in outputs), 2)
+        self.assertEqual(sum("text/html" in output.get("data", {}) for output in outputs), 1)
+
+        with open(make_latex(os.path.join(self.test_dir, "doc.tex"), sections=4, packages=3)) as f:
+            document = f.read()
+        self.assertEqual(document.count("\\section{"), 4)
+        self.assertEqual(document.count("\\usepackage"), 3)
+
+    def test_compare(self):
+        baseline = result(merge_latex_files=0.100, convert_pptx_to_latex=0.001, compile_latex_to_pdf={"skipped": "no xelatex"})
+
+        self.assertEqual(compare(baseline, result(merge_latex_files=0.110, convert_pptx_to_latex=0.004), 0.2), [])
+
+        regressions = compare(baseline, result(merge_latex_files=0.150, convert_pptx_to_latex={"error": "RuntimeError: boom"}), 0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("merge_latex_files: median 100.0 ms -> 150.0 ms"))
+        self.assertIn("boom", regressions[1])
+
+        self.assertEqual(len(compare(baseline, result(size="large", merge_latex_files=0.100), 0.2)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
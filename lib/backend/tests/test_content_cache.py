@@ -0,0 +1,102 @@
+import unittest
+import os
+import tempfile
+import shutil
+from backend.app.utils.content_cache import ContentCache
+
+class TestContentCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_dir, "cache")
+        self.out_dir = os.path.join(self.test_dir, "out")
+        os.makedirs(self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def make_file(self, name, size):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_get_and_put(self):
+        cache = ContentCache(self.cache_dir)
+        self.assertIsNone(cache.get("aa11", self.out_dir))
+
+        cache.put("aa11", [self.make_file("doc.tex", 10), self.make_file("doc_img.png", 20)])
+        paths = cache.get("aa11", self.out_dir)
+
+        self.assertEqual(sorted(os.path.basename(p) for p in paths), ["doc.tex", "doc_img.png"])
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, "doc_img.png")))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["bytes"], 30)
+
+    def test_lru_eviction_by_size(self):
+        cache = ContentCache(self.cache_dir, max_bytes=25)
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        cache.put("bb22", [self.make_file("b.tex", 10)])
+        cache.get("aa11", self.out_dir)
+        cache.put("cc33", [self.make_file("c.tex", 10)])
+
+        self.assertIsNotNone(cache.get("aa11", self.out_dir))
+        self.assertIsNone(cache.get("bb22", self.out_dir))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_eviction_by_entry_count(self):
+        cache = ContentCache(self.cache_dir, max_entries=1)
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        cache.put("bb22", [self.make_file("b.tex", 10)])
+
+        self.assertIsNone(cache.get("aa11", self.out_dir))
+        self.assertIsNotNone(cache.get("bb22", self.out_dir))
+
+    def test_remove(self):
+        cache = ContentCache(self.cache_dir)
+        other = ContentCache(self.cache_dir)
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        other.remove("aa11")
+        other.remove("bb22")
+
+        self.assertIsNone(cache.get("aa11", self.out_dir))
+        # Stored again although this instance had indexed it before another one removed it
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        self.assertIsNotNone(cache.get("aa11", self.out_dir))
+
+    def test_unused_since(self):
+        cache = ContentCache(self.cache_dir)
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        cache.put("bb22", [self.make_file("b.tex", 10)])
+        os.utime(cache._entry_dir("aa11"), (1, 1))
+
+        self.assertEqual(ContentCache(self.cache_dir).unused_since(1000), ["aa11"])
+        # Storing an entry again counts as using it
+        cache.put("aa11", [self.make_file("a.tex", 10)])
+        self.assertEqual(cache.unused_since(1000), [])
+
+    def test_prefixed_keys_spread_across_shards(self):
+        cache = ContentCache(self.cache_dir)
+        for i in range(32):
+            cache.put(f"latex-v1-{i:064x}", [self.make_file("a.tex", 10)])
+        self.assertGreater(len(os.listdir(self.cache_dir)), 8)
+        self.assertEqual(ContentCache(self.cache_dir).stats()["entries"], 32)
+
+    def test_entries_of_the_old_layout_are_dropped(self):
+        old_entry = os.path.join(self.cache_dir, "la", "latex-v1-aa11")
+        os.makedirs(old_entry)
+        shutil.copy(self.make_file("a.tex", 10), old_entry)
+
+        self.assertEqual(ContentCache(self.cache_dir).stats()["entries"], 0)
+        self.assertFalse(os.path.exists(old_entry))
+
+    def test_entries_survive_restart(self):
+        ContentCache(self.cache_dir).put("aa11", [self.make_file("a.tex", 10)])
+
+        cache = ContentCache(self.cache_dir)
+        self.assertIsNotNone(cache.get("aa11", self.out_dir))
+        self.assertEqual(cache.stats()["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
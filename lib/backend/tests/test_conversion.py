@@ -0,0 +1,105 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from pptx import Presentation
+from backend.app.services import conversion
+from backend.app.utils.content_cache import ContentCache
+
+class TestConversion(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.original_cache = conversion.conversion_cache
+        conversion.conversion_cache = ContentCache(os.path.join(self.test_dir, "cache"))
+
+        self.pptx_path = self.make_pptx("ppt_0.pptx", "Results")
+
+    def make_pptx(self, name, title):
+        prs = Presentation()
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = title
+        slide.placeholders[1].text_frame.text = "First point"
+        path = os.path.join(self.test_dir, name)
+        prs.save(path)
+        return path
+
+    def tearDown(self):
+        conversion.conversion_cache = self.original_cache
+        shutil.rmtree(self.test_dir)
+
+    def make_workspace(self, name):
+        workspace = os.path.join(self.test_dir, name)
+        os.makedirs(workspace)
+        return workspace
+
+    def test_convert_source_uses_cache(self):
+        first = conversion.convert_source("ppt", self.pptx_path, self.make_workspace("job1"))
+        second = conversion.convert_source("ppt", self.pptx_path, self.make_workspace("job2"))
+
+        self.assertEqual(os.path.basename(first), os.path.basename(second))
+        with open(first, encoding="utf-8") as f1, open(second, encoding="utf-8") as f2:
+            content = f1.read()
+            self.assertEqual(content, f2.read())
+        self.assertIn("\\section*{Results}", content)
+
+        stats = conversion.conversion_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_convert_sources_keeps_order(self):
+        titles = ["Intro", "Method", "Results", "Intro"]
+        sources = [("ppt", self.make_pptx(f"ppt_{i}.pptx", title), None) for i, title in enumerate(titles)]
+
+        tex_files = conversion.convert_sources(sources, self.make_workspace("job"))
+
+        for tex_file, title in zip(tex_files, titles):
+            with open(tex_file, encoding="utf-8") as f:
+                self.assertIn(f"\\section*{{{title}}}", f.read())
+        self.assertEqual(tex_files[0], tex_files[3])
+
+    def test_convert_sources_reports_every_failure(self):
+        broken = os.path.join(self.test_dir, "ppt_1.pptx")
+        with open(broken, "wb") as f:
+            f.write(b"not a presentation")
+        sources = [("ppt", self.pptx_path, None), ("ppt", broken, None)]
+
+        with self.assertRaises(conversion.ConversionError) as raised:
+            conversion.convert_sources(sources, self.make_workspace("job"))
+        self.assertEqual(list(raised.exception.errors), ["ppt_1.pptx"])
+
+    def test_convert_source_leaves_no_staging(self):
+        workspace = self.make_workspace("job")
+        conversion.convert_source("ppt", self.pptx_path, workspace)
+        self.assertEqual([name for name in os.listdir(workspace) if name.startswith(".")], [])
+
+    def test_concurrent_jobs_share_a_conversion(self):
+        calls = []
+        lock = threading.Lock()
+
+        def slow_convert(source_path, output_dir):
+            with lock:
+                calls.append(source_path)
+            time.sleep(0.2)
+            with open(os.path.splitext(os.path.join(output_dir, os.path.basename(source_path)))[0] + ".tex", "w", encoding="utf-8") as f:
+                f.write("converted")
+
+        converters = dict(conversion.CONVERTERS, ppt=(slow_convert, "test", ".pptx"))
+        with mock.patch.object(conversion, "CONVERTERS", converters), \
+                mock.patch.object(conversion.config, "CONVERSION_POOL_SIZE", 0), \
+                ThreadPoolExecutor(max_workers=4) as executor:
+            workspaces = [self.make_workspace(f"job{i}") for i in range(4)]
+            futures = [executor.submit(conversion.convert_source, "ppt", self.pptx_path, workspace) for workspace in workspaces]
+            tex_files = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        for tex_file in tex_files:
+            with open(tex_file, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "converted")
+        self.assertEqual(conversion._in_flight, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pypdf import PdfReader, PdfWriter
+from backend.app.services.conversion import conversion_key
+from backend.app.services.draft import DraftSettings, draft_settings, truncate_pdf
+from backend.app.services.latex_processing import merge_latex_files
+
+class TestDraftSettings(unittest.TestCase):
+    def test_request_fields(self):
+        self.assertIsNone(draft_settings())
+        self.assertIsNone(draft_settings(mode="full"))
+        self.assertEqual(draft_settings(mode="Draft"), DraftSettings(pages=0))
+        self.assertEqual(draft_settings(mode="draft", pages=2), DraftSettings(pages=2))
+        with self.assertRaises(ValueError):
+            draft_settings(mode="fast")
+        with self.assertRaises(ValueError):
+            draft_settings(pages=2)
+        with self.assertRaises(ValueError):
+            draft_settings(mode="draft", pages=0)
+
+    def test_only_converters_with_draft_options_are_cached_apart(self):
+        self.assertNotEqual(conversion_key("notebook", "abc", draft=True), conversion_key("notebook", "abc"))
+        self.assertEqual(conversion_key("ppt", "abc", draft=True), conversion_key("ppt", "abc"))
+
+class TestDraftBuild(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_truncate_pdf(self):
+        pdf_path = os.path.join(self.test_dir, "document.pdf")
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(width=200, height=200)
+        with open(pdf_path, "wb") as f:
+            writer.write(f)
+
+        truncate_pdf(pdf_path, 5)
+        self.assertEqual(len(PdfReader(pdf_path).pages), 3)
+        truncate_pdf(pdf_path, 1)
+        self.assertEqual(len(PdfReader(pdf_path).pages), 1)
+
+    def test_draft_merge_draws_image_boxes(self):
+        source = os.path.join(self.test_dir, "source.tex")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("\\documentclass{article}\n\\begin{document}\n\\includegraphics{plot.png}\n\\end{document}\n")
+        output = os.path.join(self.test_dir, "merged.tex")
+
+        merge_latex_files([source], output)
+        with open(output, "r", encoding="utf-8") as f:
+            self.assertNotIn("\\setkeys{Gin}{draft}", f.read())
+        merge_latex_files([source], output, draft=True)
+        with open(output, "r", encoding="utf-8") as f:
+            document = f.read()
+        self.assertLess(document.index("\\setkeys{Gin}{draft}"), document.index("\\begin{document}"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import os
+import tempfile
+import shutil
+import threading
+from unittest import mock
+from backend.app.services import html_rendering
+from backend.app.services.html_rendering import BrowserPool, render_html_batch
+from backend.app.utils.content_cache import ContentCache
+
+class FakeBrowser:
+    launched = 0
+
+    def __init__(self, chrome_path):
+        FakeBrowser.launched += 1
+        self.closed = False
+
+    def render(self, html, viewport):
+        if "fail" in html:
+            raise RuntimeError("render failed")
+        return f"PNG {html} {viewport[0]}x{viewport[1]}".encode()
+
+    def close(self):
+        self.closed = True
+
+class TestHtmlRendering(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        FakeBrowser.launched = 0
+        self.patches = [
+            mock.patch.object(html_rendering, "HeadlessBrowser", FakeBrowser),
+            mock.patch.object(html_rendering, "find_chrome", lambda: "/usr/bin/chromium"),
+            mock.patch.object(html_rendering, "browser_pool", BrowserPool(2)),
+            mock.patch.object(html_rendering, "render_cache", ContentCache(os.path.join(self.test_dir, "cache"))),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_pool_reuses_browsers(self):
+        pool = BrowserPool(2)
+        threads = [threading.Thread(target=pool.render, args=(f"<p>{i}</p>", (100, 100))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(FakeBrowser.launched, 2)
+
+    def test_pool_replaces_failed_browser(self):
+        pool = BrowserPool(1)
+        with self.assertRaises(RuntimeError):
+            pool.render("fail", (100, 100))
+        self.assertEqual(pool.render("<p>ok</p>", (100, 100)), b"PNG <p>ok</p> 100x100")
+        self.assertEqual(FakeBrowser.launched, 2)
+
+    def test_render_batch_uses_cache(self):
+        renders = [("<table></table>", os.path.join(self.test_dir, f"out{i}.png")) for i in range(3)]
+        renders.append(("fail", os.path.join(self.test_dir, "broken.png")))
+
+        errors = render_html_batch(renders, viewport=(640, 480))
+
+        self.assertEqual([error is None for error in errors], [True, True, True, False])
+        with open(renders[2][1], "rb") as f:
+            self.assertEqual(f.read(), b"PNG <table></table> 640x480")
+        self.assertGreaterEqual(html_rendering.render_cache.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,106 @@
+import unittest
+import io
+import os
+import random
+import shutil
+import tempfile
+from unittest import mock
+from PIL import Image, ImageDraw
+from backend.app.services import image_optimization
+from backend.app.services.image_optimization import (
+    ImageSettings, image_settings, optimize_image_data, optimize_images, text_area,
+)
+from backend.app.utils.content_cache import ContentCache
+
+def encode(image, fmt="PNG"):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+def diagram(width=3000, height=2000, border=200):
+    image = Image.new("RGB", (width, height), "white")
+    ImageDraw.Draw(image).rectangle((border, border, width - border, height - border), outline="blue", width=8)
+    return image
+
+def photo(width=1200, height=800):
+    return Image.frombytes("RGB", (width, height), random.Random(0).randbytes(width * height * 3))
+
+class TestImageSettings(unittest.TestCase):
+    def test_text_area_follows_geometry(self):
+        width, height = text_area()
+        self.assertAlmostEqual(width, 8.27 - 2, places=2)
+        self.assertAlmostEqual(height, 11.69 - 2, places=2)
+
+    def test_request_fields(self):
+        self.assertIsNone(image_settings(optimize=False, dpi=300))
+        self.assertEqual(image_settings(optimize=True, dpi=300, quality=70).dpi, 300)
+        with self.assertRaises(ValueError):
+            image_settings(optimize=True, dpi=10)
+        with self.assertRaises(ValueError):
+            image_settings(optimize=True, quality=100)
+
+class TestOptimizeImageData(unittest.TestCase):
+    def test_diagram_is_trimmed_and_downsampled(self):
+        settings = ImageSettings(dpi=150, jpeg_quality=85, trim=True)
+        data, extension = optimize_image_data(encode(diagram()), settings)
+        self.assertEqual(extension, ".png")
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertLessEqual(image.width, round(text_area()[0] * 150) + 1)
+            # The border is gone and the printed size of what is left is unchanged
+            trimmed_width = 3000 - 2 * 200 + 8 + 2 * image_optimization.TRIM_PADDING
+            self.assertAlmostEqual(image.width / image.info["dpi"][0], trimmed_width / 72, delta=0.1)
+
+    def test_photo_becomes_jpeg(self):
+        data, extension = optimize_image_data(encode(photo()), ImageSettings(dpi=150, jpeg_quality=85, trim=True))
+        self.assertEqual(extension, ".jpg")
+        self.assertEqual(Image.open(io.BytesIO(data)).format, "JPEG")
+
+    def test_small_image_is_kept(self):
+        original = encode(Image.new("P", (32, 32)))
+        self.assertEqual(optimize_image_data(original, ImageSettings(trim=False)), (original, ".png"))
+
+class TestOptimizeImages(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = ContentCache(os.path.join(self.root, "cache"))
+        patcher = mock.patch.object(image_optimization, "image_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def workspace(self, name):
+        workspace = os.path.join(self.root, name)
+        os.makedirs(workspace)
+        photo().save(os.path.join(workspace, "image_photo.png"))
+        diagram().save(os.path.join(workspace, "image_plot.png"))
+        tex_file = os.path.join(workspace, "notebook.tex")
+        with open(tex_file, "w", encoding="utf-8") as f:
+            f.write("\\adjustimage{max size={0.9\\linewidth}{0.9\\paperheight}}{image_photo.png}\n"
+                    "\\includegraphics[width=3cm]{image_plot.png}\n"
+                    "\\includegraphics{missing.png}\n")
+        return workspace, tex_file
+
+    def test_references_follow_renamed_images(self):
+        workspace, tex_file = self.workspace("job")
+        self.assertEqual(optimize_images([tex_file], workspace, ImageSettings()), 2)
+        with open(tex_file, encoding="utf-8") as f:
+            document = f.read()
+        self.assertIn("{0.9\\paperheight}}{image_photo.jpg}", document)
+        self.assertIn("{image_plot.png}", document)
+        self.assertIn("{missing.png}", document)
+        self.assertEqual(sorted(name for name in os.listdir(workspace) if name.startswith("image_")),
+                         ["image_photo.jpg", "image_plot.png"])
+
+    def test_optimized_images_are_cached(self):
+        workspace, tex_file = self.workspace("first")
+        optimize_images([tex_file], workspace, ImageSettings())
+        workspace, tex_file = self.workspace("second")
+        with mock.patch.object(image_optimization, "optimize_image_data") as optimize:
+            optimize_images([tex_file], workspace, ImageSettings())
+        optimize.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(workspace, "image_photo.jpg")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from unittest import mock
+from backend.app.services import file_processing, jobs as jobs_module, worker as worker_module
+from backend.app.services.job_store import FAILED, QUEUED, RUNNING, SUCCEEDED, ClaimedJob, JobStore, RedisJobStore, SQLiteJobStore, open_job_store
+from backend.app.services.jobs import JobManager
+from backend.app.services.worker import Worker
+from backend.app.utils.content_cache import ContentCache
+from backend.app.utils.file_utils import file_digest
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+class JobStoreTests:
+    """Behaviour every job store must share; subclasses provide `make_store`."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = self.make_store()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_lifecycle(self):
+        self.store.enqueue("a", {"sources": 1})
+        self.assertEqual(self.store.queue_depth(), 1)
+        self.assertEqual(self.store.get("a")["state"], QUEUED)
+
+        claimed = self.store.claim("w1", lease=60, max_attempts=3)
+        self.assertEqual((claimed.id, claimed.payload, claimed.attempts), ("a", {"sources": 1}, 1))
+        self.assertEqual(self.store.queue_depth(), 0)
+        self.assertIsNone(self.store.claim("w2", lease=60, max_attempts=3))
+
+        self.store.add_event("a", "merge")
+        self.store.add_event("a", "compile_pass_1")
+        self.assertEqual([event["stage"] for event in self.store.events("a", since=1)], ["compile_pass_1"])
+        self.assertTrue(self.store.heartbeat("a", "w1", lease=60))
+        self.assertFalse(self.store.heartbeat("a", "w2", lease=60))
+
+        self.assertTrue(self.store.finish("a", "w1", SUCCEEDED, result="abc", spans=[["merge", 0.5]], omitted=["b.tex"]))
+        record = self.store.get("a")
+        self.assertEqual((record["state"], record["result"], record["spans"]), (SUCCEEDED, "abc", [["merge", 0.5]]))
+        self.assertEqual(record["omitted"], ["b.tex"])
+
+        self.store.delete("a")
+        self.assertIsNone(self.store.get("a"))
+        self.assertEqual(self.store.events("a"), [])
+
+    def test_jobs_are_claimed_once_in_order(self):
+        for job_id in ["a", "b", "c"]:
+            self.store.enqueue(job_id, {})
+        claims = []
+        threads = [
+            threading.Thread(target=lambda i=i: claims.append(self.store.claim(f"w{i}", lease=60, max_attempts=3)))
+            for i in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claim.id for claim in claims if claim), ["a", "b", "c"])
+        self.assertEqual(claims.count(None), 2)
+
+    def test_expired_lease_is_retried(self):
+        self.store.enqueue("a", {})
+        self.store.claim("dead", lease=-1, max_attempts=2)
+
+        claimed = self.store.claim("w2", lease=60, max_attempts=2)
+        self.assertEqual((claimed.id, claimed.attempts), ("a", 2))
+        self.assertFalse(self.store.finish("a", "dead", SUCCEEDED, result="stale"))
+        self.assertEqual(self.store.get("a")["state"], RUNNING)
+        self.assertTrue(self.store.finish("a", "w2", FAILED, error="broken"))
+        self.assertEqual(self.store.get("a")["error"], "broken")
+
+    def test_blobs_are_released_with_the_last_job_holding_them(self):
+        self.store.enqueue("a", {})
+        self.store.hold("a", ["x", "y"])
+        self.store.hold("b", ["y"])
+
+        self.assertEqual(self.store.unheld(["x", "y", "z"]), ["z"])
+        self.assertEqual(self.store.delete("a"), ["x"])
+        self.assertEqual(self.store.delete("b"), ["y"])
+        self.assertEqual(self.store.delete("c"), [])
+
+    def test_cached_results(self):
+        self.assertIsNone(self.store.cached_result("key"))
+        self.store.remember_result("key", "pdf")
+        self.assertEqual(self.store.cached_result("key"), "pdf")
+
+    def test_gives_up_after_max_attempts(self):
+        self.store.enqueue("a", {})
+        self.store.claim("dead", lease=-1, max_attempts=1)
+
+        self.assertIsNone(self.store.claim("w2", lease=60, max_attempts=1))
+        record = self.store.get("a")
+        self.assertEqual(record["state"], FAILED)
+        self.assertIn("1 attempts", record["error"])
+
+class TestSQLiteJobStore(JobStoreTests, unittest.TestCase):
+    def make_store(self):
+        return SQLiteJobStore(os.path.join(self.test_dir, "store", "jobs.sqlite3"))
+
+    def test_open_job_store(self):
+        self.assertIsNone(open_job_store(""))
+        store = open_job_store(f"sqlite:///{self.test_dir}/other.sqlite3")
+        self.assertIsInstance(store, SQLiteJobStore)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "other.sqlite3")))
+        with self.assertRaises(ValueError):
+            open_job_store("postgres://localhost/jobs")
+
+    def test_job_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            JobStore()
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisJobStore(JobStoreTests, unittest.TestCase):
+    def make_store(self):
+        return RedisJobStore(fakeredis.FakeRedis())
+
+def fake_build(file_paths, workspace, omitted, progress):
+    fake_build.calls += 1
+    progress("merge")
+    if "broken.tex" in file_paths["names"].values():
+        raise RuntimeError("LaTeX compilation error")
+    if "full.tex" in file_paths["names"].values():
+        raise OSError(28, "No space left on device")
+    pdf_path = os.path.join(workspace, "merged.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-1.4 ")
+        for path in file_paths["latex"]:
+            with open(path, "rb") as source:
+                f.write(source.read())
+    return pdf_path
+
+fake_build.calls = 0
+
+class TestWorker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        fake_build.calls = 0
+        self.root = tempfile.mkdtemp()
+        self.store = SQLiteJobStore(os.path.join(self.root, "jobs.sqlite3"))
+        self.manager = JobManager(max_workers=1, job_ttl=3600, workspace_root=self.root, store=self.store)
+        self.worker = Worker(self.store, concurrency=2, workspace_root=self.root, worker_id="test-worker")
+        self.blobs = ContentCache(os.path.join(self.root, "blobs"))
+        # store_inputs and fetch_inputs live in the job_store module the application imports
+        job_store_module = sys.modules[file_processing.store_inputs.__module__]
+        patches = [
+            mock.patch.object(job_store_module, "blob_store", self.blobs),
+            mock.patch.object(worker_module, "blob_store", self.blobs),
+            mock.patch.object(jobs_module, "blob_store", self.blobs),
+            mock.patch.object(worker_module, "build_pdf", fake_build),
+            mock.patch.object(worker_module.config, "WORKER_POLL_INTERVAL", 0.01),
+            mock.patch.object(worker_module.config, "JOB_POLL_INTERVAL", 0.01),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+        self.manager.shutdown()
+        shutil.rmtree(self.root)
+
+    async def submit(self, name, content):
+        job = self.manager.create_job()
+        path = os.path.join(job.workspace, "latex_0.tex")
+        with open(path, "w") as f:
+            f.write(content)
+        file_paths = {
+            "latex": [path], "ppt": [], "notebook": [],
+            "digests": {path: file_digest(path)}, "names": {path: name}, "images": None, "draft": None,
+        }
+        return await self.manager.enqueue(job, file_processing.store_inputs, file_paths)
+
+    async def test_worker_builds_queued_job(self):
+        job = await self.submit("intro.tex", "hello")
+
+        self.assertEqual(job.state, SUCCEEDED, job.error)
+        with open(job.result_path, "rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1.4 hello")
+        self.assertEqual(job.etag, f'"{file_digest(job.result_path)}"')
+        self.assertEqual([event["stage"] for event in job.events], ["saving", "merge", SUCCEEDED])
+        self.assertEqual(self.store.get(job.id)["state"], SUCCEEDED)
+
+        input_digest = file_digest(os.path.join(job.workspace, "latex_0.tex"))
+        self.assertTrue(self.blobs.get_file(input_digest, os.path.join(self.root, "blob")))
+        self.manager.remove(job.id)
+        self.assertIsNone(self.store.get(job.id))
+        for digest in [input_digest, job.etag.strip('"')]:
+            self.assertFalse(self.blobs.get_file(digest, os.path.join(self.root, "blob")))
+
+    async def test_identical_inputs_reuse_the_pdf(self):
+        first = await self.submit("intro.tex", "hello")
+        second = await self.submit("intro.tex", "hello")
+        # The second job holds the PDF too, so it outlives the job that built it
+        self.manager.remove(first.id)
+
+        self.assertEqual(second.state, SUCCEEDED, second.error)
+        self.assertEqual(second.etag, first.etag)
+        self.assertEqual(fake_build.calls, 1)
+        self.assertEqual([event["stage"] for event in second.events], ["saving", SUCCEEDED])
+        with open(second.result_path, "rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1.4 hello")
+
+        # Released with the last job holding it, the PDF is built again for the next request
+        self.manager.remove(second.id)
+        third = await self.submit("intro.tex", "hello")
+        self.assertEqual(third.state, SUCCEEDED, third.error)
+        self.assertEqual(fake_build.calls, 2)
+
+    async def test_sweep_removes_old_blobs_no_job_holds(self):
+        job = await self.submit("intro.tex", "hello")
+        orphan = os.path.join(self.root, "orphan.tex")
+        with open(orphan, "w") as f:
+            f.write("left behind")
+        self.blobs.put("ab" * 32, [orphan])
+
+        with mock.patch.object(worker_module.config, "BLOB_SWEEP_AGE", -1):
+            self.worker.sweep()
+
+        self.assertFalse(self.blobs.get_file("ab" * 32, os.path.join(self.root, "blob")))
+        self.assertTrue(self.blobs.get_file(job.etag.strip('"'), os.path.join(self.root, "blob")))
+
+    async def test_missing_input_is_left_for_another_attempt(self):
+        source = {"digest": "0" * 64, "file": "latex_0.tex", "name": "intro.tex"}
+        payload = {"sources": {"latex": [source], "ppt": [], "notebook": []}, "images": None, "draft": None}
+        self.assertIsNone(self.worker.build(ClaimedJob(id="lost", payload=payload, attempts=1)))
+
+    async def test_os_error_fails_the_job_right_away(self):
+        job = await self.submit("full.tex", "x")
+
+        self.assertEqual(job.state, FAILED)
+        self.assertIn("No space left on device", job.error)
+        self.assertEqual(self.store.get(job.id)["attempts"], 1)
+
+    async def test_failed_build(self):
+        job = await self.submit("broken.tex", "x")
+
+        self.assertEqual(job.state, FAILED)
+        self.assertEqual(job.error, "LaTeX compilation error")
+        self.assertEqual(job.stage, "merge")
+
+if __name__ == "__main__":
+    unittest.main()
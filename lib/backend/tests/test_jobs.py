@@ -0,0 +1,75 @@
+import unittest
+import os
+import tempfile
+import shutil
+from backend.app.services.jobs import JobManager, FAILED, SUCCEEDED
+
+def fake_build(workspace, progress):
+    for stage in ["pptx", "notebook", "merge", "compile_pass_1", "compile_pass_2"]:
+        progress(stage)
+    pdf_path = os.path.join(workspace, "merged.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-1.4")
+    return pdf_path
+
+def failing_build(workspace, progress):
+    progress("merge")
+    raise RuntimeError("merge failed")
+
+class TestJobManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = JobManager(max_workers=2, job_ttl=3600, workspace_root=self.root)
+
+    def tearDown(self):
+        self.manager.shutdown()
+        shutil.rmtree(self.root)
+
+    async def test_successful_job(self):
+        job = self.manager.create_job()
+        self.assertEqual(job.stage, "saving")
+
+        await self.manager.submit(job, fake_build, job.workspace)
+
+        self.assertEqual(job.state, SUCCEEDED)
+        self.assertEqual(job.progress, 1.0)
+        self.assertTrue(os.path.exists(job.result_path))
+        stages = [event["stage"] for event in job.events]
+        self.assertEqual(stages[0], "saving")
+        self.assertIn("compile_pass_2", stages)
+        self.assertEqual(stages[-1], SUCCEEDED)
+
+    async def test_failed_job(self):
+        job = self.manager.create_job()
+        await self.manager.submit(job, failing_build, job.workspace)
+
+        self.assertEqual(job.state, FAILED)
+        self.assertEqual(job.stage, "merge")
+        self.assertEqual(job.error, "merge failed")
+
+    async def test_wait_for_events(self):
+        job = self.manager.create_job()
+        await self.manager.submit(job, fake_build, job.workspace)
+
+        events = await self.manager.wait_for_events(job, since=1, timeout=1)
+        self.assertEqual(events, job.events[1:])
+
+    async def test_remove_releases_workspace(self):
+        job = self.manager.create_job()
+        await self.manager.submit(job, fake_build, job.workspace)
+
+        self.manager.remove(job.id)
+        self.assertIsNone(self.manager.get(job.id))
+        self.assertFalse(os.path.exists(job.workspace))
+
+    async def test_purge_expired(self):
+        self.manager.job_ttl = 0
+        job = self.manager.create_job()
+        await self.manager.submit(job, fake_build, job.workspace)
+
+        self.assertEqual(self.manager.purge_expired(), 1)
+        self.assertIsNone(self.manager.get(job.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import unittest
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+import nbformat
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_notebook, new_output
+from PIL import Image
+from backend.app.services import jupyter_processing
+from backend.app.services.jupyter_processing import (
+    build_latex_exporter, extract_images, latex_exporter, read_notebook,
+)
+from backend.benchmarks.generators import make_png
+
+def notebook(language, code):
+    nb = new_notebook(cells=[new_code_cell(code)])
+    nb.metadata["language_info"] = {"name": language, "pygments_lexer": language}
+    return nb
+
+class TestLatexExporter(unittest.TestCase):
+    def test_exporter_is_reused(self):
+        with latex_exporter() as first:
+            pass
+        with latex_exporter() as second:
+            self.assertIs(first, second)
+            # An exporter in use is never lent out twice
+            with latex_exporter() as third:
+                self.assertIsNot(second, third)
+
+    def test_reused_exporter_matches_a_fresh_one(self):
+        notebooks = [notebook("python", "def f(x):\n    return x  # note"), notebook("bash", "for x in 1 2; do echo $x; done")]
+        with latex_exporter() as exporter:
+            reused = [exporter.from_notebook_node(nb)[0] for nb in notebooks]
+        fresh = [build_latex_exporter().from_notebook_node(nb)[0] for nb in notebooks]
+        self.assertEqual(reused, fresh)
+        self.assertNotEqual(reused[0], reused[1])
+
+    def tearDown(self):
+        while not jupyter_processing._idle_exporters.empty():
+            jupyter_processing._idle_exporters.get_nowait()
+
+def figure(data):
+    return new_code_cell("plot()", outputs=[new_output("display_data", data=dict(data, **{"text/plain": "<Figure>"}))])
+
+class TestExtractImages(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_identical_images_are_written_once(self):
+        png = base64.b64encode(make_png(16, 16, seed=1)).decode("ascii")
+        other = base64.b64encode(make_png(16, 16, seed=2)).decode("ascii")
+        notebook = new_notebook(cells=[figure({"image/png": png}), figure({"image/png": png}), figure({"image/png": other})])
+
+        self.assertEqual(extract_images(notebook, self.output_dir), 2)
+        filenames = [cell.outputs[0].metadata.filenames["image/png"] for cell in notebook.cells]
+        self.assertEqual(filenames[0], filenames[1])
+        self.assertNotEqual(filenames[0], filenames[2])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted(set(filenames)))
+        with open(os.path.join(self.output_dir, filenames[0]), "rb") as f:
+            self.assertEqual(f.read(), make_png(16, 16, seed=1))
+
+        # The same image in another notebook reuses the file
+        self.assertEqual(extract_images(new_notebook(cells=[figure({"image/png": png})]), self.output_dir), 0)
+
+    def test_unusable_outputs_fall_back_to_text(self):
+        notebook = new_notebook(cells=[figure({"image/png": "bm90IGEgcG5n"}), figure({"image/svg+xml": "<svg/>"})])
+        self.assertEqual(extract_images(notebook, self.output_dir), 0)
+        for cell in notebook.cells:
+            self.assertEqual(list(cell.outputs[0].data), ["text/plain"])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+def without_images(notebook):
+    notebook = json.loads(json.dumps(notebook))
+    for cell in notebook["cells"]:
+        for output in cell.get("outputs", []):
+            for mime_type in jupyter_processing.IMAGE_TYPES:
+                output.get("data", {}).pop(mime_type, None)
+    return notebook
+
+class TestReadNotebook(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, notebook, name="notebook.ipynb"):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(notebook, f)
+        return path
+
+    def test_matches_nbformat_read(self):
+        png = base64.b64encode(make_png(16, 16, seed=1)).decode("ascii")
+        lines = [png[i:i + 76] + "\n" for i in range(0, len(png), 76)]
+        notebook = new_notebook(cells=[
+            new_markdown_cell("# Title"),
+            figure({"image/png": png}),
+            figure({"image/png": "bm90IGEgcG5n"}),
+            figure({"image/svg+xml": "<svg/>"}),
+            new_code_cell("print(1)", outputs=[new_output("stream", name="stdout", text="1\n")]),
+        ])
+        notebook = json.loads(json.dumps(notebook))
+        # Image data may also be stored as a list of lines
+        notebook["cells"].append(json.loads(json.dumps(figure({"image/png": lines}))))
+        path = self.write(notebook)
+
+        streamed = read_notebook(path, os.path.join(self.test_dir, "streamed"))
+        extract_images(streamed, os.path.join(self.test_dir, "streamed"))
+        with open(path, "r", encoding="utf-8") as f:
+            expected = nbformat.read(f, as_version=4)
+        extract_images(expected, os.path.join(self.test_dir, "expected"))
+
+        self.assertEqual(without_images(streamed), without_images(expected))
+        self.assertEqual(os.listdir(os.path.join(self.test_dir, "streamed")), os.listdir(os.path.join(self.test_dir, "expected")))
+        self.assertEqual(streamed.cells[1].outputs[0].metadata.filenames, streamed.cells[5].outputs[0].metadata.filenames)
+
+    def test_memory_is_bounded_by_the_largest_output(self):
+        outputs = []
+        for seed in range(10):
+            buffer = io.BytesIO()
+            Image.frombytes("RGB", (600, 600), random.Random(seed).randbytes(600 * 600 * 3)).save(buffer, "PNG")
+            outputs.append(base64.b64encode(buffer.getvalue()).decode("ascii"))
+        path = self.write(new_notebook(cells=[figure({"image/png": data}) for data in outputs]), "large.ipynb")
+        largest = max(len(data) for data in outputs)
+        del outputs
+        # Imports and schema compilation are not part of the bound
+        small = new_notebook(cells=[figure({"image/png": base64.b64encode(make_png(8, 8)).decode("ascii")})])
+        read_notebook(self.write(small), os.path.join(self.test_dir, "warm"))
+
+        tracemalloc.start()
+        try:
+            notebook = read_notebook(path, os.path.join(self.test_dir, "images"))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(os.listdir(os.path.join(self.test_dir, "images"))), 10)
+        self.assertEqual(len(notebook.cells), 10)
+        self.assertLess(peak, 5 * largest)
+        self.assertLess(peak, os.path.getsize(path) / 2)
+
+if __name__ == "__main__":
+    unittest.main()
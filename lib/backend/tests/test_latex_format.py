@@ -0,0 +1,35 @@
+import unittest
+import os
+import tempfile
+import shutil
+from backend.app.services.latex_format import is_format_compatible
+from backend.app.services.latex_processing import merge_latex_files
+
+class TestLatexFormat(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_merged_document_is_format_compatible(self):
+        latex_file = os.path.join(self.temp_dir, "file1.tex")
+        with open(latex_file, "w") as f:
+            f.write("\\documentclass{article}\n\\newcommand{\\hello}{Hello}\n\\begin{document}\n\\hello, World!\n\\end{document}")
+
+        merged_file = os.path.join(self.temp_dir, "merged.tex")
+        merge_latex_files([latex_file], merged_file)
+
+        self.assertTrue(is_format_compatible(merged_file))
+
+    def test_other_document_is_not_format_compatible(self):
+        latex_file = os.path.join(self.temp_dir, "test.tex")
+        with open(latex_file, "w") as f:
+            f.write("\\documentclass{report}\n\\begin{document}\nHello, World!\n\\end{document}")
+
+        self.assertFalse(is_format_compatible(latex_file))
+        self.assertFalse(is_format_compatible(os.path.join(self.temp_dir, "missing.tex")))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
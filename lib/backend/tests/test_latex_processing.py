@@ -1,6 +1,9 @@
 import unittest
 import os
+import subprocess
+from unittest import mock
 
+from backend.app.services import latex_processing
 from backend.app.services.latex_processing import compile_latex_to_pdf, escape_latex_special_chars, merge_latex_files
 
 
@@ -39,6 +42,148 @@ class TestLatexProcessing(unittest.TestCase):
 
         self.assertTrue(os.path.exists(output_file))
 
+    def test_merge_latex_files_usepackage_lists(self):
+        latex_file = os.path.join(self.temp_dir, "file1.tex")
+        with open(latex_file, "w") as f:
+            f.write("\\documentclass{article}\n\\usepackage[utf8]{inputenc,missingpkg}\n\\usepackage[breaklinks]{hyperref}\n"
+                    "\\usepackage{amsmath}\n\\begin{document}\nHello, World!\n\\end{document}")
+
+        original_check_many = latex_processing.package_index.check_many
+        latex_processing.package_index.check_many = lambda names: {name: name != "missingpkg" for name in names}
+        try:
+            output_file = os.path.join(self.temp_dir, "merged.tex")
+            merge_latex_files([latex_file], output_file)
+        finally:
+            latex_processing.package_index.check_many = original_check_many
+
+        with open(output_file) as f:
+            merged = f.read()
+        self.assertIn("\\usepackage[utf8]{inputenc}\n", merged)
+        self.assertIn("\\usepackage{amsmath}\n", merged)
+        self.assertNotIn("missingpkg", merged)
+        self.assertNotIn("breaklinks", merged)
+
+    def test_merge_latex_files_inputs_bodies_and_dedupes_preamble(self):
+        latex_files = []
+        for i in range(2):
+            latex_files.append(os.path.join(self.temp_dir, f"file{i}.tex"))
+            with open(latex_files[-1], "w") as f:
+                f.write("\\documentclass{article}\n\\newcommand{\\R}{\\mathbb{R}}\n"
+                        f"\\begin{{document}}\nPart {i}\n\\end{{document}}")
+
+        output_file = os.path.join(self.temp_dir, "merged.tex")
+        body_files = merge_latex_files(latex_files, output_file)
+
+        with open(output_file) as f:
+            merged = f.read()
+        self.assertEqual(merged.count("\\newcommand{\\R}"), 1)
+        self.assertNotIn("Part", merged)
+        self.assertIn("\\input{merged_body_0}\n\n\\input{merged_body_1}\n", merged)
+        self.assertEqual(body_files, [os.path.join(self.temp_dir, "merged_body_0.tex"), os.path.join(self.temp_dir, "merged_body_1.tex")])
+        with open(body_files[1]) as f:
+            self.assertEqual(f.read(), "Part 1\n")
+
+    def test_merge_latex_files_keeps_nbconvert_preambles_balanced(self):
+        # Shaped like the preamble nbconvert writes: groups, \makeatletter and conditionals spread over lines
+        nbconvert_preamble = (
+            "\\makeatletter\n\\def\\maxwidth{\\ifdim\\Gin@nat@width>\\linewidth\n\\linewidth\n\\else\n"
+            "\\Gin@nat@width\n\\fi\n}\n\\makeatother\n"
+            "\\ifdefined\\shorthandoff\n\\ifnum\\catcode`\\=\\string=\\active\\shorthandoff{=}\\fi\n\\fi\n"
+        )
+        other_preamble = "\\makeatletter\n\\def\\PY@reset{\\let\\PY@it=\\relax\n}\n\\makeatother\n"
+        latex_files = []
+        for i, preamble in enumerate([nbconvert_preamble, nbconvert_preamble, other_preamble]):
+            latex_files.append(os.path.join(self.temp_dir, f"notebook{i}.tex"))
+            with open(latex_files[-1], "w") as f:
+                f.write(f"\\documentclass{{article}}\n{preamble}\\begin{{document}}\nNotebook {i}\n\\end{{document}}")
+
+        output_file = os.path.join(self.temp_dir, "merged.tex")
+        merge_latex_files(latex_files, output_file)
+
+        with open(output_file) as f:
+            preamble = f.read().split("\\begin{document}")[0]
+        self.assertEqual(preamble.count("\\def\\maxwidth"), 1)
+        self.assertEqual(preamble.count("{"), preamble.count("}"))
+        self.assertEqual(preamble.count("\\makeatletter"), 2)
+        self.assertEqual(preamble.count("\\makeatother"), 2)
+        self.assertEqual(preamble.count("\\fi"), preamble.count("\\ifdim") + preamble.count("\\ifnum") + preamble.count("\\ifdefined"))
+
+    def fake_xelatex(self, aux_per_pass, output_per_pass=None, format_loads=True):
+        """
+        Return a stand-in for subprocess.run that writes the given .aux content on each pass.
+        Passes run with a format that does not load fail without a PDF.
+        """
+        calls = []
+        def run(args, cwd=None, **kwargs):
+            base = os.path.join(cwd, os.path.splitext(args[-1])[0])
+            output = (output_per_pass or [""])[min(len(calls), len(output_per_pass or [""]) - 1)]
+            calls.append(args)
+            if not format_loads and any(arg.startswith("-fmt=") for arg in args):
+                return subprocess.CompletedProcess(args, 1, stdout="I can't find the format file `docgen.fmt'!")
+            with open(base + ".aux", "w") as f:
+                f.write(aux_per_pass[min(len(calls) - 1, len(aux_per_pass) - 1)])
+            with open(base + ".pdf", "w") as f:
+                f.write("%PDF-1.4")
+            return subprocess.CompletedProcess(args, 1 if "LaTeX Error" in output else 0, stdout=output)
+        return run, calls
+
+    def compile_with(self, run, max_passes=3, **kwargs):
+        latex_file = os.path.join(self.temp_dir, "test.tex")
+        with open(latex_file, "w") as f:
+            f.write("\\documentclass{article}\n\\begin{document}\nHello, World!\n\\end{document}")
+        with mock.patch.object(latex_processing.subprocess, "run", run):
+            return compile_latex_to_pdf(latex_file, self.temp_dir, max_passes=max_passes, **kwargs)
+
+    def test_compile_single_pass_without_references(self):
+        run, calls = self.fake_xelatex(["\\relax\n\\gdef \\@abspage@last{1}\n"])
+        success, _ = self.compile_with(run)
+        self.assertTrue(success)
+        self.assertEqual(len(calls), 1)
+
+    def test_compile_reruns_until_references_converge(self):
+        run, calls = self.fake_xelatex(["\\relax\n\\newlabel{sec}{{1}{1}}\n"])
+        success, _ = self.compile_with(run)
+        self.assertTrue(success)
+        self.assertEqual(len(calls), 2)
+
+    def test_compile_reruns_on_rerun_warning(self):
+        run, calls = self.fake_xelatex(["\\relax\n"], ["LaTeX Warning: Label(s) may have\nchanged. Rerun to get cross-references right.", ""])
+        self.compile_with(run)
+        self.assertEqual(len(calls), 2)
+
+    def test_compile_stops_at_max_passes(self):
+        run, calls = self.fake_xelatex(["\\newlabel{a}{{1}{1}}\n", "\\newlabel{a}{{1}{2}}\n", "\\newlabel{a}{{1}{3}}\n"])
+        self.compile_with(run, max_passes=2)
+        self.assertEqual(len(calls), 2)
+
+    def test_recoverable_error_keeps_the_format(self):
+        run, calls = self.fake_xelatex(["\\relax\n"], ["! LaTeX Error: File `missing.sty' not found."])
+        success, _ = self.compile_with(run, format_name="docgen")
+        self.assertTrue(success)
+        self.assertEqual(len(calls), 1)
+        self.assertIn("-fmt=docgen", calls[0])
+
+    def test_format_that_does_not_load_is_dropped(self):
+        run, calls = self.fake_xelatex(["\\relax\n"], format_loads=False)
+        stages = []
+        success, _ = self.compile_with(run, format_name="docgen", progress=stages.append)
+        self.assertTrue(success)
+        self.assertEqual([any(arg.startswith("-fmt=") for arg in args) for args in calls], [True, False])
+        self.assertEqual(stages, ["compile_pass_1"])
+
+    def test_timeout_removes_the_pdf_of_earlier_passes(self):
+        first_pass, calls = self.fake_xelatex(["\\newlabel{a}{{1}{1}}\n", "\\newlabel{a}{{1}{2}}\n"])
+        def run(args, **kwargs):
+            if calls:
+                raise subprocess.TimeoutExpired(args, kwargs.get("timeout"))
+            return first_pass(args, **kwargs)
+
+        success, message = self.compile_with(run)
+
+        self.assertFalse(success)
+        self.assertIn("was killed", message)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "test.pdf")))
+
     def test_compile_latex_to_pdf(self):
         latex_file = os.path.join(self.temp_dir, "test.tex")
         with open(latex_file, "w") as f:
@@ -0,0 +1,90 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+import threading
+import time
+from unittest import mock
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from backend.app.services.jobs import JobManager, JobQueueFullError
+from backend.app.utils import processes
+from backend.app.utils.processes import ToolTimeoutError, run_tool
+from backend.app.utils.request_limits import AdmissionMiddleware
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+class TestToolLimits(unittest.TestCase):
+    def test_timeout_kills_the_tool(self):
+        start = time.monotonic()
+        with self.assertRaises(ToolTimeoutError):
+            run_tool("sleeper", python("import time; time.sleep(10)"), timeout=0.5)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_concurrency_is_bounded(self):
+        with mock.patch.object(processes, "tool_limits", lambda tool: (1, None)):
+            threads = [
+                threading.Thread(target=run_tool, args=("serialized", python("import time; time.sleep(0.3)")))
+                for _ in range(3)
+            ]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    @unittest.skipIf(os.name != "posix", "rlimits are not available on this platform")
+    def test_memory_limit(self):
+        # With prlimit if it is installed, and with the shell's ulimit
+        for prlimit in {processes._prlimit(), None}:
+            with self.subTest(prlimit=prlimit):
+                with mock.patch.object(processes.config, "SUBPROCESS_MEMORY_LIMIT", 256 * 1024 * 1024), \
+                        mock.patch.object(processes, "_prlimit", lambda: prlimit):
+                    result = run_tool("allocator", python("data = bytearray(1024 * 1024 * 1024)"), capture_output=True)
+                self.assertNotEqual(result.returncode, 0)
+                self.assertIn(b"MemoryError", result.stderr)
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = JobManager(max_workers=1, job_ttl=3600, workspace_root=self.root, max_pending=1)
+
+    def tearDown(self):
+        self.manager.shutdown()
+        shutil.rmtree(self.root)
+
+    async def test_job_queue_is_bounded(self):
+        job = self.manager.create_job()
+        with self.assertRaises(JobQueueFullError) as raised:
+            self.manager.create_job()
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+        self.manager.fail(job, "cancelled")
+        self.assertIsNone(self.manager.admission_retry_after())
+        self.manager.create_job()
+
+    async def test_middleware_returns_429(self):
+        async def upload(request):
+            return PlainTextResponse("ok")
+
+        app = AdmissionMiddleware(
+            Starlette(routes=[Route("/process/", upload, methods=["GET", "POST"])]),
+            retry_after=self.manager.admission_retry_after,
+            paths=["/process/"],
+        )
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            self.assertEqual((await client.post("/process/")).status_code, 200)
+            self.manager.create_job()
+            response = await client.post("/process/")
+            self.assertEqual(response.status_code, 429)
+            self.assertGreaterEqual(int(response.headers["retry-after"]), 1)
+            self.assertEqual((await client.get("/process/")).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,37 @@
+import unittest
+from backend.benchmarks.loadtest import histogram, parse_mix, percentile, summarize
+
+class TestLoadTest(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("latex=3, ppt=1,notebook"), {"latex": 3.0, "ppt": 1.0, "notebook": 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix("docx=1")
+        with self.assertRaises(ValueError):
+            parse_mix("latex=0")
+
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 0.5)
+        self.assertEqual(percentile(values, 0.99), 0.99)
+        self.assertEqual(percentile([0.2], 0.99), 0.2)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_summarize(self):
+        results = [
+            {"kind": "latex", "status": 200, "latency": 0.02},
+            {"kind": "latex", "status": 200, "latency": 0.2},
+            {"kind": "ppt", "status": 500, "latency": 3.0},
+            {"kind": "ppt", "status": "ReadTimeout", "latency": 120.0},
+        ]
+        report = summarize(results, elapsed=2.0)
+        self.assertEqual(report["throughput"], 2.0)
+        self.assertEqual(report["error_rate"], 0.5)
+        self.assertEqual(report["statuses"], {"200": 2, "500": 1, "ReadTimeout": 1})
+        self.assertEqual(report["by_kind"]["latex"]["p50"], 0.02)
+        self.assertEqual(report["latency"]["max"], 120.0)
+        self.assertEqual(sum(bucket["count"] for bucket in histogram([r["latency"] for r in results])), 4)
+        self.assertEqual(report["histogram"][-1], {"le": None, "count": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import shutil
+from backend.app.routers import metrics as metrics_router
+from backend.app.services.jobs import JobManager
+
+# The metrics module the app itself records into
+metrics = metrics_router.metrics
+collect_spans, record_span, replay_spans = metrics.collect_spans, metrics.record_span, metrics.replay_spans
+run_collecting_spans, server_timing, span = metrics.run_collecting_spans, metrics.server_timing, metrics.span
+
+def timed_build(workspace, progress):
+    with span("merge"):
+        pass
+    record_span("xelatex", 0.5)
+    record_span("xelatex", 0.25)
+    pdf_path = os.path.join(workspace, "merged.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-1.4")
+    return pdf_path
+
+def worker_task(value):
+    record_span("convert_ppt", 0.125)
+    return value * 2
+
+class TestMetrics(unittest.TestCase):
+    def test_spans_are_attributed_to_the_current_job(self):
+        spans = []
+        record_span("outside", 1.0)
+        with collect_spans(spans):
+            record_span("xelatex", 0.5)
+            with span("merge"):
+                pass
+        self.assertEqual([name for name, _ in spans], ["xelatex", "merge"])
+
+    def test_run_collecting_spans_and_replay(self):
+        result, spans = run_collecting_spans(worker_task, 21)
+        self.assertEqual(result, 42)
+        self.assertEqual(spans, [("convert_ppt", 0.125)])
+
+        job_spans = []
+        with collect_spans(job_spans):
+            replay_spans(spans)
+        self.assertEqual(job_spans, spans)
+
+    def test_server_timing(self):
+        spans = [("xelatex", 0.5), ("merge", 0.01), ("xelatex", 0.25)]
+        self.assertEqual(server_timing(spans), "xelatex;dur=750.0, merge;dur=10.0")
+
+    def test_metrics_endpoint(self):
+        record_span("merge", 0.01)
+        metrics.SUBPROCESSES.labels("xelatex", "ok").inc()
+        response = asyncio.run(metrics_router.read_metrics())
+        body = response.body.decode()
+        self.assertIn('docgen_span_duration_seconds_count{span="merge"}', body)
+        self.assertIn('docgen_subprocesses_total{outcome="ok",tool="xelatex"}', body)
+        self.assertTrue(response.media_type.startswith("text/plain"))
+
+class TestJobTimings(unittest.IsolatedAsyncioTestCase):
+    async def test_job_reports_timings(self):
+        root = tempfile.mkdtemp()
+        manager = JobManager(max_workers=1, job_ttl=3600, workspace_root=root)
+        try:
+            job = manager.create_job()
+            await manager.submit(job, timed_build, job.workspace)
+            timings = job.to_dict()["timings"]
+            self.assertEqual(list(timings), ["merge", "xelatex"])
+            self.assertEqual(timings["xelatex"], 0.75)
+        finally:
+            manager.shutdown()
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,129 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from pptx import Presentation
+from pptx.enum.text import MSO_UNDERLINE
+from pptx.util import Inches
+from backend.app.services.latex_processing import escape_latex_special_chars
+from backend.app.services.ppt_processing import convert_pptx_to_latex
+from backend.benchmarks.generators import make_png, make_pptx
+
+def reference_paragraph(paragraph):
+    formatted_runs = []
+    for run in paragraph.runs:
+        text = escape_latex_special_chars(run.text.strip())
+        if not text:
+            continue
+        text = text.replace('“', '``').replace('”', "''").replace('„', ',,')
+        if run.font.bold:
+            text = f"\\textbf{{{text}}}"
+        if run.font.italic:
+            text = f"\\textit{{{text}}}"
+        if run.font.underline:
+            text = f"\\underline{{{text}}}"
+        formatted_runs.append(text)
+    return " ".join(formatted_runs).strip()
+
+def reference_latex(pptx_file):
+    """The LaTeX of the converter that walked python-pptx's object model, which the streaming one must reproduce."""
+    latex_content = []
+    current_depth = -1
+    for slide in Presentation(pptx_file).slides:
+        if slide.shapes.title and slide.shapes.title.text.strip():
+            latex_content.append(f"\\section*{{{escape_latex_special_chars(slide.shapes.title.text.strip())}}}\n")
+        for shape in slide.shapes:
+            if not shape.has_text_frame:
+                continue
+            for paragraph in shape.text_frame.paragraphs:
+                cleaned_text = reference_paragraph(paragraph)
+                if not cleaned_text:
+                    continue
+                target_depth = min(paragraph.level, 7)
+                while current_depth < target_depth:
+                    latex_content.append("\\begin{itemize}")
+                    current_depth += 1
+                while current_depth > target_depth:
+                    latex_content.append("\\end{itemize}")
+                    current_depth -= 1
+                latex_content.append(f"\\item {cleaned_text}")
+        while current_depth >= 0:
+            latex_content.append("\\end{itemize}")
+            current_depth -= 1
+    return "\n".join(latex_content)
+
+def make_mixed_deck(path):
+    """A deck exercising what a simple walk gets wrong: shape order, groups, media, fields and odd formatting."""
+    prs = Presentation()
+
+    # The title placeholder comes last in the shape tree but is still the title
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "Costs & {margins}\vper “region”"
+    tree = slide.shapes._spTree
+    tree.append(slide.shapes.title._element)
+    body = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(6), Inches(3)).text_frame
+    body.text = "10% of $5_000 ~ ^"
+    for level, style in [(1, MSO_UNDERLINE.DOUBLE_LINE), (9, MSO_UNDERLINE.NONE), (2, True), (0, None)]:
+        paragraph = body.add_paragraph()
+        paragraph.level = min(level, 8)
+        run = paragraph.add_run()
+        run.text = f"  level {level} <item> | \\path  "
+        run.font.underline = style
+        run.font.bold = level % 2 == 0
+        run.font.italic = False if level else None
+    body.add_paragraph()
+    slide.shapes.add_picture(io.BytesIO(make_png(64, 48)), Inches(1), Inches(1))
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(1), Inches(1), Inches(1)).text_frame.text = "inside a group"
+
+    # No title placeholder, a blank title, and a slide moved to the front
+    prs.slides.add_slide(prs.slide_layouts[6]).shapes.add_textbox(0, 0, Inches(2), Inches(1)).text_frame.text = "untitled"
+    prs.slides.add_slide(prs.slide_layouts[1]).placeholders[1].text_frame.text = "blank title"
+    moved = prs.slides.add_slide(prs.slide_layouts[0])
+    moved.shapes.title.text = "First"
+    slide_ids = prs.slides._sldIdLst
+    slide_ids.insert(0, slide_ids[-1])
+    prs.save(path)
+    return path
+
+class TestConvertPptxToLatex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def convert(self, pptx_file):
+        convert_pptx_to_latex(pptx_file, self.test_dir)
+        with open(os.path.join(self.test_dir, os.path.splitext(os.path.basename(pptx_file))[0] + ".tex"), encoding="utf-8") as f:
+            return f.read()
+
+    def test_matches_object_model_converter(self):
+        decks = [
+            make_pptx(os.path.join(self.test_dir, "generated.pptx"), slides=6, depth=4, paragraphs=7, runs=3),
+            make_mixed_deck(os.path.join(self.test_dir, "mixed.pptx")),
+        ]
+        for deck in decks:
+            with self.subTest(deck=os.path.basename(deck)):
+                self.assertEqual(self.convert(deck), reference_latex(deck))
+
+    def test_mixed_deck(self):
+        latex = self.convert(make_mixed_deck(os.path.join(self.test_dir, "mixed.pptx")))
+        self.assertTrue(latex.startswith("\\section*{First}"))
+        self.assertIn("\\section*{Costs \\& \\{margins\\}per “region”}", latex)
+        self.assertIn("\\item Costs \\& \\{margins\\} per ``region''", latex)
+        self.assertIn("\\item \\underline{level 1 \\textless{}item\\textgreater{} \\textbar{} \\textbackslash{}path}", latex)
+        self.assertNotIn("inside a group", latex)
+        self.assertEqual(latex.count("\\begin{itemize}"), latex.count("\\end{itemize}"))
+
+    def test_broken_deck_leaves_no_output(self):
+        broken = os.path.join(self.test_dir, "broken.pptx")
+        with open(broken, "wb") as f:
+            f.write(b"not a zip")
+        with self.assertRaises(RuntimeError):
+            convert_pptx_to_latex(broken, self.test_dir)
+        self.assertEqual(os.listdir(self.test_dir), ["broken.pptx"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from backend.app.services import file_processing
+from backend.app.services.jobs import SUCCEEDED, JobManager
+from backend.app.services.result_cache import result_key
+from backend.app.utils.file_utils import file_digest
+from backend.app.utils.content_cache import ContentCache
+from backend.app.utils.response_utils import etag_matches
+
+class FakeRequest:
+    def __init__(self, if_none_match=None):
+        self.headers = {"if-none-match": if_none_match} if if_none_match else {}
+
+class TestResultCache(unittest.TestCase):
+    def make_file_paths(self, latex_digests):
+        paths = [f"latex_{i}.tex" for i in range(len(latex_digests))]
+        return {
+            "latex": paths,
+            "ppt": [],
+            "notebook": [],
+            "digests": dict(zip(paths, latex_digests)),
+        }
+
+    def test_result_key_is_stable(self):
+        self.assertEqual(
+            result_key(self.make_file_paths(["aaa", "bbb"])),
+            result_key(self.make_file_paths(["aaa", "bbb"])),
+        )
+
+    def test_result_key_depends_on_input_order(self):
+        self.assertNotEqual(
+            result_key(self.make_file_paths(["aaa", "bbb"])),
+            result_key(self.make_file_paths(["bbb", "aaa"])),
+        )
+
+    def test_etag_matches(self):
+        etag = '"abc"'
+        self.assertTrue(etag_matches(FakeRequest('"abc"'), etag))
+        self.assertTrue(etag_matches(FakeRequest('"xyz", W/"abc"'), etag))
+        self.assertTrue(etag_matches(FakeRequest("*"), etag))
+        self.assertFalse(etag_matches(FakeRequest('"xyz"'), etag))
+        self.assertFalse(etag_matches(FakeRequest(), etag))
+
+class TestBuildPdfCaching(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache = ContentCache(os.path.join(self.test_dir, "cache"))
+        patches = [
+            mock.patch.object(file_processing, "result_cache", self.cache),
+            mock.patch.object(file_processing, "convert_sources", lambda sources, workspace, **kwargs: []),
+            mock.patch.object(file_processing, "compile_split", self.fake_compile_split),
+            mock.patch.object(file_processing.config, "SPLIT_COMPILE_ENABLED", True),
+            mock.patch.object(file_processing.config, "RESULT_CACHE_ENABLED", True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def fake_compile_split(self, latex_files, titles, workspace, output_file, progress=None, draft=False):
+        with open(output_file, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return [title for title in titles if "broken" in title]
+
+    def build(self, names):
+        file_paths = {"latex": [], "ppt": [], "notebook": [], "digests": {}, "names": {}}
+        for i, name in enumerate(names):
+            path = os.path.join(self.test_dir, f"latex_{i}.tex")
+            file_paths["latex"].append(path)
+            file_paths["digests"][path] = name
+            file_paths["names"][path] = name
+        omitted = []
+        file_processing.build_pdf(file_paths, self.test_dir, omitted)
+        out_dir = os.path.join(self.test_dir, "out")
+        os.makedirs(out_dir)
+        return omitted, self.cache.get(result_key(file_paths), out_dir)
+
+    def test_complete_pdf_is_cached(self):
+        omitted, cached = self.build(["a.tex", "b.tex"])
+        self.assertEqual(omitted, [])
+        self.assertIsNotNone(cached)
+
+    def test_pdf_missing_a_fragment_is_not_cached(self):
+        omitted, cached = self.build(["a.tex", "broken.tex"])
+        self.assertEqual(omitted, ["broken.tex"])
+        self.assertIsNone(cached)
+
+class TestScheduleBuild(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = JobManager(max_workers=1, job_ttl=3600, workspace_root=self.root)
+        self.cache = ContentCache(os.path.join(self.root, "cache"))
+        self.digest_threads = []
+        patches = [
+            mock.patch.object(file_processing, "job_manager", self.manager),
+            mock.patch.object(file_processing, "result_cache", self.cache),
+            mock.patch.object(file_processing, "file_digest", self.recording_digest),
+            mock.patch.object(file_processing.config, "RESULT_CACHE_ENABLED", True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.manager.shutdown()
+        shutil.rmtree(self.root)
+
+    def recording_digest(self, path):
+        self.digest_threads.append(threading.current_thread())
+        return file_digest(path)
+
+    async def test_cache_hit_is_served_off_the_event_loop(self):
+        file_paths = {"latex": [], "ppt": [], "notebook": [], "digests": {}, "names": {}}
+        pdf_path = os.path.join(self.root, "merged.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        self.cache.put(result_key(file_paths), [pdf_path])
+
+        job = self.manager.create_job()
+        await file_processing.schedule_build(job, file_paths)
+
+        self.assertEqual(job.state, SUCCEEDED)
+        self.assertEqual(job.etag, f'"{file_digest(pdf_path)}"')
+        self.assertEqual(len(self.digest_threads), 1)
+        self.assertIsNot(self.digest_threads[0], threading.main_thread())
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
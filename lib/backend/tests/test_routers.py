@@ -0,0 +1,65 @@
+import unittest
+import os
+import tempfile
+import shutil
+from unittest import mock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.app.routers import jobs as jobs_router, process as process_router
+from backend.app.services.jobs import JobManager
+
+class TestPdfEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manager = JobManager(max_workers=1, job_ttl=3600, workspace_root=self.root)
+        patches = [
+            mock.patch.object(process_router, "job_manager", self.manager),
+            mock.patch.object(process_router, "submit_files", self.fake_submit_files),
+            mock.patch.object(jobs_router, "job_manager", self.manager),
+            mock.patch.object(jobs_router, "submit_files", self.fake_submit_files),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        app = FastAPI()
+        app.include_router(process_router.router)
+        app.include_router(jobs_router.router)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.manager.shutdown()
+        shutil.rmtree(self.root)
+
+    async def fake_submit_files(self, latex, ppt, notebook, images=None, draft=None):
+        job = self.manager.create_job()
+        result_path = os.path.join(job.workspace, "merged.pdf")
+        with open(result_path, "wb") as f:
+            f.write(b"%PDF-1.4 " + await latex[0].read())
+        return job, self.manager.complete(job, result_path)
+
+    def test_process_returns_304_for_a_matching_etag(self):
+        files = {"latex": ("a.tex", b"hello")}
+        response = self.client.post("/process/", files=files)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"%PDF-1.4 hello")
+        etag = response.headers["etag"]
+
+        response = self.client.post("/process/", files=files, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_job_result_returns_304_for_a_matching_etag(self):
+        job_id = self.client.post("/jobs/", files={"latex": ("a.tex", b"hello")}).json()["job_id"]
+        response = self.client.get(f"/jobs/{job_id}/result")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["etag"]
+
+        response = self.client.get(f"/jobs/{job_id}/result", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.get(f"/jobs/{job_id}/result", headers={"If-None-Match": '"other"'}).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import os
+import re
+import tempfile
+import shutil
+from unittest import mock
+from pypdf import PdfReader, PdfWriter
+from backend.app.services import split_compile
+from backend.app.services.split_compile import compile_split, merge_pdfs
+from backend.app.utils.content_cache import ContentCache
+
+def write_pdf(path, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+class TestSplitCompile(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.compiled = []
+        self.patches = [
+            mock.patch.object(split_compile, "compile_latex_to_pdf", self.fake_compile),
+            mock.patch.object(split_compile, "prepare_format", lambda tex_file, output_dir: None),
+            mock.patch.object(split_compile, "toolchain_version", lambda: "XeTeX test"),
+            mock.patch.object(split_compile, "fragment_cache", ContentCache(os.path.join(self.test_dir, "cache"))),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.test_dir)
+
+    def fake_compile(self, tex_file, output_dir, max_passes=None, format_name=None, log_name=None):
+        """Compile to one page per \\newpage, or fail on \\broken."""
+        self.compiled.append(os.path.basename(tex_file))
+        self.max_passes = max_passes
+        with open(tex_file, "r", encoding="utf-8") as f:
+            document = f.read()
+        for body_name in re.findall(r"\\input\{([^}]*)\}", document):
+            with open(os.path.join(output_dir, body_name + ".tex"), "r", encoding="utf-8") as f:
+                document += f.read()
+        if r"\broken" in document:
+            return False, "XeLaTeX failed with exit code 1"
+        write_pdf(os.path.splitext(tex_file)[0] + ".pdf", document.count(r"\newpage") + 1)
+        return True, "Compilation successful after 1 pass."
+
+    def write_source(self, name, body):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"\\documentclass{{article}}\n\\begin{{document}}\n{body}\n\\end{{document}}\n")
+        return path
+
+    def test_compile_split_merges_in_order_with_bookmarks(self):
+        sources = [self.write_source("a.tex", "A"), self.write_source("b.tex", "B\n\\newpage\nB")]
+        output = os.path.join(self.test_dir, "merged.pdf")
+
+        failed = compile_split(sources, ["a.tex", "slides.pptx"], self.test_dir, output)
+
+        self.assertEqual(failed, [])
+        reader = PdfReader(output)
+        self.assertEqual(len(reader.pages), 3)
+        self.assertEqual([item.title for item in reader.outline], ["a.tex", "slides.pptx"])
+        self.assertEqual(reader.get_destination_page_number(reader.outline[1]), 1)
+
+    def test_broken_fragment_is_left_out(self):
+        sources = [self.write_source("a.tex", "A"), self.write_source("b.tex", "\\broken")]
+        output = os.path.join(self.test_dir, "merged.pdf")
+
+        failed = compile_split(sources, ["a.tex", "b.tex"], self.test_dir, output)
+
+        self.assertEqual(failed, ["b.tex"])
+        self.assertEqual(len(PdfReader(output).pages), 1)
+
+        with self.assertRaises(RuntimeError):
+            compile_split(sources[1:], ["b.tex"], self.test_dir, output)
+
+    def test_unchanged_fragments_are_not_recompiled(self):
+        source = self.write_source("a.tex", "A")
+        output = os.path.join(self.test_dir, "merged.pdf")
+        compile_split([source], ["a.tex"], self.test_dir, output)
+        compile_split([source, self.write_source("b.tex", "B")], ["a.tex", "b.tex"], self.test_dir, output)
+
+        self.assertEqual(self.compiled, ["fragment_0.tex", "fragment_1.tex"])
+        self.assertEqual(len(PdfReader(output).pages), 2)
+
+    def test_draft_fragments_compile_once_without_images(self):
+        sources = [self.write_source("a.tex", "A"), self.write_source("b.tex", "B")]
+        compile_split(sources, ["a", "b"], self.test_dir, os.path.join(self.test_dir, "merged.pdf"), draft=True)
+        self.assertEqual(self.max_passes, 1)
+        with open(os.path.join(self.test_dir, "fragment_0.tex"), "r", encoding="utf-8") as f:
+            self.assertIn(r"\setkeys{Gin}{draft}", f.read())
+
+    def test_merge_pdfs_nests_part_bookmarks(self):
+        part = os.path.join(self.test_dir, "part.pdf")
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        writer.add_outline_item("Introduction", 0)
+        with open(part, "wb") as f:
+            writer.write(f)
+        output = os.path.join(self.test_dir, "merged.pdf")
+
+        merge_pdfs([("notes.ipynb", part)], output)
+
+        outline = PdfReader(output).outline
+        self.assertEqual(outline[0].title, "notes.ipynb")
+        self.assertEqual(outline[1][0].title, "Introduction")
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+from unittest import mock
+from backend.app.services import warmup as warmup_module
+from backend.app.services.warmup import DONE, FAILED, SKIPPED, Warmup
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds `import app.main` may take in a fresh interpreter
+IMPORT_BUDGET = float(os.environ.get("DOCGEN_IMPORT_BUDGET", "1.5"))
+
+IMPORT_APP = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+def import_app():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+class TestStartup(unittest.TestCase):
+    def test_converters_are_not_imported_at_startup(self):
+        modules = set(import_app()["modules"])
+        for name in ["nbconvert", "nbformat", "ijson", "pptx", "PIL", "pypdf", "websocket"]:
+            self.assertNotIn(name, modules)
+
+    def test_import_time_within_budget(self):
+        seconds = min(import_app()["seconds"] for _ in range(3))
+        self.assertLess(seconds, IMPORT_BUDGET, f"importing the app took {seconds:.2f} s")
+
+class TestWarmup(unittest.TestCase):
+    def test_runs_every_step(self):
+        calls = []
+        warmup = Warmup([("first", lambda: calls.append(1)), ("second", lambda: calls.append(2))])
+        self.assertFalse(warmup.is_ready())
+        warmup.start()
+        self.assertTrue(warmup.wait(5))
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(warmup.report()["steps"], {"first": DONE, "second": DONE})
+
+    def test_failed_step_does_not_stop_the_warmup(self):
+        def broken():
+            raise RuntimeError("no TeX")
+        warmup = Warmup([("broken", broken), ("after", lambda: None)])
+        warmup.start()
+        self.assertTrue(warmup.wait(5))
+        report = warmup.report()
+        self.assertTrue(report["ready"])
+        self.assertEqual(report["steps"], {"broken": FAILED, "after": DONE})
+        self.assertEqual(report["errors"], {"broken": "no TeX"})
+
+    def test_disabled(self):
+        step = mock.Mock()
+        warmup = Warmup([("step", step)])
+        with mock.patch.object(warmup_module.config, "WARMUP_ENABLED", False):
+            warmup.start()
+        self.assertTrue(warmup.is_ready())
+        self.assertEqual(warmup.report()["steps"], {"step": SKIPPED})
+        step.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from backend.app.services import tex_packages
+from backend.app.services.tex_packages import PackageIndex, parse_usepackage, read_style_files
+
+class TestTexPackages(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.database = os.path.join(self.test_dir, "ls-R")
+        with open(self.database, "w", encoding="utf-8") as f:
+            f.write("% ls-R -- filename database for kpathsea; do not change this line.\n")
+            f.write("./:\nls-R\ntex\n\n./tex/latex/amsmath:\namsmath.sty\namsmath.dtx\n\n./tex/latex/tools:\nbm.sty\n")
+        self.original_databases = tex_packages.texmf_databases
+        tex_packages.texmf_databases = lambda: [self.database]
+
+    def tearDown(self):
+        tex_packages.texmf_databases = self.original_databases
+        shutil.rmtree(self.test_dir)
+
+    def test_parse_usepackage(self):
+        self.assertEqual(parse_usepackage(r"\usepackage{graphicx}"), ("", ["graphicx"]))
+        self.assertEqual(parse_usepackage(r"\usepackage[T1]{fontenc}"), ("[T1]", ["fontenc"]))
+        self.assertEqual(parse_usepackage(r"\usepackage[a, b]{amsmath, amssymb,bm}"), ("[a, b]", ["amsmath", "amssymb", "bm"]))
+        self.assertEqual(parse_usepackage(r"\usepackage"), ("", []))
+
+    def test_read_style_files(self):
+        self.assertEqual(read_style_files(self.database), {"amsmath", "bm"})
+
+    def test_index_lookups_are_batched_and_memoized(self):
+        index = PackageIndex(ttl=3600)
+        calls = []
+        def fake_kpsewhich(names):
+            calls.append(list(names))
+            return {"localpkg"} & set(names)
+        index._kpsewhich = fake_kpsewhich
+
+        self.assertEqual(
+            index.check_many(["amsmath", "localpkg", "missing"]),
+            {"amsmath": True, "localpkg": True, "missing": False},
+        )
+        self.assertFalse(index.is_available("missing"))
+        self.assertTrue(index.is_available("bm"))
+
+        self.assertEqual(calls, [["localpkg", "missing"]])
+        stats = index.stats()
+        self.assertEqual(stats["indexed_packages"], 2)
+        self.assertEqual(stats["index_hits"], 2)
+        self.assertEqual(stats["memo_hits"], 1)
+        self.assertEqual(stats["kpsewhich_calls"], 1)
+
+    def test_kpsewhich_calls_are_counted_across_threads(self):
+        index = PackageIndex(ttl=3600)
+        index._kpsewhich = lambda names: set()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: index.check_many([f"missing{i}"]), range(200)))
+        self.assertEqual(index.stats()["kpsewhich_calls"], 200)
+
+    def test_refresh_clears_memo(self):
+        index = PackageIndex(ttl=3600)
+        index._kpsewhich = lambda names: set()
+        index.is_available("missing")
+        index.refresh()
+        self.assertEqual(index.stats()["memoized_packages"], 0)
+        self.assertEqual(index.stats()["refreshes"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,75 @@
+import unittest
+import io
+import os
+import tempfile
+import shutil
+from unittest import mock
+from fastapi import FastAPI, UploadFile
+from fastapi.testclient import TestClient
+from backend.app.services import file_processing
+from backend.app.services.file_processing import UploadTooLargeError, save_uploads
+from backend.app.utils.request_limits import MULTIPART_OVERHEAD_BYTES, RequestSizeLimitMiddleware
+
+def make_upload(name, content):
+    return UploadFile(io.BytesIO(content), filename=name)
+
+class TestSaveUploads(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    async def test_uploads_are_saved_and_hashed(self):
+        with mock.patch.object(file_processing.config, "UPLOAD_CHUNK_SIZE", 4):
+            file_paths = await save_uploads([make_upload("a.tex", b"hello world")], None, None, self.workspace)
+
+        path = os.path.join(self.workspace, "latex_0.tex")
+        self.assertEqual(file_paths["latex"], [path])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"hello world")
+        self.assertEqual(
+            file_paths["digests"][path],
+            "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9",
+        )
+
+    async def test_file_size_limit(self):
+        with mock.patch.object(file_processing.config, "MAX_UPLOAD_FILE_BYTES", 10):
+            with self.assertRaises(UploadTooLargeError):
+                await save_uploads([make_upload("a.tex", b"x" * 11)], None, None, self.workspace)
+
+    async def test_request_size_limit(self):
+        uploads = [make_upload("a.tex", b"x" * 8), make_upload("b.tex", b"x" * 8)]
+        with mock.patch.object(file_processing.config, "MAX_UPLOAD_REQUEST_BYTES", 12):
+            with self.assertRaises(UploadTooLargeError) as raised:
+                await save_uploads(uploads, None, None, self.workspace)
+        self.assertIn("Upload is larger", str(raised.exception))
+
+class TestRequestSizeLimitMiddleware(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(RequestSizeLimitMiddleware, max_bytes=100)
+
+        @app.post("/echo")
+        async def echo(payload: dict):
+            return payload
+
+        self.client = TestClient(app)
+
+    def test_small_body_passes(self):
+        response = self.client.post("/echo", json={"a": 1})
+        self.assertEqual(response.status_code, 200)
+
+    def test_large_body_is_rejected(self):
+        body = b"x" * (100 + MULTIPART_OVERHEAD_BYTES + 1)
+        response = self.client.post("/echo", content=body, headers={"content-type": "application/json"})
+        self.assertEqual(response.status_code, 413)
+
+    def test_large_chunked_body_is_rejected(self):
+        body = b"x" * (100 + MULTIPART_OVERHEAD_BYTES + 1)
+        response = self.client.post("/echo", content=iter([body[:1000], body[1000:]]), headers={"content-type": "application/json"})
+        self.assertEqual(response.status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,42 @@
+import unittest
+import os
+import tempfile
+import shutil
+from backend.app.utils.workspace import create_workspace, release_workspace, purge_expired_workspaces
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_create_workspace_is_unique(self):
+        first = create_workspace(self.root)
+        second = create_workspace(self.root)
+        self.assertNotEqual(first, second)
+        self.assertTrue(os.path.isdir(first))
+        self.assertTrue(os.path.isdir(second))
+
+    def test_release_workspace_without_retention(self):
+        workspace = create_workspace(self.root)
+        release_workspace(workspace, retention=0)
+        self.assertFalse(os.path.exists(workspace))
+
+    def test_release_workspace_with_retention(self):
+        workspace = create_workspace(self.root)
+        release_workspace(workspace, retention=3600)
+        self.assertTrue(os.path.isdir(workspace))
+
+        self.assertEqual(purge_expired_workspaces(self.root, retention=3600), 0)
+        self.assertEqual(purge_expired_workspaces(self.root, retention=0), 1)
+        self.assertFalse(os.path.exists(workspace))
+
+    def test_purge_skips_running_jobs(self):
+        workspace = create_workspace(self.root)
+        self.assertEqual(purge_expired_workspaces(self.root, retention=0), 0)
+        self.assertTrue(os.path.isdir(workspace))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file